@@ -0,0 +1,9 @@
+"""
+Benchmarks for SevenTweets. They are not part of test suite, each module is
+executable on its own, e.g.::
+
+    python -m benchmarks.trigram_search
+
+Benchmarks that need PostgreSQL use `testing.postgresql` (listed in
+`requirements-dev.txt`), which needs PostgreSQL server binaries installed.
+"""
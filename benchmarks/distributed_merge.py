@@ -0,0 +1,53 @@
+"""
+Measures merging of distributed search results: k-way merge of sorted
+results from each node, stopping at global limit, compared to sorting all
+results together.
+"""
+import sys
+import random
+from datetime import datetime, timedelta
+from functools import partial
+from seventweets.tweet import Tweet, merge_results
+from benchmarks.utils import timeit, report
+
+NODES = [2, 10, 50]
+# number of results returned by each node
+PER_NODE = 1000
+LIMITS = [20, 1000]
+
+
+def node_results(node: int, count: int):
+    start = datetime(2017, 7, 1)
+    results = []
+    for i in range(count):
+        created = start + timedelta(seconds=random.randint(0, 10 ** 7))
+        if i % 10 == 0:
+            t = Tweet(i, None, 'retweet', created, created,
+                      f'node{random.randrange(50)}#{random.randrange(100)}')
+        else:
+            t = Tweet(i, f'tweet {i}', 'original', created, created)
+        t.origin = f'node{node}'
+        results.append(t)
+    results.sort(key=lambda t: (t.created_at, t.id), reverse=True)
+    return results
+
+
+def sort_all(streams, limit):
+    merged = [t for s in streams for t in s]
+    merged.sort(key=lambda t: (t.created_at, t.id), reverse=True)
+    return merged[:limit]
+
+
+def run(nodes):
+    for count in nodes:
+        streams = [node_results(n, PER_NODE) for n in range(count)]
+        print(f'--- {count} nodes, {PER_NODE} results each')
+        for limit in LIMITS:
+            report(f'merge_results(limit={limit})',
+                   timeit(partial(merge_results, streams, limit)))
+            report(f'sort all (limit={limit}, no dedupe)',
+                   timeit(partial(sort_all, streams, limit)))
+
+
+if __name__ == '__main__':
+    run([int(arg) for arg in sys.argv[1:]] or NODES)
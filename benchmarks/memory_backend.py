@@ -0,0 +1,89 @@
+"""
+Measures cost of single operations of in-memory backend for growing number of
+stored tweets. Cost of each operation should not grow (or grow only
+logarithmically) with number of tweets.
+"""
+import sys
+import random
+from functools import partial
+from seventweets.db.backends.memory import Storage, Operations
+from benchmarks.utils import timeit, report
+
+SIZES = [10000, 100000, 1000000]
+# number of operations per measurement, duration is reported per operation
+OPS = 1000
+
+
+def fill(count: int) -> Storage:
+    storage = Storage()
+    for i in range(count):
+        if i % 10 == 0:
+            Operations.create_retweet('other', i, storage)
+        else:
+            Operations.insert_tweet(f'tweet number {i}', storage)
+    return storage
+
+
+def get_tweets(storage, ids):
+    for id_ in ids:
+        Operations.get_tweet(id_, storage)
+
+
+def modify_tweets(storage, ids):
+    for id_ in ids:
+        Operations.modify_tweet(id_, 'modified', storage)
+
+
+def count_tweets(storage):
+    for _ in range(OPS):
+        Operations.count_tweets('retweet', storage)
+
+
+def first_pages(storage):
+    for _ in range(OPS):
+        Operations.get_all_tweets(storage, limit=20)
+
+
+def search(storage, content, mode='substring'):
+    for _ in range(OPS):
+        Operations.search_tweets(content, None, None, None, None, None,
+                                 storage, limit=20, mode=mode)
+
+
+def insert_delete(storage):
+    for _ in range(OPS):
+        tweet = Operations.insert_tweet('short lived', storage)
+        Operations.delete_tweet(tweet.id, storage)
+
+
+def delete_tweets(storage, ids):
+    for id_ in ids:
+        Operations.delete_tweet(id_, storage)
+
+
+def run(sizes):
+    for size in sizes:
+        storage = fill(size)
+        originals = [id_ for id_, t in storage.tweets.items()
+                     if t.type == 'original']
+        ids = random.sample(originals, OPS)
+        print(f'--- {size} tweets')
+        for name, fn in [
+            ('get_tweet', partial(get_tweets, storage, ids)),
+            ('modify_tweet', partial(modify_tweets, storage, ids)),
+            ('count_tweets', partial(count_tweets, storage)),
+            ('get_all_tweets(limit=20)', partial(first_pages, storage)),
+            ('insert_tweet + delete_tweet', partial(insert_delete, storage)),
+            ('search_tweets("number 4242")',
+             partial(search, storage, 'number 4242')),
+            ('search_tweets("4242", fulltext)',
+             partial(search, storage, '4242', 'fulltext')),
+        ]:
+            report(name, timeit(fn) / OPS)
+        oldest = [t.id for t in Operations.get_all_tweets(storage)[-OPS:]]
+        report('delete_tweet (oldest)',
+               timeit(partial(delete_tweets, storage, oldest), repeat=1) / OPS)
+
+
+if __name__ == '__main__':
+    run([int(arg) for arg in sys.argv[1:]] or SIZES)
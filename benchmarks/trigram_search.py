@@ -0,0 +1,42 @@
+"""
+Compares substring search on tweet content with and without trigram index
+(migration 006).
+"""
+import sys
+from functools import partial
+
+from seventweets.db.backends.pg import Operations
+from benchmarks.utils import (
+    temp_postgres, migrate, apply, load_tweets, timeit, report,
+)
+
+# id of migration that adds trigram index
+TRIGRAM_MIGRATION = 6
+
+TERMS = ['a1b2', 'number 4242', 'about f00', 'ab']
+
+
+def search(conn, term):
+    apply(conn, partial(Operations.search_tweets, term, None, None, None,
+                        None, None, limit=20))
+
+
+def run(count: int):
+    with temp_postgres() as conn:
+        migrate(conn, TRIGRAM_MIGRATION - 1)
+        load_tweets(conn, count)
+        print(f'Loaded {count} tweets.')
+
+        before = {term: timeit(partial(search, conn, term)) for term in TERMS}
+        migrate(conn, TRIGRAM_MIGRATION, TRIGRAM_MIGRATION - 1)
+        apply(conn, lambda cur: cur.execute('ANALYZE tweets;'))
+        after = {term: timeit(partial(search, conn, term)) for term in TERMS}
+
+        for term in TERMS:
+            report(f'seq scan "{term}"', before[term])
+            report(f'trigram "{term}"', after[term])
+            print(f'{"speedup":<50} {before[term] / after[term]:>12.1f} x')
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,93 @@
+import time
+import statistics
+import contextlib
+from typing import Callable, Iterator
+
+import pg8000
+
+from seventweets.migrate import MigrationManager
+
+
+def timeit(fn: Callable, repeat: int=5) -> float:
+    """
+    Executes function `repeat` times and returns median duration in
+    milliseconds.
+    """
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append((time.perf_counter() - start) * 1000)
+    return statistics.median(durations)
+
+
+def report(name: str, duration_ms: float):
+    if duration_ms < 1:
+        print(f'{name:<50} {duration_ms * 1000:>12.3f} us')
+    else:
+        print(f'{name:<50} {duration_ms:>12.3f} ms')
+
+
+@contextlib.contextmanager
+def temp_postgres() -> Iterator[pg8000.Connection]:
+    """
+    Starts temporary PostgreSQL server and yields connection to it.
+    """
+    import testing.postgresql
+
+    with testing.postgresql.Postgresql() as postgresql:
+        params = postgresql.dsn()
+        conn = pg8000.Connection(
+            user=params['user'], host=params['host'], port=params['port'],
+            database=params['database'], password=None,
+        )
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+
+def migrate(conn: pg8000.Connection, up_to: int, applied: int=0):
+    """
+    Applies all migrations with id greater then `applied` and up to `up_to`
+    (including).
+    """
+    for migration in MigrationManager.collect_migrations():
+        if applied < migration.id <= up_to:
+            apply(conn, migration.upgrade)
+
+
+def apply(conn: pg8000.Connection, fn: Callable):
+    """
+    Executes `fn` with new cursor and commits transaction.
+    """
+    cursor = conn.cursor()
+    try:
+        fn(cursor)
+        conn.commit()
+    finally:
+        cursor.close()
+
+
+def load_tweets(conn: pg8000.Connection, count: int):
+    """
+    Fills tweets table with `count` generated tweets, spread over last year,
+    one tenth of them being retweets.
+    """
+    def insert(cur):
+        cur.execute(f'''
+            INSERT INTO tweets
+                (tweet, type, reference, created_at, modified_at)
+            SELECT
+                CASE WHEN mod(i, 10) = 0 THEN NULL
+                     ELSE 'tweet number ' || i || ' about ' || md5(i::text)
+                END,
+                CASE WHEN mod(i, 10) = 0 THEN 'retweet' ELSE 'original' END,
+                CASE WHEN mod(i, 10) = 0 THEN 'other#' || i ELSE NULL END,
+                now() - (i || ' seconds')::interval * 30,
+                now() - (i || ' seconds')::interval * 15
+            FROM generate_series(1, {int(count)}) AS i;
+        ''')
+
+    apply(conn, insert)
+    apply(conn, lambda cur: cur.execute('ANALYZE tweets;'))
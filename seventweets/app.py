@@ -11,8 +11,10 @@ from seventweets.registry import unregister_all
 from seventweets.handlers.base import base
 from seventweets.handlers.tweets import tweets
 from seventweets.handlers.registration import register
-from seventweets.db import get_db
+from seventweets.handlers.utils import ensure_bool
+from seventweets.db import get_db, end_unit_of_work
 from seventweets.migrate import MigrationManager
+from seventweets.prober import Prober
 from seventweets.utils import generate_api_token
 
 
@@ -116,10 +118,21 @@ def create_app(_=None):
         for k, v in cfg.items():
             print(f'{k} = {v}')
 
+    @app.after_request
+    def finish_unit_of_work(response):
+        """
+        Commits work done by the request if it was successful, rolls it back
+        otherwise.
+        :param response: Response that is about to be sent.
+        """
+        end_unit_of_work(response.status_code < 400)
+        return response
+
     @app.teardown_appcontext
     def teardown_appcontext(e):
         """
-        Closes the database again at the end of the request.
+        Returns database connection to the pool at the end of the request.
+        Anything not committed by now is rolled back by the pool.
         """
         if hasattr(g, 'db'):
             g.db.close()
@@ -142,7 +155,7 @@ def create_app(_=None):
         which we do not have until entire app object is ready.
         """
         with app.app_context():
-            db = get_db()
+            db = get_db(scoped=False)
 
         def handler(signum, frame):
             print('in signal handler', signum)
@@ -152,6 +165,10 @@ def create_app(_=None):
         signal.signal(signal.SIGTERM, handler)
         signal.signal(signal.SIGINT, handler)
 
+        if ensure_bool(str(app.config['ST_PROBE_ENABLED'])) and \
+                not app.testing:
+            Prober(app).start()
+
     return app
 
 
@@ -0,0 +1,133 @@
+"""
+Circuit breaker for requests to other nodes.
+
+Node that keeps failing is not requested for a while, so that callers fail
+fast instead of waiting for it to time out.
+"""
+import time
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker:
+    """
+    Tracks outcome of recent calls to single node.
+
+    Breaker is closed while node works and all calls are allowed. When at
+    least `failure_rate` of last `window` calls failed, breaker opens and
+    calls are rejected for `reset_timeout` seconds. After that it is
+    half-open and single trial call is allowed: if it succeeds, breaker is
+    closed again, otherwise it is opened for another `reset_timeout`.
+
+    Node is considered to be in outage since first failed call that was not
+    followed by successful one.
+    """
+
+    def __init__(self, window: int=20, min_calls: int=5,
+                 failure_rate: float=0.5, reset_timeout: float=10.0):
+        """
+        :param window: Number of latest calls failure rate is computed from.
+        :param min_calls:
+            Minimum number of calls in window before breaker can open.
+        :param failure_rate: Fraction of failed calls that opens breaker.
+        :param reset_timeout:
+            Number of seconds breaker stays open before trial call is
+            allowed.
+        """
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.reset_timeout = reset_timeout
+        self._calls = deque(maxlen=window)  # True for failed calls
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._trial = False
+        self._failing_since = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        """
+        Returns state, moving breaker to half-open if it was open for long
+        enough. Has to be called with lock held.
+        """
+        if (self._state == OPEN and
+                time.monotonic() - self._opened_at >= self.reset_timeout):
+            self._state = HALF_OPEN
+            self._trial = False
+        return self._state
+
+    def allow(self) -> bool:
+        """
+        Checks if call can be made. Every allowed call has to be followed by
+        :meth:`success` or :meth:`failure`.
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self._failing_since = None
+            if self._state != CLOSED:
+                self._state = CLOSED
+                self._calls.clear()
+            self._calls.append(False)
+
+    def failure(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._failing_since is None:
+                self._failing_since = now
+            if self._state == HALF_OPEN:
+                self._open(now)
+                return
+            self._calls.append(True)
+            failed = sum(self._calls)
+            if (self._state == CLOSED and
+                    len(self._calls) >= self.min_calls and
+                    failed >= self.failure_rate * len(self._calls)):
+                self._open(now)
+
+    def _open(self, now: float):
+        self._state = OPEN
+        self._opened_at = now
+        self._trial = False
+
+    def outage(self) -> float:
+        """
+        Returns number of seconds node is failing for, 0 if last call
+        succeeded.
+        """
+        with self._lock:
+            if self._failing_since is None:
+                return 0.0
+            return time.monotonic() - self._failing_since
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        """
+        Returns state of breaker, number of calls in window, number of
+        failed ones and duration of outage.
+        """
+        with self._lock:
+            return {
+                'state': self._current_state(),
+                'calls': len(self._calls),
+                'failures': sum(self._calls),
+                'failing_for': (None if self._failing_since is None else
+                                round(time.monotonic() -
+                                      self._failing_since, 3)),
+            }
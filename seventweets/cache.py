@@ -0,0 +1,171 @@
+"""
+In-process caches used to avoid repeating expensive database queries and
+requests to other nodes.
+"""
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """
+    Thread-safe cache with limited size and time to live for entries.
+
+    When cache is full, least recently used entry is evicted. Expired entries
+    are not returned by :meth:`get`, but they are kept for `stale` more
+    seconds and can be read with :meth:`get_entry`, so that caller can use
+    stale value while it is being refreshed.
+
+    Number of hits and misses is counted, see :meth:`stats`.
+    """
+    _MISSING = object()
+
+    def __init__(self, maxsize: int=1024, ttl: float=60.0, stale: float=0.0):
+        """
+        :param maxsize: Maximum number of entries in cache.
+        :param ttl: Default time to live of entries in seconds.
+        :param stale:
+            Number of seconds expired entries are still kept for, as stale.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale = stale
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def _lookup(self, key: Hashable):
+        """
+        Returns entry for key, if it is fresh or stale, removing it if it is
+        too old. Has to be called with lock held.
+        """
+        entry = self._data.get(key, self._MISSING)
+        if entry is self._MISSING:
+            return None
+        if entry[0] + self.stale <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return entry
+
+    def get(self, key: Hashable, default: Any=None) -> Any:
+        """
+        Returns cached value for key, or default if there is no valid
+        entry for it.
+        """
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None or entry[0] <= time.monotonic():
+                self.misses += 1
+                return default
+            self.hits += 1
+            return entry[1]
+
+    def get_entry(self, key: Hashable) -> Optional[Tuple[Any, bool]]:
+        """
+        Returns cached value for key together with flag indicating if it is
+        still fresh. Stale values are returned as well.
+
+        :return: Tuple (value, fresh) or None if there is no entry for key.
+        """
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            fresh = entry[0] > time.monotonic()
+            if fresh:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+            return entry[1], fresh
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float]=None):
+        """
+        Stores value in cache.
+
+        :param key: Key to store value under.
+        :param value: Value to store.
+        :param ttl: Time to live in seconds, cache default if not provided.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> bool:
+        """
+        Removes entry from cache.
+
+        :return: Flag indicating if entry existed.
+        """
+        with self._lock:
+            return self._data.pop(key, self._MISSING) is not self._MISSING
+
+    def clear(self):
+        """
+        Removes all entries from cache.
+        """
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns size of cache and number of hits and misses.
+        """
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+        }
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with same key, so that function is executed
+    only once at a time for each key and all concurrent callers get its
+    result (or exception).
+    """
+
+    def __init__(self):
+        self._calls = {}  # key -> Future
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        Calls function, unless call with same key is already in progress, in
+        which case its result is waited for and returned.
+
+        :param key: Key identifying call.
+        :param fn: Function to call, without arguments.
+        :return: Result of function.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
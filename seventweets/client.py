@@ -3,12 +3,72 @@ SevenTweets HTTP client implementation.
 """
 
 import copy
+import time
+import threading
 import requests
 from datetime import datetime
 from requests.adapters import HTTPAdapter
-from requests.packages.urllib3.util.retry import Retry
-from requests.exceptions import RetryError, ConnectionError, ConnectTimeout
-from seventweets import exceptions
+from requests.exceptions import (
+    ConnectionError, ConnectTimeout, ReadTimeout, RequestException,
+)
+from seventweets import config, exceptions
+
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+# Names of nodes that did not respond in time or failed during distributed
+# search, comma separated.
+NODES_TIMED_OUT_HEADER = 'X-Nodes-Timed-Out'
+NODES_FAILED_HEADER = 'X-Nodes-Failed'
+
+_session = None
+_adapter = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    Returns process wide session used for all requests to other nodes,
+    creating it on first use.
+
+    Session keeps connections to each node open between requests, in
+    separate pool for each node. At most ST_HTTP_POOL_HOSTS pools are kept,
+    each with at most ST_HTTP_POOL_SIZE idle connections.
+    """
+    global _session, _adapter
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                # requests are not retried, failing nodes are handled by
+                # circuit breaker of each client instead
+                _adapter = HTTPAdapter(
+                    pool_connections=int(config.ST_HTTP_POOL_HOSTS),
+                    pool_maxsize=int(config.ST_HTTP_POOL_SIZE),
+                )
+                session = requests.Session()
+                session.mount('http://', _adapter)
+                session.mount('https://', _adapter)
+                _session = session
+    return _session
+
+
+def pool_stats() -> dict:
+    """
+    Returns number of hosts with open connection pool, number of
+    connections opened and requests sent through them, and number of idle
+    connections ready to be reused.
+    """
+    stats = {'hosts': 0, 'connections': 0, 'requests': 0, 'idle': 0}
+    if _adapter is None:
+        return stats
+    pools = _adapter.poolmanager.pools
+    for key in pools.keys():
+        pool = pools.get(key)
+        if pool is None:
+            continue
+        stats['hosts'] += 1
+        stats['connections'] += pool.num_connections
+        stats['requests'] += pool.num_requests
+        stats['idle'] += pool.pool.qsize() if pool.pool else 0
+    return stats
 
 
 class Client:
@@ -27,9 +87,39 @@ class Client:
         503: exceptions.ServiceUnavailable,
     }
 
-    def __init__(self, address, default_headers=None, cleanup_callback=None):
+    # Responses that mean node is not able to serve requests at the moment.
+    _unavailable = (502, 503, 504)
+
+    def __init__(self, address, default_headers=None, cleanup_callback=None,
+                 timeout=None, connect_timeout=None, breaker=None,
+                 remove_after=None):
+        """
+        :param address: Address of remote node.
+        :param default_headers: Headers to include in each request.
+        :param cleanup_callback:
+            Called when remote node is unreachable. If `breaker` is provided,
+            it is called only when node is failing for `remove_after`
+            seconds.
+        :param timeout:
+            Number of seconds to wait for remote node to respond, no limit if
+            not provided.
+        :param connect_timeout:
+            Number of seconds to wait for connection to remote node, same as
+            `timeout` if not provided.
+        :param breaker:
+            :class:`~seventweets.breaker.CircuitBreaker` of remote node.
+            While it is open, requests fail without being sent.
+        :param remove_after:
+            Number of seconds node has to be failing before cleanup callback
+            is called.
+        """
         self.address = address
-        self._session = None
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.breaker = breaker
+        # cleared when node turns out not to support multi-get of tweets
+        self._multi_get = True
+        self.remove_after = remove_after or 0
         self.default_headers = default_headers or {
             'Content-Type': 'application/json'
         }
@@ -38,16 +128,19 @@ class Client:
     @property
     def session(self):
         """
-        Returns session for maintaining open connections to servers.
+        Returns session for maintaining open connections to servers. It is
+        shared by all clients, see :func:`get_session`.
         """
-        if not hasattr(self, '_session') or not self._session:
-            self._session = requests.session()
-            # sane defaults for retry policy
-            retries = Retry(total=3, backoff_factor=1,
-                            status_forcelist=[502, 503, 504])
-            self._session.mount('http://', HTTPAdapter(max_retries=retries))
-            self._session.mount('https://', HTTPAdapter(max_retries=retries))
-        return self._session
+        return get_session()
+
+    @property
+    def timeouts(self):
+        """
+        Returns timeouts for requests, as expected by `requests`.
+        """
+        if self.connect_timeout is None:
+            return self.timeout
+        return self.connect_timeout, self.timeout
 
     def _request(self, method, path, params=None, data=None, headers=None):
         """
@@ -65,24 +158,90 @@ class Client:
         :return: Response body returned from server.
         :raises: HttpException subclass, if response status code is not valid.
         """
+        resp = self._send(method, path, params, data, headers)
+        # check if there's a body
+        if resp.status_code != 204:
+            return resp.json()
+
+    def _send(self, method, path, params=None, data=None, headers=None,
+              force=False):
+        """
+        Sends request and checks response for errors. Parameters are same as
+        for :meth:`_request`, except `force`, which sends request even if
+        circuit breaker is open.
+
+        :return: Response received from server.
+        :raises: HttpException subclass, if response status code is not valid.
+        """
         all_headers = copy.copy(self.default_headers)
         all_headers.update(headers or {})
         url = '{}{}'.format(self.address, path)
+        if (self.breaker is not None and not force and
+                not self.breaker.allow()):
+            raise exceptions.BadGateway(
+                'The node you provided is unavailable.'
+            )
         try:
             resp = self.session.request(
-                method, url, params=params, json=data, headers=all_headers
+                method, url, params=params, json=data, headers=all_headers,
+                timeout=self.timeouts,
             )
-
-            self._raise(resp)
-            # check if there's a body
-            if resp.status_code != 204:
-                return resp.json()
-
-        except (RetryError, ConnectionError, ConnectTimeout):
-            self.cleanup_callback()
+        except ReadTimeout:
+            # node is reachable, but slow, so it is not cleaned up
+            self._failed(cleanup=False)
+            raise exceptions.BadGateway(
+                'The node you provided did not respond in time.'
+            )
+        except (ConnectionError, ConnectTimeout):
+            self._failed()
             raise exceptions.BadGateway(
                 'The node you provided is unreachable.'
             )
+        except RequestException:
+            # e.g. node closed connection while sending response
+            self._failed(cleanup=False)
+            raise exceptions.BadGateway(
+                'The node you provided sent invalid response.'
+            )
+        if resp.status_code in self._unavailable:
+            self._failed(cleanup=False)
+        elif self.breaker is not None:
+            self.breaker.success()
+        self._raise(resp)
+        return resp
+
+    def _failed(self, cleanup=True):
+        """
+        Records failed request in circuit breaker and calls cleanup callback
+        if node is unreachable for long enough.
+
+        :param cleanup: Flag indicating if failure can lead to cleanup.
+        """
+        if self.breaker is not None:
+            self.breaker.failure()
+            cleanup = (cleanup and
+                       self.breaker.outage() >= self.remove_after)
+        if cleanup and self.cleanup_callback is not None:
+            self.cleanup_callback()
+
+    def _pages(self, path, params, page_size):
+        """
+        Walks through all pages of paginated endpoint, following cursor
+        returned in `X-Next-Cursor` header.
+
+        :param path: Path of paginated endpoint.
+        :param params: Query parameters to include in each request.
+        :param page_size: Number of items to request per page.
+        :return: Generator of items from all pages.
+        """
+        params = dict(params, limit=page_size)
+        while True:
+            resp = self._send('GET', path, params=params)
+            yield from resp.json()
+            next_cursor = resp.headers.get(NEXT_CURSOR_HEADER)
+            if not next_cursor:
+                return
+            params['cursor'] = next_cursor
 
     def _raise(self, response):
         """
@@ -97,6 +256,21 @@ class Client:
         if exc is not None:
             raise exc(response)
 
+    def ping(self):
+        """
+        Checks that remote node responds, even if its circuit breaker is
+        open. Successful ping closes the breaker.
+
+        :return: Number of seconds remote node took to respond.
+        """
+        start = time.monotonic()
+        try:
+            self._send('GET', '/health', force=True)
+        except exceptions.NotFound:
+            # node does not have health endpoint, but it did respond
+            pass
+        return time.monotonic() - start
+
     def register(self, data, force_update=False):
         return self._request('POST', '/registry/', data=data,
                              params={'force': force_update})
@@ -115,6 +289,36 @@ class Client:
     def create_tweet(self, tweet):
         self._request('POST', '/tweets', data={'tweet': tweet})
 
+    def create_tweets(self, tweets, batch_size: int=1000):
+        """
+        Creates multiple tweets and retweets on remote node, sending
+        `batch_size` of them with single request.
+
+        :param tweets:
+            Tweets to create. Each is either tweet content or dictionary with
+            "tweet" key, for original tweets, or "server" and "id" keys, for
+            retweets.
+        :param batch_size: Number of tweets to send with single request.
+        :return: Result for each tweet, in same order as provided.
+        """
+        items = [{'tweet': t} if isinstance(t, str) else t for t in tweets]
+        results = []
+        for start in range(0, len(items), batch_size):
+            resp = self._request('POST', '/tweets/batch',
+                                 data=items[start:start + batch_size])
+            results.extend(resp['results'])
+        return results
+
+    def invalidate(self, server, tweet_ids):
+        """
+        Notifies remote node that tweets on `server` were changed or deleted.
+
+        :param server: Name of node holding changed tweets.
+        :param tweet_ids: IDs of changed tweets.
+        """
+        self._request('POST', '/tweets/invalidate',
+                      data={'server': server, 'ids': list(tweet_ids)})
+
     def create_retweet(self, name, tweet_id):
         self._request('POST', '/retweet',
                       data={'name': name, 'id': tweet_id})
@@ -122,26 +326,120 @@ class Client:
     def get_tweet(self, tweet_id):
         return self._request('GET', '/tweets/{}'.format(tweet_id))
 
-    def get_tweets(self):
-        return self._request('GET', '/tweets')
+    def get_tweets_by_ids(self, ids, batch_size: int=500):
+        """
+        Returns tweets with provided IDs from remote node, fetching
+        `batch_size` of them with single request.
 
-    def search(self, content: str=None,
-               from_created: datetime=None,
-               to_created: datetime=None,
-               from_modified: datetime=None,
-               to_modified: datetime=None,
-               retweet: bool=None,
-               all: bool=False):
-        return self._request('GET', '/tweets/search', params={
+        :param ids: IDs of tweets to get.
+        :param batch_size: Number of tweets to request with single request.
+        :return:
+            Tuple of list of found tweets and list of IDs that were not found.
+        """
+        ids = list(ids)
+        found, missing = [], []
+        for start in range(0, len(ids), batch_size):
+            if not self._multi_get:
+                self._get_one_by_one(ids[start:], found, missing)
+                break
+            batch = ids[start:start + batch_size]
+            # limit keeps reply small if node ignores "ids"
+            resp = self._request('GET', '/tweets', params={
+                'ids': ','.join(str(i) for i in batch),
+                'limit': len(batch),
+            })
+            if isinstance(resp, list):
+                # node does not support multi-get and ignored "ids", so its
+                # reply is not what was asked for
+                self._multi_get = False
+                self._get_one_by_one(ids[start:], found, missing)
+                break
+            found.extend(resp['tweets'])
+            missing.extend(resp['missing'])
+        return found, missing
+
+    def _get_one_by_one(self, ids, found, missing):
+        """
+        Gets tweets with single request for each of them, for nodes that do
+        not support multi-get.
+
+        :param ids: IDs of tweets to get.
+        :param found: List found tweets are appended to.
+        :param missing: List IDs of tweets that were not found are appended
+            to.
+        """
+        for id_ in ids:
+            try:
+                found.append(self.get_tweet(id_))
+            except exceptions.NotFound:
+                missing.append(id_)
+
+    def get_tweets(self, limit: int=None, cursor: str=None):
+        return self._request('GET', '/tweets', params={
+            'limit': limit or '',
+            'cursor': cursor or '',
+        })
+
+    def iter_tweets(self, page_size: int=100):
+        """
+        Returns generator of all tweets on remote node, fetched page by page.
+
+        :param page_size: Number of tweets to fetch with single request.
+        """
+        return self._pages('/tweets', {}, page_size)
+
+    @staticmethod
+    def _search_params(content, from_created, to_created, from_modified,
+                       to_modified, retweet, all):
+        return {
             'content': content if content else '',
             'created_from': from_created.timestamp() if from_created else '',
             'created_to': to_created.timestamp() if to_created else '',
             'modified_from': (from_modified.timestamp()
                               if from_modified else ''),
-            'modified_to': to_modified.time() if to_modified else '',
-            'retweet': 'true' if retweet else 'false',
+            'modified_to': to_modified.timestamp() if to_modified else '',
+            'retweets': '' if retweet is None else str(retweet).lower(),
             'all': 'true' if all else 'false',
+        }
+
+    def search(self, content: str=None,
+               from_created: datetime=None,
+               to_created: datetime=None,
+               from_modified: datetime=None,
+               to_modified: datetime=None,
+               retweet: bool=None,
+               all: bool=False,
+               limit: int=None,
+               cursor: str=None,
+               mode: str=None,
+               order: str=None):
+        params = self._search_params(content, from_created, to_created,
+                                     from_modified, to_modified, retweet, all)
+        params.update({
+            'limit': limit or '',
+            'cursor': cursor or '',
+            'mode': mode or '',
+            'order': order or '',
         })
+        return self._request('GET', '/tweets/search', params=params)
+
+    def iter_search(self, content: str=None,
+                    from_created: datetime=None,
+                    to_created: datetime=None,
+                    from_modified: datetime=None,
+                    to_modified: datetime=None,
+                    retweet: bool=None,
+                    page_size: int=100):
+        """
+        Returns generator of all search results on remote node, fetched page
+        by page. Only remote node itself is searched.
+
+        :param page_size: Number of tweets to fetch with single request.
+        """
+        params = self._search_params(content, from_created, to_created,
+                                     from_modified, to_modified, retweet,
+                                     False)
+        return self._pages('/tweets/search', params, page_size)
 
     def search_me(self, params):
         return self._request('GET', '/search_me', params=params)
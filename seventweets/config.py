@@ -9,6 +9,111 @@ ST_OWN_NAME = None
 ST_OWN_ADDRESS = None
 ST_API_TOKEN = None
 
+# Database connection pool settings. Sizes are per process, timeouts are in
+# seconds.
+ST_DB_POOL_MIN = 1
+ST_DB_POOL_MAX = 10
+ST_DB_POOL_TIMEOUT = 30
+ST_DB_POOL_RECYCLE = 3600
+ST_DB_POOL_PING_AFTER = 30
+
+# Number of tweets read from database at once when streaming responses.
+ST_STREAM_CHUNK_SIZE = 500
+
+# Number of seconds tweet counts on index page are cached for. If
+# ST_STATS_APPROXIMATE is true, counts are estimated from database statistics
+# instead of counting all tweets.
+ST_STATS_TTL = 5
+ST_STATS_APPROXIMATE = False
+
+# Maximum number of tweets that can be created or fetched with single batch
+# request.
+ST_BATCH_MAX_SIZE = 10000
+
+# Connections to other nodes are kept open and reused. Pools are kept for at
+# most HTTP_POOL_HOSTS nodes, each with at most HTTP_POOL_SIZE connections.
+ST_HTTP_POOL_HOSTS = 64
+ST_HTTP_POOL_SIZE = 10
+
+# Number of seconds nodes are cached in process before they are loaded from
+# database again, to pick up changes done by other processes.
+ST_REGISTRY_REFRESH = 30
+
+# Requests to other nodes are sent from shared pool of threads. Pool has
+# WORKERS_PER_NODE threads for each registered node, but at least
+# MIN_WORKERS and at most MAX_WORKERS. Single node has NODE_CONNECT_TIMEOUT
+# seconds to accept connection and NODE_TIMEOUT seconds to respond, and
+# request sent to all nodes waits for them at most FANOUT_TIMEOUT seconds in
+# total, after which partial results are returned.
+ST_FANOUT_MIN_WORKERS = 4
+ST_FANOUT_MAX_WORKERS = 64
+ST_FANOUT_WORKERS_PER_NODE = 2
+ST_NODE_TIMEOUT = 3
+ST_NODE_CONNECT_TIMEOUT = 1
+ST_FANOUT_TIMEOUT = 5
+
+# Maximum number of seconds spent unregistering from other nodes when
+# shutting down. It should be shorter than graceful timeout of the server.
+ST_LEAVE_TIMEOUT = 10
+
+# Circuit breaker of each node opens when at least BREAKER_FAILURE_RATE of
+# its last BREAKER_WINDOW requests failed (once there are BREAKER_MIN_CALLS
+# of them). While it is open, requests to node fail immediately. After
+# BREAKER_RESET_TIMEOUT seconds single trial request is sent, which closes
+# breaker if it succeeds. Node is removed from registry when it is
+# unreachable after failing for NODE_REMOVE_AFTER seconds.
+ST_BREAKER_WINDOW = 20
+ST_BREAKER_MIN_CALLS = 5
+ST_BREAKER_FAILURE_RATE = 0.5
+ST_BREAKER_RESET_TIMEOUT = 10
+ST_NODE_REMOVE_AFTER = 300
+
+# Health of other nodes is checked in background, by single worker of all
+# sharing same PROBE_LOCK_FILE. Node is probed every PROBE_MIN_INTERVAL
+# seconds, and interval doubles with each successful probe up to
+# PROBE_MAX_INTERVAL. Intervals are randomized by +-PROBE_JITTER fraction.
+# Latency is tracked as moving average, with PROBE_EWMA_ALPHA weight of
+# latest probe. Node whose last PROBE_UNHEALTHY_AFTER probes failed is not
+# sent requests until it responds to probe again.
+ST_PROBE_ENABLED = True
+ST_PROBE_LOCK_FILE = '/tmp/seventweets-prober.lock'
+ST_PROBE_MIN_INTERVAL = 5
+ST_PROBE_MAX_INTERVAL = 60
+ST_PROBE_JITTER = 0.2
+ST_PROBE_TIMEOUT = 2
+ST_PROBE_EWMA_ALPHA = 0.3
+ST_PROBE_UNHEALTHY_AFTER = 2
+
+# Hedged requests: node that did not respond within PERCENTILE of its last
+# HISTORY response times (once at least MIN_SAMPLES are known) is sent same
+# request again. Number of hedged requests is limited to BUDGET fraction of
+# all requests, with at most BURST of them at once. Set BUDGET to 0 to
+# disable hedging.
+ST_HEDGE_PERCENTILE = 95
+ST_HEDGE_HISTORY = 100
+ST_HEDGE_MIN_SAMPLES = 20
+ST_HEDGE_BUDGET = 0.1
+ST_HEDGE_BURST = 10
+
+# Maximum number of seconds a request waits for original tweets of retweets
+# from other nodes. Retweets not resolved in time are returned without
+# content.
+ST_HYDRATE_TIMEOUT = 2
+
+# Cache of original tweets from other nodes. Entries are fresh for TTL
+# seconds, after that they are used for STALE more seconds while they are
+# refreshed in background. Tweets that were not found are cached for
+# NEGATIVE_TTL seconds.
+ST_ORIGINALS_CACHE_SIZE = 10000
+ST_ORIGINALS_CACHE_TTL = 60
+ST_ORIGINALS_CACHE_STALE = 300
+ST_ORIGINALS_NEGATIVE_TTL = 30
+
+# Cache of distributed search results: maximum number of cached searches and
+# number of seconds they are cached for.
+ST_SEARCH_CACHE_SIZE = 256
+ST_SEARCH_CACHE_TTL = 10
+
 
 # Set module level config variables by loading them from environment.
 for name in list(globals().keys()):
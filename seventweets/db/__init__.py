@@ -6,21 +6,42 @@ from seventweets import config
 
 import flask
 from datetime import datetime
-from typing import TypeVar, Tuple, Iterable, Optional
+from typing import (
+    TypeVar, Tuple, Iterable, Iterator, Optional, Dict, List, Callable,
+)
 
 # type for type hinting
 _T = TypeVar('_T')
 TwResp = Tuple[int, str, str, datetime, datetime, str]
-NdResp = Tuple[str, str, datetime]
+NdResp = Tuple[str, str, datetime, Optional[float], int]
+# position in tweet list used for keyset pagination: (created_at, id)
+Keyset = Tuple[datetime, int]
+# new tweet for bulk insert: (type, tweet, reference)
+NewTweet = Tuple[str, Optional[str], Optional[str]]
+# result of probing node: (name, latency), latency is None if probe failed
+NodeCheck = Tuple[str, Optional[float]]
 
 
 logger = logging.getLogger(__name__)
 
 
+# Supported ways of matching content when searching tweets. Substring search
+# matches any part of tweet, case insensitive. Full text search matches whole
+# words and can order results by relevance.
+SEARCH_SUBSTRING = 'substring'
+SEARCH_FULLTEXT = 'fulltext'
+SEARCH_MODES = (SEARCH_SUBSTRING, SEARCH_FULLTEXT)
+
+# Supported orderings of search results. Ordering by relevance is possible
+# only for full text search.
+ORDER_CREATED = 'created'
+ORDER_RELEVANCE = 'relevance'
+SEARCH_ORDERS = (ORDER_CREATED, ORDER_RELEVANCE)
+
 # This is order in which columns will be selected from database.
 # Tweet and Node models will be interested in this order to read it properly.
 TWEET_COLUMN_ORDER = 'id, tweet, type, created_at, modified_at, reference'
-NODE_COLUMN_ORDER = 'name, address, last_checked_at'
+NODE_COLUMN_ORDER = 'name, address, last_checked_at, latency, failures'
 
 
 class Operations(metaclass=abc.ABCMeta):
@@ -31,15 +52,34 @@ class Operations(metaclass=abc.ABCMeta):
 
     @staticmethod
     @abc.abstractmethod
-    def get_all_tweets(cursor):
+    def get_all_tweets(cursor, limit: Optional[int]=None,
+                       after: Optional[Keyset]=None):
         """
-        Returns all tweets from database.
+        Returns all tweets from database, newest first.
 
         :param cursor: Database cursor.
+        :param limit: Maximum number of tweets to return.
+        :param after:
+            Keyset (created_at, id) of last tweet from previous page. Only
+            tweets that come after it are returned.
         :return: All tweets from database.
         """
         raise NotImplementedError()
 
+    @staticmethod
+    @abc.abstractmethod
+    def iter_tweets(chunk_size: int, cursor) -> Iterator[TwResp]:
+        """
+        Lazily iterates over all tweets from database, newest first. Tweets
+        are read from database in chunks, so only `chunk_size` of them are in
+        memory at any time.
+
+        :param chunk_size: Number of tweets to read from database at once.
+        :param cursor: Database cursor.
+        :return: Generator of all tweets from database.
+        """
+        raise NotImplementedError()
+
     @staticmethod
     @abc.abstractmethod
     def get_tweet(id_: int, cursor):
@@ -52,6 +92,18 @@ class Operations(metaclass=abc.ABCMeta):
         """
         raise NotImplementedError()
 
+    @staticmethod
+    @abc.abstractmethod
+    def get_tweets(ids: List[int], cursor) -> List[TwResp]:
+        """
+        Returns multiple tweets from database with single query.
+
+        :param ids: IDs of tweets to get.
+        :param cursor: Database cursor.
+        :return: Tweets that were found, in no particular order.
+        """
+        raise NotImplementedError()
+
     @staticmethod
     @abc.abstractmethod
     def insert_tweet(tweet: str, cursor):
@@ -64,6 +116,20 @@ class Operations(metaclass=abc.ABCMeta):
         """
         raise NotImplementedError()
 
+    @staticmethod
+    @abc.abstractmethod
+    def insert_tweets(tweets: List[NewTweet], cursor) -> List[TwResp]:
+        """
+        Inserts multiple tweets at once. Both original tweets and retweets
+        can be inserted, original tweets have no reference and retweets have
+        no content.
+
+        :param tweets: Tweets to insert as (type, tweet, reference) tuples.
+        :param cursor: Database cursor.
+        :return: Created tweets, in same order as provided.
+        """
+        raise NotImplementedError()
+
     @staticmethod
     @abc.abstractmethod
     def modify_tweet(id_: int, new_content: str, cursor) -> TwResp:
@@ -114,7 +180,11 @@ class Operations(metaclass=abc.ABCMeta):
                       from_modified: Optional[datetime],
                       to_modified: Optional[datetime],
                       retweet: Optional[bool],
-                      cursor) -> Iterable[TwResp]:
+                      cursor,
+                      limit: Optional[int]=None,
+                      after: Optional[Keyset]=None,
+                      mode: str=SEARCH_SUBSTRING,
+                      order: str=ORDER_CREATED) -> Iterable[TwResp]:
         """
         :param content: Content to search in tweet.
         :param from_created: Start time for tweet creation.
@@ -126,6 +196,14 @@ class Operations(metaclass=abc.ABCMeta):
         :param retweet:
             Flag indication if retweet or original tweets should be searched.
         :param cursor: Database cursor.
+        :param limit: Maximum number of tweets to return.
+        :param after:
+            Keyset (created_at, id) of last tweet from previous page. Only
+            tweets that come after it are returned.
+        :param mode: How content is matched, one of `SEARCH_MODES`.
+        :param order:
+            How results are ordered, one of `SEARCH_ORDERS`. Keyset
+            pagination is not possible when ordering by relevance.
         """
         raise NotImplementedError()
 
@@ -140,6 +218,32 @@ class Operations(metaclass=abc.ABCMeta):
         """
         raise NotImplementedError()
 
+    @staticmethod
+    @abc.abstractmethod
+    def count_tweets_by_type(cursor) -> Dict[str, int]:
+        """
+        Returns number of tweets of each type, counted in single query.
+
+        :param cursor: Database cursor.
+        :return: Dictionary mapping tweet type to number of tweets.
+        """
+        raise NotImplementedError()
+
+    @staticmethod
+    @abc.abstractmethod
+    def estimate_tweets_by_type(cursor) -> Optional[Dict[str, int]]:
+        """
+        Returns estimated number of tweets of each type. Unlike
+        :meth:`count_tweets_by_type`, this does not depend on number of
+        tweets, but result is approximate.
+
+        :param cursor: Database cursor.
+        :return:
+            Dictionary mapping tweet type to estimated number of tweets, or
+            None if estimate is not available.
+        """
+        raise NotImplementedError()
+
     ################################################
     # Node related methods
     ################################################
@@ -166,6 +270,18 @@ class Operations(metaclass=abc.ABCMeta):
         """
         raise NotImplementedError()
 
+    @staticmethod
+    @abc.abstractmethod
+    def insert_nodes(nodes: List[Tuple[str, str]], cursor) -> List[NdResp]:
+        """
+        Inserts multiple nodes at once.
+
+        :param nodes: Nodes to insert as (name, address) tuples.
+        :param cursor: Database cursor.
+        :return: Nodes that were inserted.
+        """
+        raise NotImplementedError()
+
     @staticmethod
     @abc.abstractmethod
     def get_node(name: str, cursor) -> NdResp:
@@ -203,6 +319,24 @@ class Operations(metaclass=abc.ABCMeta):
         """
         raise NotImplementedError()
 
+    @staticmethod
+    @abc.abstractmethod
+    def update_nodes_health(checks: List[NodeCheck], alpha: float,
+                            cursor) -> List[NdResp]:
+        """
+        Records results of probing multiple nodes at once. Each checked node
+        gets `last_checked_at` set to current time. Successful probe updates
+        moving average of latency and resets number of failures, failed
+        probe increments it.
+
+        :param checks: Results of probes as (name, latency) tuples.
+        :param alpha:
+            Weight of new latency in moving average, between 0 and 1.
+        :param cursor: Database cursor.
+        :return: Updated nodes. Nodes that were not found are skipped.
+        """
+        raise NotImplementedError()
+
     @staticmethod
     @abc.abstractmethod
     def delete_all_nodes(cursor) -> bool:
@@ -221,12 +355,64 @@ class Operations(metaclass=abc.ABCMeta):
 default_backend = os.getenv('ST_DB_BACKEND', 'pg')
 
 
-def get_db(backend=default_backend):
+def get_db(backend=default_backend, scoped=True):
     """Opens a new database connection if there is none yet for the
     current application context.
+
+    Connection is stored in `flask.g`, so all calls during single request
+    share it and all work is done as single unit of work (transaction). It is
+    committed or rolled back and released at the end of the request.
+
+    :param backend: Name of database backend to use.
+    :param scoped:
+        If False, new handle that commits after each operation and is not
+        bound to the request is returned. Useful for long reads that should
+        not hold request transaction open. Caller is responsible for closing
+        it.
     """
     backend_module = import_module(f'seventweets.db.backends.{backend}')
-    return backend_module.Database()
+    if not scoped or not flask.has_app_context():
+        return backend_module.Database()
+    if 'db' not in flask.g:
+        flask.g.db = backend_module.Database(unit_of_work=True)
+    return flask.g.db
+
+
+def after_commit(fn: Callable[[], None]):
+    """
+    Calls function once unit of work of current application context is
+    committed, so that it sees committed changes. Function is not called if
+    work is rolled back. If there is no unit of work, it is called right
+    away.
+
+    :param fn: Function to call, without arguments.
+    """
+    if flask.has_app_context() and 'db' in flask.g:
+        flask.g.setdefault('after_commit', []).append(fn)
+    else:
+        fn()
+
+
+def end_unit_of_work(commit: bool):
+    """
+    Commits or rolls back unit of work of current application context, if
+    there is one. After commit, functions registered with
+    :func:`after_commit` are called.
+
+    :param commit: Flag indicating if work should be committed.
+    """
+    callbacks = flask.g.pop('after_commit', [])
+    if 'db' not in flask.g:
+        return
+    if not commit:
+        flask.g.db.rollback()
+        return
+    flask.g.db.commit()
+    for fn in callbacks:
+        try:
+            fn()
+        except Exception:
+            logger.exception('Function called after commit failed.')
 
 
 def get_ops(backend=default_backend) -> Operations:
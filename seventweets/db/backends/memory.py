@@ -1,14 +1,20 @@
+import re
+import bisect
 import logging
 from datetime import datetime
-from collections import namedtuple
-from typing import Iterable, Optional, List, Dict
+from collections import namedtuple, Counter, defaultdict
+from typing import (
+    Iterable, Iterator, Optional, List, Dict, Set, Callable, Tuple,
+)
 
 import itertools
 
 from seventweets import db
+from seventweets.utils import RWLock
 from seventweets.db import (
-    TwResp, NdResp,
+    TwResp, NdResp, Keyset, NewTweet, NodeCheck,
     TWEET_COLUMN_ORDER, NODE_COLUMN_ORDER,
+    SEARCH_SUBSTRING, SEARCH_FULLTEXT, ORDER_CREATED, ORDER_RELEVANCE,
 )
 
 logger = logging.getLogger(__name__)
@@ -17,15 +23,325 @@ Tweet = namedtuple('Tweet', TWEET_COLUMN_ORDER)
 Node = namedtuple('Node', NODE_COLUMN_ORDER)
 
 
-class Database:
+class SortedIndex:
     """
-    In-memory storage for :class:`Operations`.
+    Sorted collection of unique keys.
+
+    Keys are split into chunks of limited size, with separate list of maximum
+    key of each chunk (same idea as in `sortedcontainers.SortedList`). Finding
+    a key is binary search over chunk maximums and then inside of a chunk,
+    while insertion and removal copy at most one chunk worth of keys, so
+    cost of all operations is practically independent of number of keys.
+
+    Index is copy-on-write: published chunks are never modified, changes
+    replace them with new ones. Iteration works on the state index had when
+    it started, so it is not affected by concurrent changes and does not need
+    any locking. Changes themselves have to be serialized by the caller.
     """
+    LOAD = 1000
 
     def __init__(self):
-        self.tweets = list()  # type: List[Tweet]
+        # chunks, maximum of each chunk and total number of keys
+        self._state = ([], [], 0)
+
+    def __len__(self):
+        return self._state[2]
+
+    def add(self, key):
+        """
+        Adds key to the index.
+        """
+        chunks, maxes, length = self._state
+        if not chunks:
+            self._state = ([[key]], [key], 1)
+            return
+
+        i = bisect.bisect_left(maxes, key)
+        if i == len(maxes):
+            # new maximum, which is the common case for keys based on time
+            i -= 1
+            chunk = chunks[i] + [key]
+        else:
+            chunk = list(chunks[i])
+            bisect.insort(chunk, key)
+
+        chunks = list(chunks)
+        maxes = list(maxes)
+        if len(chunk) > 2 * self.LOAD:
+            chunks[i:i + 1] = [chunk[:self.LOAD], chunk[self.LOAD:]]
+            maxes[i:i + 1] = [chunk[self.LOAD - 1], chunk[-1]]
+        else:
+            chunks[i] = chunk
+            maxes[i] = chunk[-1]
+        self._state = (chunks, maxes, length + 1)
+
+    def remove(self, key):
+        """
+        Removes key from the index.
+
+        :raises KeyError: If key is not in the index.
+        """
+        chunks, maxes, length = self._state
+        i = bisect.bisect_left(maxes, key)
+        if i == len(maxes):
+            raise KeyError(key)
+        chunk = chunks[i]
+        j = bisect.bisect_left(chunk, key)
+        if j == len(chunk) or chunk[j] != key:
+            raise KeyError(key)
+
+        chunk = chunk[:j] + chunk[j + 1:]
+        chunks = list(chunks)
+        maxes = list(maxes)
+        if chunk:
+            chunks[i] = chunk
+            maxes[i] = chunk[-1]
+        else:
+            del chunks[i]
+            del maxes[i]
+        self._state = (chunks, maxes, length - 1)
+
+    def descending(self, lo=None, hi=None) -> Iterator:
+        """
+        Iterates over keys from the largest to the smallest, limited to keys
+        that are greater or equal to `lo` and less then `hi`. Iterated keys
+        are snapshot taken when this method is called.
+
+        :param lo: Lower bound (inclusive), no bound if None.
+        :param hi: Upper bound (exclusive), no bound if None.
+        :return: Generator of keys.
+        """
+        chunks, maxes, _ = self._state
+        return self._descending(chunks, maxes, lo, hi)
+
+    @staticmethod
+    def _descending(chunks, maxes, lo, hi):
+        if not chunks:
+            return
+        i = len(chunks) - 1
+        j = len(chunks[i])
+        if hi is not None:
+            i = bisect.bisect_left(maxes, hi)
+            if i == len(maxes):
+                i -= 1
+                j = len(chunks[i])
+            else:
+                j = bisect.bisect_left(chunks[i], hi)
+
+        while i >= 0:
+            chunk = chunks[i]
+            for pos in range(j - 1, -1, -1):
+                key = chunk[pos]
+                if lo is not None and key < lo:
+                    return
+                yield key
+            i -= 1
+            if i >= 0:
+                j = len(chunks[i])
+
+
+class Storage:
+    """
+    Thread-safe in-memory storage for :class:`Operations`.
+
+    Tweets are kept in dictionary by ID, together with index of
+    (created_at, id) keys sorted by time and number of tweets of each type,
+    so that lookups by ID, ordered and time range queries and counting do
+    not need to scan all tweets.
+
+    Content of tweets is indexed by trigrams, for substring search, and
+    by words, for full text search. Search intersects posting lists of terms
+    from query, so only tweets that might match have to be checked.
+
+    Changes are done while holding write lock. Listing and searching take
+    snapshot of time index and iterate it without holding any lock, so long
+    searches do not block writers.
+    """
+
+    def __init__(self):
+        self.lock = RWLock()
+        self.tweets = dict()  # type: Dict[int, Tweet]
+        self.by_created = SortedIndex()
+        self.type_counts = Counter()  # type: Counter
+        # inverted indexes of tweet content: trigram/word -> tweet IDs
+        self.grams = defaultdict(set)  # type: Dict[str, Set[int]]
+        self.words = defaultdict(set)  # type: Dict[str, Set[int]]
         self.nodes = dict()  # type: Dict[str, Node]
-        self.counter = itertools.count()
+        self.counter = itertools.count(1)
+
+    def next_id(self) -> int:
+        return next(self.counter)
+
+    def add_tweet(self, tweet: Tweet):
+        """
+        Adds new tweet to storage and all indexes.
+        """
+        self.add_tweets([tweet])
+
+    def add_tweets(self, tweets: List[Tweet]):
+        """
+        Adds multiple tweets to storage and all indexes, holding write lock
+        only once.
+        """
+        with self.lock.write():
+            for tweet in tweets:
+                self.tweets[tweet.id] = tweet
+                self.by_created.add((tweet.created_at, tweet.id))
+                self.type_counts[tweet.type] += 1
+                self._index_content(tweet.id, tweet.tweet)
+
+    def update_tweet(self, id_: int, **changes) -> Optional[Tweet]:
+        """
+        Changes fields of existing original tweet. Creation time and type of
+        tweet can not change, so only main storage needs to be updated.
+
+        :return: Updated tweet or None if it was not found.
+        """
+        with self.lock.write():
+            tweet = self.tweets.get(id_)
+            if tweet is None:
+                return None
+            assert tweet.type == 'original'
+            new_tweet = tweet._replace(**changes)
+            self.tweets[id_] = new_tweet
+            if new_tweet.tweet != tweet.tweet:
+                self._unindex_content(id_, tweet.tweet)
+                self._index_content(id_, new_tweet.tweet)
+            return new_tweet
+
+    def remove_tweet(self, id_: int) -> Optional[Tweet]:
+        """
+        Removes tweet from storage and all indexes.
+
+        :return: Removed tweet or None if it was not found.
+        """
+        with self.lock.write():
+            tweet = self.tweets.pop(id_, None)
+            if tweet is None:
+                return None
+            self.by_created.remove((tweet.created_at, tweet.id))
+            self.type_counts[tweet.type] -= 1
+            self._unindex_content(id_, tweet.tweet)
+            return tweet
+
+    def _index_content(self, id_: int, content: Optional[str]):
+        for gram in _grams(content):
+            self.grams[gram].add(id_)
+        for word in set(_words(content)):
+            self.words[word].add(id_)
+
+    def _unindex_content(self, id_: int, content: Optional[str]):
+        for index, terms in ((self.grams, _grams(content)),
+                             (self.words, set(_words(content)))):
+            for term in terms:
+                ids = index.get(term)
+                if ids is not None:
+                    ids.discard(id_)
+                    if not ids:
+                        del index[term]
+
+    def matching_ids(self, content: str, mode: str) -> Optional[Set[int]]:
+        """
+        Finds IDs of tweets that might contain searched content, using
+        inverted index. Result is superset of matching tweets, each of them
+        still has to be checked.
+
+        :param content: Searched content.
+        :param mode: How content is matched, one of `SEARCH_MODES`.
+        :return:
+            Set of candidate IDs, or None if index can not be used for
+            provided content (e.g. it is too short for trigrams).
+        """
+        if mode == SEARCH_FULLTEXT:
+            index, terms = self.words, set(_words(content))
+            if not terms:
+                # same as empty full text query in PostgreSQL
+                return set()
+        else:
+            index, terms = self.grams, _grams(content)
+        if not terms:
+            return None
+        with self.lock.read():
+            postings = [index.get(term) for term in terms]
+            if not all(postings):
+                return set()
+            postings.sort(key=len)
+            return postings[0].intersection(*postings[1:])
+
+    def newest_first_of(self, ids: Set[int], after: Optional[Keyset]=None,
+                        from_created: Optional[datetime]=None,
+                        to_created: Optional[datetime]=None
+                        ) -> Iterator[Tweet]:
+        """
+        Same as :meth:`newest_first`, but only for tweets with provided IDs.
+
+        Few tweets are sorted directly. If there are many of them, time index
+        is walked instead, since results are usually limited and newest
+        tweets will be found quickly.
+        """
+        if len(ids) * 8 > len(self.by_created):
+            return (t for t in self.newest_first(after, from_created,
+                                                  to_created)
+                    if t.id in ids)
+
+        tweets = []
+        for id_ in ids:
+            tweet = self.tweets.get(id_)
+            if tweet is None:
+                continue
+            key = (tweet.created_at, tweet.id)
+            if ((after is None or key < after) and
+                    (from_created is None or
+                     tweet.created_at >= from_created) and
+                    (to_created is None or tweet.created_at <= to_created)):
+                tweets.append(tweet)
+        tweets.sort(key=lambda t: (t.created_at, t.id), reverse=True)
+        return iter(tweets)
+
+    def newest_first(self, after: Optional[Keyset]=None,
+                     from_created: Optional[datetime]=None,
+                     to_created: Optional[datetime]=None) -> Iterator[Tweet]:
+        """
+        Lazily iterates over tweets, newest first, limited to provided
+        creation time range (inclusive) and only ones after provided keyset.
+        Start of iteration is found with binary search, so cost depends only
+        on number of tweets consumed.
+
+        Iteration goes over snapshot of tweets taken when this is called.
+        Tweets deleted in the meantime are skipped.
+
+        :param after: Keyset (created_at, id) of last tweet on previous page.
+        :param from_created: Start time for tweet creation.
+        :param to_created: End time for tweet creation.
+        """
+        lo = None if from_created is None else (from_created, -1)
+        hi = None if to_created is None else (to_created, float('inf'))
+        if after is not None and (hi is None or after < hi):
+            hi = after
+        with self.lock.read():
+            keys = self.by_created.descending(lo, hi)
+        return self._resolve(keys)
+
+    def _resolve(self, keys: Iterator[Keyset]) -> Iterator[Tweet]:
+        for _, id_ in keys:
+            tweet = self.tweets.get(id_)
+            if tweet is not None:
+                yield tweet
+
+
+# storage shared by all handles in the process
+_storage = Storage()
+
+
+class Database:
+    """
+    Handle for in-memory storage. By default all handles share single
+    process wide :class:`Storage`.
+    """
+
+    def __init__(self, unit_of_work: bool=False, storage: Storage=None):
+        self.unit_of_work = unit_of_work
+        self.storage = _storage if storage is None else storage
 
     def test_connection(self):
         pass
@@ -36,16 +352,91 @@ class Database:
     def close(self):
         pass
 
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def stream(self, fn):
+        """
+        Same as :meth:`do`, but for functions that return iterator.
+
+        :param fn:
+            Function to execute.
+            It has to accept one argument, the :class:`Storage` instance.
+        :return: Generator of items produced by `fn`.
+        """
+        yield from fn(self.storage)
+
     def do(self, fn):
         """
         Executes provided fn and gives it a storage to work with.
 
         :param fn:
             Function to execute.
-            It has to accept one argument, the :class:`Database` instance.
+            It has to accept one argument, the :class:`Storage` instance.
         :return: Whatever `fn` returns
         """
-        return fn(self)
+        return fn(self.storage)
+
+
+def _words(text: Optional[str]) -> List[str]:
+    """
+    Splits text to lowercase words, similar to how full text search in
+    database does it.
+    """
+    return re.findall(r'\w+', (text or '').lower())
+
+
+def _grams(text: Optional[str]) -> Set[str]:
+    """
+    Returns set of lowercase trigrams (substrings of 3 characters) of text.
+    Text shorter then that has no trigrams.
+    """
+    lowered = (text or '').lower()
+    return {lowered[i:i + 3] for i in range(len(lowered) - 2)}
+
+
+def _matcher(content: Optional[str], mode: str) -> Callable[[Tweet], bool]:
+    """
+    Creates function that checks if tweet matches searched content.
+
+    :param content: Searched content.
+    :param mode: How content is matched, one of `SEARCH_MODES`.
+    """
+    def any_tweet(tweet):
+        return True
+
+    def substring(tweet):
+        return lowered in (tweet.tweet or '').lower()
+
+    def fulltext(tweet):
+        return words <= set(_words(tweet.tweet))
+
+    if content is None:
+        return any_tweet
+    lowered = content.lower()
+    words = set(_words(content))
+    return fulltext if mode == SEARCH_FULLTEXT else substring
+
+
+def _rank(content: str, text: Optional[str]) -> float:
+    """
+    Calculates relevance of text for searched content as share of text words
+    that were searched for.
+    """
+    words = set(_words(content))
+    text_words = _words(text)
+    if not text_words:
+        return 0.0
+    return sum(1 for w in text_words if w in words) / len(text_words)
 
 
 class Operations(db.Operations):
@@ -55,121 +446,196 @@ class Operations(db.Operations):
     ################################################
 
     @staticmethod
-    def insert_tweet(tweet: str, storage: Database):
+    def insert_tweet(tweet: str, storage: Storage):
         now = datetime.now()
         new_tweet = Tweet(
-            id=next(storage.counter), tweet=tweet, type='original',
+            id=storage.next_id(), tweet=tweet, type='original',
             created_at=now, modified_at=now, reference=''
         )
-        storage.tweets.append(new_tweet)
+        storage.add_tweet(new_tweet)
         return new_tweet
 
+    @staticmethod
+    def insert_tweets(tweets: List[NewTweet],
+                      storage: Storage) -> List[TwResp]:
+        now = datetime.now()
+        new_tweets = [
+            Tweet(
+                id=storage.next_id(), tweet=tweet or '', type=type_,
+                created_at=now, modified_at=now, reference=reference or '',
+            )
+            for type_, tweet, reference in tweets
+        ]
+        storage.add_tweets(new_tweets)
+        return new_tweets
+
     @staticmethod
     def search_tweets(content: Optional[str], from_created: Optional[datetime],
                       to_created: Optional[datetime],
                       from_modified: Optional[datetime],
                       to_modified: Optional[datetime], retweet: Optional[bool],
-                      storage: Database) -> Iterable[TwResp]:
-        return [
+                      storage: Storage, limit: Optional[int]=None,
+                      after: Optional[Keyset]=None,
+                      mode: str=SEARCH_SUBSTRING,
+                      order: str=ORDER_CREATED) -> Iterable[TwResp]:
+        by_relevance = (order == ORDER_RELEVANCE and content is not None and
+                        mode == SEARCH_FULLTEXT)
+        if by_relevance and after is not None:
+            raise ValueError('Keyset pagination is not possible when '
+                             'ordering by relevance.')
+
+        matches = _matcher(content, mode)
+        ids = None if content is None else storage.matching_ids(content, mode)
+        if ids is None:
+            candidates = storage.newest_first(after, from_created, to_created)
+        else:
+            candidates = storage.newest_first_of(ids, after, from_created,
+                                                 to_created)
+        found = (
             tweet
-            for tweet in storage.tweets if (
+            for tweet in candidates if (
                 (retweet is None or (tweet.type == 'retweet') == retweet) and
                 (to_modified is None or tweet.modified_at <= to_modified) and
                 (from_modified is None or tweet.modified_at >= from_modified) and
-                (to_created is None or tweet.created_at <= to_created) and
-                (from_modified is None or tweet.created_at >= from_created) and
-                (content is None or content.lower() in tweet.content.lower())
+                matches(tweet)
             )
-        ]
+        )
+        if by_relevance:
+            return sorted(
+                found,
+                key=lambda t: (_rank(content, t.tweet), t.created_at, t.id),
+                reverse=True,
+            )[:limit]
+        return list(itertools.islice(found, limit))
 
     @staticmethod
-    def modify_tweet(id_: int, new_content: str, storage: Database) -> TwResp:
-        tweet = Operations.get_tweet(id_, storage)  # type: Tweet
-        assert tweet.type == 'original'
-        new_tweet = Tweet(
-            id=tweet.id, tweet=new_content, type=tweet.type,
-            created_at=tweet.created_at,
-            modified_at=tweet.modified_at,
-            reference=tweet.reference
-        )
-        storage.tweets.remove(tweet)
-        storage.tweets.append(new_tweet)
-        return new_tweet
+    def modify_tweet(id_: int, new_content: str, storage: Storage) -> TwResp:
+        return storage.update_tweet(id_, tweet=new_content,
+                                    modified_at=datetime.now())
 
     @staticmethod
-    def create_retweet(server: str, ref: str, storage: Database) -> TwResp:
+    def create_retweet(server: str, ref: str, storage: Storage) -> TwResp:
         now = datetime.now()
         new_tweet = Tweet(
-            id=next(storage.counter), tweet='', type='retweet',
+            id=storage.next_id(), tweet='', type='retweet',
             created_at=now, modified_at=now, reference=f'{server}#{ref}'
         )
-        storage.tweets.append(new_tweet)
+        storage.add_tweet(new_tweet)
         return new_tweet
 
     @staticmethod
-    def get_tweet(id_: int, storage: Database):
-        for tweet in storage.tweets:
-            if tweet.id == id_:
-                return tweet
-        else:
-            raise KeyError(f'Tweet with id={id_} not found.')
+    def get_tweet(id_: int, storage: Storage):
+        return storage.tweets.get(id_)
 
     @staticmethod
-    def count_tweets(type_: str, storage: Database) -> int:
-        return len([
-            tweet
-            for tweet in storage.tweets
-            if tweet.type == type_
-        ])
+    def get_tweets(ids: List[int], storage: Storage) -> List[TwResp]:
+        found = (storage.tweets.get(id_) for id_ in set(ids))
+        return [t for t in found if t is not None]
+
+    @staticmethod
+    def iter_tweets(chunk_size: int, storage: Storage) -> Iterator[TwResp]:
+        yield from storage.newest_first()
+
+    @staticmethod
+    def count_tweets(type_: str, storage: Storage) -> int:
+        if type_:
+            return storage.type_counts[type_]
+        return len(storage.tweets)
+
+    @staticmethod
+    def count_tweets_by_type(storage: Storage) -> Dict[str, int]:
+        with storage.lock.read():
+            return {t: c for t, c in storage.type_counts.items() if c > 0}
+
+    @staticmethod
+    def estimate_tweets_by_type(storage: Storage) -> Optional[Dict[str, int]]:
+        # exact counts are maintained, so there is no need to estimate
+        return Operations.count_tweets_by_type(storage)
 
     @staticmethod
-    def get_all_tweets(storage: Database):
-        return storage.tweets
+    def get_all_tweets(storage: Storage, limit: Optional[int]=None,
+                       after: Optional[Keyset]=None):
+        return list(itertools.islice(storage.newest_first(after), limit))
 
     @staticmethod
-    def delete_tweet(id_: int, storage: Database) -> bool:
-        try:
-            storage.tweets.remove(Operations.get_tweet(id_, storage))
-            return True
-        except KeyError:
-            return False
+    def delete_tweet(id_: int, storage: Storage) -> bool:
+        return storage.remove_tweet(id_) is not None
 
     ################################################
     # Node related methods
     ################################################
 
     @staticmethod
-    def update_node(name: str, address: str, storage: Database) -> NdResp:
-        assert name in storage.nodes
-        new_node = Node(name=name, address=address,
-                        last_checked_at=datetime.now())
-        storage.nodes[name] = new_node
+    def update_node(name: str, address: str, storage: Storage) -> NdResp:
+        with storage.lock.write():
+            assert name in storage.nodes
+            new_node = storage.nodes[name]._replace(
+                address=address, last_checked_at=datetime.now(),
+            )
+            storage.nodes[name] = new_node
         return new_node
 
     @staticmethod
-    def delete_node(name: str, storage: Database) -> bool:
-        try:
-            del storage.nodes[name]
-            return True
-        except KeyError:
-            return False
+    def update_nodes_health(checks: List[NodeCheck], alpha: float,
+                            storage: Storage) -> List[NdResp]:
+        now = datetime.now()
+        updated = []
+        with storage.lock.write():
+            for name, latency in checks:
+                node = storage.nodes.get(name)
+                if node is None:
+                    continue
+                if latency is None:
+                    node = node._replace(failures=node.failures + 1)
+                else:
+                    if node.latency is not None:
+                        latency = alpha * latency + (1 - alpha) * node.latency
+                    node = node._replace(latency=latency, failures=0)
+                node = node._replace(last_checked_at=now)
+                storage.nodes[name] = node
+                updated.append(node)
+        return updated
+
+    @staticmethod
+    def delete_node(name: str, storage: Storage) -> bool:
+        with storage.lock.write():
+            return storage.nodes.pop(name, None) is not None
 
     @staticmethod
-    def delete_all_nodes(storage: Database) -> bool:
-        storage.nodes = dict()
+    def delete_all_nodes(storage: Storage) -> bool:
+        with storage.lock.write():
+            deleted = len(storage.nodes) > 0
+            storage.nodes = dict()
+        return deleted
 
     @staticmethod
-    def get_all_nodes(storage: Database) -> Iterable[NdResp]:
-        return list(storage.nodes.values())
+    def get_all_nodes(storage: Storage) -> Iterable[NdResp]:
+        with storage.lock.read():
+            return list(storage.nodes.values())
 
     @staticmethod
-    def insert_node(name: str, address: str, storage: Database) -> NdResp:
-        assert name not in storage.nodes
+    def insert_node(name: str, address: str, storage: Storage) -> NdResp:
         new_node = Node(name=name, address=address,
-                        last_checked_at=datetime.now())
-        storage.nodes[name] = new_node
+                        last_checked_at=datetime.now(), latency=None,
+                        failures=0)
+        with storage.lock.write():
+            assert name not in storage.nodes
+            storage.nodes[name] = new_node
         return new_node
 
     @staticmethod
-    def get_node(name: str, storage: Database) -> NdResp:
-        return storage.nodes[name]
+    def insert_nodes(nodes: List[Tuple[str, str]],
+                     storage: Storage) -> List[NdResp]:
+        now = datetime.now()
+        new_nodes = [Node(name=name, address=address, last_checked_at=now,
+                          latency=None, failures=0)
+                     for name, address in nodes]
+        with storage.lock.write():
+            assert not any(n.name in storage.nodes for n in new_nodes)
+            storage.nodes.update((n.name, n) for n in new_nodes)
+        return new_nodes
+
+    @staticmethod
+    def get_node(name: str, storage: Storage) -> NdResp:
+        with storage.lock.read():
+            return storage.nodes.get(name)
@@ -1,38 +1,352 @@
+import time
 import logging
+import threading
+from collections import deque
 from datetime import datetime
-from typing import Optional, Iterable, List, Union, Callable
+from functools import partial
+from typing import (
+    Optional, Iterable, Iterator, List, Union, Callable, Deque, Dict, Tuple,
+)
 
 import pg8000
 from flask import current_app
 
 from seventweets import db
+from seventweets.exceptions import ServiceUnavailable
 from seventweets.db import (
-    TwResp, NdResp, _T,
+    TwResp, NdResp, Keyset, NewTweet, NodeCheck, _T,
     TWEET_COLUMN_ORDER, NODE_COLUMN_ORDER,
+    SEARCH_SUBSTRING, SEARCH_FULLTEXT, ORDER_CREATED, ORDER_RELEVANCE,
 )
 
 logger = logging.getLogger(__name__)
 DbCallback = Callable[[pg8000.Cursor], _T]
 
+# Full text representation of tweet content. It has to match expression used
+# for index in migration 005 exactly, so that index can be used.
+TWEET_TSVECTOR = "to_tsvector('simple', coalesce(tweet, ''))"
+TWEET_TSQUERY = "plainto_tsquery('simple', %s)"
+
+# Trigram index (migration 006) can only be used for patterns with at least
+# this many characters. For shorter terms it would have to scan entire index,
+# which is slower then scanning the table.
+TRIGRAM_MIN_LENGTH = 3
+
+# Maximum number of tweets inserted with single statement. Each tweet takes
+# three parameters and number of parameters in a statement is limited.
+INSERT_CHUNK_SIZE = 1000
 
-class Database(pg8000.Connection):
+
+class Connection(pg8000.Connection):
     """
-    Thin wrapper around `pg8000.Connection` that allows executing queries
-    on database and makes sure that connection is in valid state by
-    performing commit and rollback when appropriate.
+    Single physical connection to database. Instances are owned by
+    :class:`ConnectionPool` and should not be used directly, use
+    :class:`Database` instead.
     """
 
-    def __init__(self):
-        super(Database, self).__init__(
-            user=current_app.config['ST_DB_USER'],
-            host=current_app.config['ST_DB_HOST'],
-            unix_sock=None,
-            port=int(current_app.config['ST_DB_PORT']),
-            database=current_app.config['ST_DB_NAME'],
-            password=current_app.config['ST_DB_PASS'],
-            ssl=False,
-            timeout=None,
-        )
+    def __init__(self, **kwargs):
+        super(Connection, self).__init__(**kwargs)
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+
+    def ping(self) -> bool:
+        """
+        Checks if connection is still usable by performing trivial query.
+
+        :return: Flag indicating if connection is healthy.
+        """
+        try:
+            cursor = self.cursor()
+            try:
+                cursor.execute('SELECT 1')
+                cursor.fetchall()
+            finally:
+                cursor.close()
+            self.rollback()
+            return True
+        except Exception:
+            return False
+
+    def terminate(self):
+        """
+        Closes underlying socket, ignoring errors if it is already closed.
+        """
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of database connections.
+
+    Idle connections are handed out in LIFO order, so that connections that
+    are used often stay warm and rarely used ones get recycled. Connections
+    that were idle for longer then `ping_after` seconds are health-checked
+    before they are handed out and connections older then `recycle` seconds
+    are closed and replaced with new ones.
+    """
+
+    def __init__(self, connect: Callable[[], Connection], min_size: int=1,
+                 max_size: int=10, timeout: float=30.0,
+                 recycle: float=3600.0, ping_after: float=30.0):
+        """
+        :param connect: Function that opens new connection to database.
+        :param min_size: Number of connections to keep open at all times.
+        :param max_size: Maximum number of open connections.
+        :param timeout:
+            Number of seconds to wait for free connection before giving up.
+        :param recycle: Maximum lifetime of a connection in seconds.
+        :param ping_after:
+            Number of seconds connection can be idle before it is
+            health-checked on checkout.
+        """
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f'Invalid pool size: min={min_size}, '
+                             f'max={max_size}')
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+
+        self._idle: Deque[Connection] = deque()
+        self._size = 0
+        self._filled = False
+        self._lock = threading.Condition()
+
+    @property
+    def size(self) -> int:
+        """
+        Number of connections opened by this pool, both idle and in use.
+        """
+        return self._size
+
+    @property
+    def idle(self) -> int:
+        """
+        Number of connections waiting in pool to be used.
+        """
+        return len(self._idle)
+
+    def _is_stale(self, conn: Connection) -> bool:
+        return time.monotonic() - conn.created_at > self.recycle
+
+    def _discard(self, conn: Connection):
+        """
+        Closes connection and frees its slot in the pool.
+        """
+        conn.terminate()
+        with self._lock:
+            self._size -= 1
+            self._lock.notify()
+
+    def _open(self) -> Connection:
+        """
+        Opens new connection for slot that is already reserved.
+        """
+        try:
+            return self.connect()
+        except Exception:
+            with self._lock:
+                self._size -= 1
+                self._lock.notify()
+            raise
+
+    def _fill(self):
+        """
+        Opens connections until pool holds at least `min_size` of them.
+        """
+        while True:
+            with self._lock:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            conn = self._open()
+            with self._lock:
+                self._idle.append(conn)
+                self._lock.notify()
+
+    def acquire(self, timeout: Optional[float]=None) -> Connection:
+        """
+        Checks out connection from the pool, opening new one if there is no
+        idle connection and pool is not full.
+
+        :param timeout:
+            Number of seconds to wait for connection. Pool default is used
+            if not provided.
+        :return: Healthy connection to database.
+        :raises ServiceUnavailable:
+            If no connection became available before timeout expired.
+        """
+        if not self._filled:
+            # if filling fails, it is tried again on next acquire
+            self._fill()
+            with self._lock:
+                self._filled = True
+
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise ServiceUnavailable(
+                            'Timed out waiting for database connection.'
+                        )
+                    self._lock.wait(remaining)
+                if self._idle:
+                    conn = self._idle.pop()
+                else:
+                    conn = None
+                    self._size += 1
+
+            if conn is None:
+                conn = self._open()
+            elif self._is_stale(conn):
+                logger.debug('Recycling stale database connection.')
+                self._discard(conn)
+                continue
+            elif (time.monotonic() - conn.last_used_at > self.ping_after and
+                    not conn.ping()):
+                logger.warning('Discarding broken database connection.')
+                self._discard(conn)
+                continue
+            conn.last_used_at = time.monotonic()
+            return conn
+
+    def release(self, conn: Connection):
+        """
+        Returns connection to the pool. Unfinished transaction is rolled back
+        and broken or stale connections are closed.
+
+        :param conn: Connection previously obtained with :meth:`acquire`.
+        """
+        try:
+            # rollback does nothing if there is no transaction
+            conn.rollback()
+        except Exception:
+            logger.warning('Discarding database connection in failed state.')
+            self._discard(conn)
+            return
+
+        if self._is_stale(conn):
+            self._discard(conn)
+            return
+
+        conn.last_used_at = time.monotonic()
+        with self._lock:
+            self._idle.append(conn)
+            self._lock.notify()
+
+    def close(self):
+        """
+        Closes all idle connections. Connections that are in use will be
+        closed when they are released.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+            self._size -= len(idle)
+            self._filled = False
+        for conn in idle:
+            conn.terminate()
+
+
+_pools: Dict[tuple, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Returns process wide connection pool for database configured in current
+    application, creating it if needed.
+    """
+    cfg = current_app.config
+    params = dict(
+        user=cfg['ST_DB_USER'],
+        host=cfg['ST_DB_HOST'],
+        unix_sock=None,
+        port=int(cfg['ST_DB_PORT']),
+        database=cfg['ST_DB_NAME'],
+        password=cfg['ST_DB_PASS'],
+        ssl=False,
+        timeout=None,
+    )
+    key = tuple(sorted(params.items()))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(
+                connect=partial(Connection, **params),
+                min_size=int(cfg['ST_DB_POOL_MIN']),
+                max_size=int(cfg['ST_DB_POOL_MAX']),
+                timeout=float(cfg['ST_DB_POOL_TIMEOUT']),
+                recycle=float(cfg['ST_DB_POOL_RECYCLE']),
+                ping_after=float(cfg['ST_DB_POOL_PING_AFTER']),
+            )
+            _pools[key] = pool
+    return pool
+
+
+class Database:
+    """
+    Handle for pooled connection that allows executing queries on database
+    and makes sure that connection is in valid state by performing commit
+    and rollback when appropriate.
+
+    Connection is checked out from pool on first use and returned to it
+    when handle is closed. Handle can be used again after it is closed, in
+    which case new connection is checked out.
+
+    If handle is created as unit of work, :meth:`do` does not commit after
+    each callback. All callbacks share single transaction that has to be
+    finished explicitly by calling :meth:`commit` or :meth:`rollback`.
+    """
+
+    def __init__(self, pool: ConnectionPool=None, unit_of_work: bool=False):
+        self.pool = pool or get_pool()
+        self.unit_of_work = unit_of_work
+        self._conn: Optional[Connection] = None
+
+    @property
+    def connection(self) -> Connection:
+        """
+        Connection this handle is using, checked out from pool if needed.
+        """
+        if self._conn is None:
+            self._conn = self.pool.acquire()
+        return self._conn
+
+    def cursor(self) -> pg8000.Cursor:
+        return self.connection.cursor()
+
+    def commit(self):
+        if self._conn is not None:
+            self._conn.commit()
+
+    def rollback(self):
+        if self._conn is not None:
+            self._conn.rollback()
+
+    def close(self):
+        """
+        Returns connection to the pool.
+        """
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self.pool.release(conn)
+
+    def cleanup(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
     def test_connection(self):
         """
@@ -45,13 +359,29 @@ class Database(pg8000.Connection):
             logger.critical('Unable to execute query on database.')
             raise
 
-    def cleanup(self):
+    def stream(self, fn: Callable[[pg8000.Cursor], Iterator[_T]]
+               ) -> Iterator[_T]:
+        """
+        Same as :meth:`do`, but for functions that return iterator. Iterator
+        is consumed lazily and cursor is kept open until it is exhausted.
+        Transaction is committed after that, or rolled back if iteration is
+        interrupted.
+
+        :param fn:
+            Function to execute. It has to accept one argument, cursor that it
+            will use to communicate with database.
+        :return: Generator of items produced by `fn`.
+        """
+        cursor = self.cursor()
         try:
-            self.close()
-        except pg8000.core.InterfaceError:
-            # this exception is raised if db is already closed, which will
-            # happen if class is used as context manager
-            pass
+            yield from fn(cursor)
+            if not self.unit_of_work:
+                self.commit()
+        except BaseException:
+            self.rollback()
+            raise
+        finally:
+            cursor.close()
 
     def do(self, fn: DbCallback) -> _T:
         """
@@ -60,8 +390,10 @@ class Database(pg8000.Connection):
         Cursor will automatically be closed after, no matter that result of
         execution is. Return value is whatever `fn` returns.
 
-        After each operation, commit is performed if no exception is raised.
-        If exception is raised - transaction is rolled backed.
+        After each operation, commit is performed if no exception is raised,
+        unless handle is unit of work, in which case commit is left to the
+        owner of the handle. If exception is raised - transaction is rolled
+        backed, including work done by previous callbacks in unit of work.
 
         :param fn:
             Function to execute. It has to accept one argument, cursor that it
@@ -71,7 +403,8 @@ class Database(pg8000.Connection):
         cursor = self.cursor()
         try:
             res = fn(cursor)
-            self.commit()
+            if not self.unit_of_work:
+                self.commit()
             return res
         except Exception:
             self.rollback()
@@ -80,26 +413,120 @@ class Database(pg8000.Connection):
             cursor.close()
 
 
+def _substring_condition(content: str) -> str:
+    """
+    Returns condition for case insensitive substring search. Terms long
+    enough to be served by trigram index are matched with ILIKE, which
+    planner can use that index for. Shorter ones are matched with `strpos`,
+    so that planner does not consider trigram index at all.
+
+    :param content: Searched content.
+    :return: SQL condition with single parameter.
+    """
+    if len(content) >= TRIGRAM_MIN_LENGTH:
+        return 'tweet ILIKE %s'
+    return 'strpos(lower(tweet), %s) > 0'
+
+
+def _substring_param(content: str) -> str:
+    """
+    Returns parameter for condition created by :func:`_substring_condition`.
+    LIKE wildcards in content are escaped, so they are matched literally.
+
+    :param content: Searched content.
+    :return: Query parameter.
+    """
+    if len(content) >= TRIGRAM_MIN_LENGTH:
+        escaped = (content.replace('\\', '\\\\')
+                   .replace('%', '\\%')
+                   .replace('_', '\\_'))
+        return f'%{escaped}%'
+    return content.lower()
+
+
+def _page(where: List[str], params: list, limit: Optional[int],
+          after: Optional[Keyset]) -> str:
+    """
+    Adds keyset pagination condition to `where` and `params` and returns
+    LIMIT clause that has to follow ORDER BY clause. Query has to be ordered
+    by `created_at DESC, id DESC`.
+
+    :param where: List of WHERE conditions to extend.
+    :param params: List of query parameters to extend.
+    :param limit: Maximum number of rows to return.
+    :param after: Keyset of last row on previous page.
+    :return: LIMIT clause, or empty string if there is no limit.
+    """
+    if after is not None:
+        where.append('(created_at, id) < (%s, %s)')
+        params.extend(after)
+    if limit is None:
+        return ''
+    params.append(limit)
+    return 'LIMIT %s'
+
+
 class Operations(db.Operations):
     ################################################
     # Tweet related methods
     ################################################
 
     @staticmethod
-    def get_all_tweets(cursor: pg8000.Cursor) -> Iterable[TwResp]:
+    def get_all_tweets(cursor: pg8000.Cursor, limit: Optional[int]=None,
+                       after: Optional[Keyset]=None) -> Iterable[TwResp]:
         """
-        Returns all tweets from database.
+        Returns all tweets from database, newest first.
 
         :param cursor: Database cursor.
+        :param limit: Maximum number of tweets to return.
+        :param after:
+            Keyset (created_at, id) of last tweet from previous page. Only
+            tweets that come after it are returned.
         :return: All tweets from database.
         """
+        where: List[str] = []
+        params: List[Union[int, datetime]] = []
+        page_clause = _page(where, params, limit, after)
+        where_clause = 'WHERE ' + ' AND '.join(where) if len(where) > 0 else ''
+
         cursor.execute(f'''
             SELECT {TWEET_COLUMN_ORDER}
             FROM tweets
-            ORDER BY created_at DESC
-        ''')
+            {where_clause}
+            ORDER BY created_at DESC, id DESC
+            {page_clause}
+        ''', tuple(params))
         return cursor.fetchall()
 
+    @staticmethod
+    def iter_tweets(chunk_size: int,
+                    cursor: pg8000.Cursor) -> Iterator[TwResp]:
+        """
+        Lazily iterates over all tweets from database, newest first. Server
+        side cursor is used, so only `chunk_size` tweets are fetched at once.
+        It lives until the end of transaction, so this has to be consumed
+        before transaction is finished.
+
+        :param chunk_size: Number of tweets to read from database at once.
+        :param cursor: Database cursor.
+        :return: Generator of all tweets from database.
+        """
+        cursor.execute(f'''
+            DECLARE tweets_stream NO SCROLL CURSOR FOR
+            SELECT {TWEET_COLUMN_ORDER}
+            FROM tweets
+            ORDER BY created_at DESC, id DESC
+        ''')
+        while True:
+            cursor.execute(
+                f'FETCH FORWARD {int(chunk_size)} FROM tweets_stream'
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            yield from rows
+        cursor.execute('CLOSE tweets_stream')
+
     @staticmethod
     def get_tweet(id_: int, cursor: pg8000.Cursor) -> TwResp:
         """
@@ -114,6 +541,23 @@ class Operations(db.Operations):
         ''', (id_,))
         return cursor.fetchone()
 
+    @staticmethod
+    def get_tweets(ids: List[int], cursor: pg8000.Cursor) -> List[TwResp]:
+        """
+        Returns multiple tweets from database with single query.
+
+        :param ids: IDs of tweets to get.
+        :param cursor: Database cursor.
+        :return: Tweets that were found, in no particular order.
+        """
+        if not ids:
+            return []
+        cursor.execute(f'''
+            SELECT {TWEET_COLUMN_ORDER}
+            FROM tweets WHERE id = ANY(%s);
+        ''', (list(ids),))
+        return cursor.fetchall()
+
     @staticmethod
     def insert_tweet(tweet: str, cursor: pg8000.Cursor) -> TwResp:
         """
@@ -129,6 +573,31 @@ class Operations(db.Operations):
         ''', (tweet,))
         return cursor.fetchone()
 
+    @staticmethod
+    def insert_tweets(tweets: List[NewTweet],
+                      cursor: pg8000.Cursor) -> List[TwResp]:
+        """
+        Inserts multiple tweets with multi-row INSERT statements, each
+        inserting up to `INSERT_CHUNK_SIZE` tweets.
+
+        :param tweets: Tweets to insert as (type, tweet, reference) tuples.
+        :param cursor: Database cursor.
+        :return: Created tweets, in same order as provided.
+        """
+        created = []
+        for start in range(0, len(tweets), INSERT_CHUNK_SIZE):
+            chunk = tweets[start:start + INSERT_CHUNK_SIZE]
+            values = ', '.join(['(%s, %s, %s)'] * len(chunk))
+            cursor.execute(f'''
+                INSERT INTO tweets (type, tweet, reference)
+                VALUES {values}
+                RETURNING {TWEET_COLUMN_ORDER};
+            ''', tuple(v for t in chunk for v in t))
+            # IDs are assigned in order of rows in VALUES, RETURNING
+            # itself does not guarantee any order
+            created.extend(sorted(cursor.fetchall(), key=lambda t: t[0]))
+        return created
+
     @staticmethod
     def modify_tweet(id_: int, new_content: str,
                      cursor: pg8000.Cursor) -> TwResp:
@@ -191,7 +660,11 @@ class Operations(db.Operations):
                       from_modified: Optional[datetime],
                       to_modified: Optional[datetime],
                       retweet: Optional[bool],
-                      cursor: pg8000.Cursor) -> Iterable[TwResp]:
+                      cursor: pg8000.Cursor,
+                      limit: Optional[int]=None,
+                      after: Optional[Keyset]=None,
+                      mode: str=SEARCH_SUBSTRING,
+                      order: str=ORDER_CREATED) -> Iterable[TwResp]:
         """
         :param content: Content to search in tweet.
         :param from_created: Start time for tweet creation.
@@ -203,12 +676,29 @@ class Operations(db.Operations):
         :param retweet:
             Flag indication if retweet or original tweets should be searched.
         :param cursor: Database cursor.
-        """
+        :param limit: Maximum number of tweets to return.
+        :param after:
+            Keyset (created_at, id) of last tweet from previous page. Only
+            tweets that come after it are returned.
+        :param mode: How content is matched, one of `SEARCH_MODES`.
+        :param order:
+            How results are ordered, one of `SEARCH_ORDERS`. Keyset
+            pagination is not possible when ordering by relevance.
+        """
+        by_relevance = (order == ORDER_RELEVANCE and content is not None and
+                        mode == SEARCH_FULLTEXT)
+        if by_relevance and after is not None:
+            raise ValueError('Keyset pagination is not possible when ordering '
+                             'by relevance.')
+
         where: List[str] = []
-        params: List[Union[str, datetime]] = []
-        if content is not None:
-            where.append('tweet ILIKE %s')
-            params.append(f'%{content}%')
+        params: List[Union[str, int, datetime]] = []
+        if content is not None and mode == SEARCH_FULLTEXT:
+            where.append(f'{TWEET_TSVECTOR} @@ {TWEET_TSQUERY}')
+            params.append(content)
+        elif content is not None:
+            where.append(_substring_condition(content))
+            params.append(_substring_param(content))
         if from_created is not None:
             where.append('created_at > %s')
             params.append(from_created)
@@ -223,7 +713,13 @@ class Operations(db.Operations):
             params.append(to_modified)
         if retweet is not None:
             where.append('type = %s')
-            params.append('retweet')
+            params.append('retweet' if retweet else 'original')
+        order_by = 'created_at DESC, id DESC'
+        if by_relevance:
+            order_by = f'ts_rank({TWEET_TSVECTOR}, {TWEET_TSQUERY}) DESC, ' \
+                       f'{order_by}'
+            params.append(content)
+        page_clause = _page(where, params, limit, after)
 
         where_clause = 'WHERE ' + ' AND '.join(where) if len(where) > 0 else ''
 
@@ -231,7 +727,8 @@ class Operations(db.Operations):
             SELECT {TWEET_COLUMN_ORDER}
             FROM tweets
             {where_clause}
-            ORDER BY created_at DESC
+            ORDER BY {order_by}
+            {page_clause}
         ''', tuple(params))
         return cursor.fetchall()
 
@@ -255,6 +752,56 @@ class Operations(db.Operations):
         ''', tuple(params))
         return cursor.fetchone()[0]
 
+    @staticmethod
+    def count_tweets_by_type(cursor: pg8000.Cursor) -> Dict[str, int]:
+        """
+        Returns number of tweets of each type, counted in single query.
+
+        :param cursor: Database cursor.
+        :return: Dictionary mapping tweet type to number of tweets.
+        """
+        cursor.execute('''
+            SELECT type, count(*)
+            FROM tweets
+            GROUP BY type
+        ''')
+        return {type_: count for type_, count in cursor.fetchall()}
+
+    @staticmethod
+    def estimate_tweets_by_type(
+            cursor: pg8000.Cursor) -> Optional[Dict[str, int]]:
+        """
+        Returns estimated number of tweets of each type, based on planner
+        statistics: row count of the table from `pg_class` and frequencies of
+        tweet types from `pg_stats`. Statistics are maintained by
+        (auto)vacuum and ANALYZE, so they can be behind actual state.
+
+        :param cursor: Database cursor.
+        :return:
+            Dictionary mapping tweet type to estimated number of tweets, or
+            None if table was not analyzed yet.
+        """
+        cursor.execute('''
+            SELECT c.reltuples, s.most_common_vals::text::text[],
+                   s.most_common_freqs
+            FROM pg_class c
+            LEFT JOIN pg_stats s
+                ON s.schemaname = current_schema()
+                AND s.tablename = 'tweets'
+                AND s.attname = 'type'
+            WHERE c.oid = 'tweets'::regclass
+        ''')
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        reltuples, values, freqs = row
+        if reltuples is None or reltuples < 0 or values is None:
+            return None
+        return {
+            type_: int(round(reltuples * freq))
+            for type_, freq in zip(values, freqs)
+        }
+
     ################################################
     # Node related methods
     ################################################
@@ -289,6 +836,26 @@ class Operations(db.Operations):
         ''', (name, address))
         return cursor.fetchone()
 
+    @staticmethod
+    def insert_nodes(nodes: List[Tuple[str, str]],
+                     cursor: pg8000.Cursor) -> List[NdResp]:
+        """
+        Inserts all nodes with single multi-row INSERT statement.
+
+        :param nodes: Nodes to insert as (name, address) tuples.
+        :param cursor: Database cursor.
+        :return: Nodes that were inserted.
+        """
+        if not nodes:
+            return []
+        values = ', '.join(['(%s, %s)'] * len(nodes))
+        cursor.execute(f'''
+            INSERT INTO nodes (name, address)
+            VALUES {values}
+            RETURNING {NODE_COLUMN_ORDER};
+        ''', tuple(v for n in nodes for v in n))
+        return cursor.fetchall()
+
     @staticmethod
     def get_node(name: str, cursor: pg8000.Cursor) -> NdResp:
         """
@@ -340,6 +907,44 @@ class Operations(db.Operations):
         ''', (name,))
         return cursor.rowcount > 0
 
+    @staticmethod
+    def update_nodes_health(checks: List[NodeCheck], alpha: float,
+                            cursor: pg8000.Cursor) -> List[NdResp]:
+        """
+        Updates all checked nodes with single UPDATE statement, joined with
+        results of probes. Moving average is computed by database, from
+        latency stored by any process.
+
+        :param checks: Results of probes as (name, latency) tuples.
+        :param alpha: Weight of new latency in moving average.
+        :param cursor: Database cursor.
+        :return: Updated nodes.
+        """
+        if not checks:
+            return []
+        values = ', '.join(
+            ['(%s::varchar, %s::double precision)'] * len(checks)
+        )
+        columns = ', '.join(f'nodes.{c.strip()}'
+                            for c in NODE_COLUMN_ORDER.split(','))
+        cursor.execute(f'''
+            UPDATE nodes SET
+                last_checked_at = NOW(),
+                latency = CASE
+                    WHEN c.latency IS NULL THEN nodes.latency
+                    WHEN nodes.latency IS NULL THEN c.latency
+                    ELSE %s * c.latency + (1 - %s) * nodes.latency
+                END,
+                failures = CASE
+                    WHEN c.latency IS NULL THEN nodes.failures + 1
+                    ELSE 0
+                END
+            FROM (VALUES {values}) AS c (name, latency)
+            WHERE nodes.name = c.name
+            RETURNING {columns};
+        ''', (alpha, alpha) + tuple(v for c in checks for v in c))
+        return cursor.fetchall()
+
     @staticmethod
     def delete_all_nodes(cursor: pg8000.Cursor) -> bool:
         """
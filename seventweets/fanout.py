@@ -0,0 +1,334 @@
+"""
+Shared executor for requests sent to other nodes.
+
+Requests to other nodes are blocking, so they are sent from a pool of
+threads. Pool is created once per process and reused by all requests,
+instead of starting new threads for each of them. It grows with the
+network, so that all nodes can be requested at the same time.
+"""
+import time
+import logging
+import threading
+from functools import partial
+from collections import namedtuple, defaultdict, deque, Counter
+from concurrent.futures import (
+    ThreadPoolExecutor, Future, FIRST_COMPLETED, wait,
+)
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import flask
+from seventweets import config
+from seventweets.db import end_unit_of_work
+from seventweets.exceptions import ServiceUnavailable
+
+logger = logging.getLogger(__name__)
+
+# Outcome of call to single node.
+STATUS_OK = 'ok'
+STATUS_ERROR = 'error'
+STATUS_TIMEOUT = 'timeout'
+
+# Result of call to single node. `value` is set only if status is ok, and
+# `error` only if it is error. `elapsed` is number of seconds call took, or
+# was waited for if it timed out.
+NodeResult = namedtuple('NodeResult', 'name, status, value, error, elapsed')
+
+_executor = None
+_size = 0
+_lock = threading.Lock()
+
+
+def pool_size(nodes: int) -> int:
+    """
+    Returns number of threads needed to send requests to provided number of
+    nodes, within configured bounds.
+    """
+    size = nodes * int(config.ST_FANOUT_WORKERS_PER_NODE)
+    return min(int(config.ST_FANOUT_MAX_WORKERS),
+               max(int(config.ST_FANOUT_MIN_WORKERS), size))
+
+
+def get_executor(nodes: int=0) -> ThreadPoolExecutor:
+    """
+    Returns process wide executor for requests to other nodes, creating it
+    on first use.
+
+    If executor is too small for provided number of nodes, it is replaced by
+    bigger one. Calls already submitted to old executor are finished.
+
+    :param nodes: Number of nodes requests will be sent to.
+    """
+    global _executor, _size
+    size = pool_size(nodes)
+    if _executor is None or size > _size:
+        with _lock:
+            if _executor is None or size > _size:
+                old = _executor
+                _executor = ThreadPoolExecutor(max_workers=size,
+                                               thread_name_prefix='fanout')
+                _size = size
+                if old is not None:
+                    old.shutdown(wait=False)
+    return _executor
+
+
+def submit(fn, *args, **kwargs) -> Future:
+    """
+    Submits call to shared executor.
+
+    If called within application context, call runs in context of same
+    application, so it can use configuration and database. Database work
+    done by the call is committed if it succeeds.
+    """
+    if not flask.has_app_context():
+        return get_executor().submit(fn, *args, **kwargs)
+    app = flask.current_app._get_current_object()
+
+    def call():
+        with app.app_context():
+            result = fn(*args, **kwargs)
+            end_unit_of_work(commit=True)
+            return result
+    return get_executor().submit(call)
+
+
+class LatencyHistory:
+    """
+    Keeps latencies of recent successful calls to each node.
+    """
+
+    def __init__(self, size: int=100):
+        """
+        :param size: Number of latest calls kept for each node.
+        """
+        self._samples = defaultdict(partial(deque, maxlen=size))
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            self._samples[name].append(seconds)
+
+    def percentile(self, name: str, percent: float,
+                   min_samples: int=1) -> Optional[float]:
+        """
+        Returns latency of node that given percent of recent calls was faster
+        than, or None if there are less then `min_samples` calls recorded.
+        """
+        with self._lock:
+            samples = sorted(self._samples.get(name, ()))
+        if not samples or len(samples) < min_samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * percent / 100))
+        return samples[index]
+
+
+class HedgeBudget:
+    """
+    Limits number of hedged requests to a fraction of all requests.
+
+    Each request deposits `ratio` tokens, up to `burst` tokens, and each
+    hedged request takes one token.
+    """
+
+    def __init__(self, ratio: float, burst: float):
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = burst
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        """
+        Takes token for single hedged request.
+
+        :return: Flag indicating if request can be hedged.
+        """
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+latencies = LatencyHistory(int(config.ST_HEDGE_HISTORY))
+hedge_budget = HedgeBudget(float(config.ST_HEDGE_BUDGET),
+                           float(config.ST_HEDGE_BURST))
+_counters = Counter()
+_counters_lock = threading.Lock()
+
+
+def _count(name: str):
+    with _counters_lock:
+        _counters[name] += 1
+
+
+def stats() -> Dict[str, int]:
+    """
+    Returns number of hedged requests and number of those that responded
+    before original request.
+    """
+    return {'hedged': _counters['hedged'], 'hedge_wins': _counters['wins']}
+
+
+def _hedge_after(name: str) -> Optional[float]:
+    """
+    Returns number of seconds after which request to node should be hedged,
+    based on its latency history, or None if it should not be hedged.
+    """
+    if float(config.ST_HEDGE_BUDGET) <= 0:
+        return None
+    return latencies.percentile(name, float(config.ST_HEDGE_PERCENTILE),
+                                int(config.ST_HEDGE_MIN_SAMPLES))
+
+
+def _scatter(nodes: List, call: Callable, timeout: Optional[float],
+             hedge: bool,
+             skip_unhealthy: bool) -> Iterator[Tuple[int, NodeResult]]:
+    """
+    Calls provided function for each node concurrently and yields index of
+    node with its result, as soon as node finishes. Nodes that did not
+    finish in `timeout` seconds are yielded last, as timed out.
+
+    If `hedge` is True, node that is slower than usual is called once more,
+    and whichever call finishes first is used.
+
+    If `skip_unhealthy` is True, nodes known to be unhealthy are not called
+    and are yielded first, as failed.
+    """
+    if skip_unhealthy:
+        healthy = []
+        for i, node in enumerate(nodes):
+            if getattr(node, 'healthy', True):
+                healthy.append(i)
+            else:
+                yield i, NodeResult(node.name, STATUS_ERROR, None,
+                                    ServiceUnavailable('Node is unhealthy.'),
+                                    0.0)
+        if len(healthy) < len(nodes):
+            called = [nodes[i] for i in healthy]
+            for i, result in _scatter(called, call, timeout, hedge, False):
+                yield healthy[i], result
+            return
+
+    get_executor(2 * len(nodes) if hedge else len(nodes))
+
+    def timed(node):
+        start = time.monotonic()
+        try:
+            return call(node), None, time.monotonic() - start
+        except Exception as e:
+            return None, e, time.monotonic() - start
+
+    start = time.monotonic()
+    deadline = None if timeout is None else start + timeout
+    pending = {}  # future -> node index
+    attempts = defaultdict(list)  # node index -> futures
+    hedge_at = {}  # node index -> time to send hedged request at
+    for i, node in enumerate(nodes):
+        future = submit(timed, node)
+        pending[future] = i
+        attempts[i].append(future)
+        if hedge:
+            hedge_budget.deposit()
+            after = _hedge_after(node.name)
+            if after is not None:
+                hedge_at[i] = start + after
+
+    while pending:
+        wake = list(hedge_at.values())
+        if deadline is not None:
+            wake.append(deadline)
+        wait_for = max(0, min(wake) - time.monotonic()) if wake else None
+        done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+        for future in done:
+            i = pending.pop(future, None)
+            if i is None:
+                # other call to same node finished in this round as well
+                # and was already used
+                continue
+            name = nodes[i].name
+            value, error, elapsed = future.result()
+            if error is not None:
+                if any(f in pending for f in attempts[i]):
+                    # other call to same node might still succeed
+                    continue
+                logger.warning('Request to node %s failed: %s', name, error)
+                result = NodeResult(name, STATUS_ERROR, None, error,
+                                    time.monotonic() - start)
+            else:
+                latencies.record(name, elapsed)
+                if future is not attempts[i][0]:
+                    _count('wins')
+                result = NodeResult(name, STATUS_OK, value, None,
+                                    time.monotonic() - start)
+            hedge_at.pop(i, None)
+            for other in attempts.pop(i):
+                if pending.pop(other, None) is not None:
+                    other.cancel()
+            yield i, result
+
+        now = time.monotonic()
+        if deadline is not None and now >= deadline:
+            break
+        for i, at in list(hedge_at.items()):
+            if at <= now:
+                del hedge_at[i]
+                if hedge_budget.withdraw():
+                    logger.debug('Hedging request to node %s.', nodes[i].name)
+                    _count('hedged')
+                    future = submit(timed, nodes[i])
+                    pending[future] = i
+                    attempts[i].append(future)
+
+    waited = time.monotonic() - start
+    for i, futures in attempts.items():
+        for future in futures:
+            future.cancel()
+        logger.warning('Node %s did not respond in time.', nodes[i].name)
+        yield i, NodeResult(nodes[i].name, STATUS_TIMEOUT, None, None, waited)
+
+
+def scatter(nodes: Iterable, call: Callable, timeout: Optional[float]=None,
+            hedge: bool=False,
+            skip_unhealthy: bool=True) -> List[NodeResult]:
+    """
+    Calls provided function for each node concurrently and collects results.
+
+    Failure of one node does not affect others. Nodes that did not finish in
+    `timeout` seconds are reported as timed out and their calls are
+    abandoned, so partial results are returned.
+
+    :param nodes: Nodes to call, anything with `name` attribute.
+    :param call: Function called with single node as argument.
+    :param timeout: Maximum number of seconds to wait for all nodes.
+    :param hedge:
+        If True, node that did not respond within ST_HEDGE_PERCENTILE of its
+        recent latencies is called once more, while hedge budget allows it.
+        First result is used, other call is cancelled if it did not start
+        yet, or its result is ignored. Only for idempotent calls.
+    :param skip_unhealthy:
+        If True, nodes whose `healthy` attribute is false are not called,
+        but reported as failed right away.
+    :return: Result for each node, in same order as nodes.
+    """
+    nodes = list(nodes)
+    results = [None] * len(nodes)
+    for i, result in _scatter(nodes, call, timeout, hedge, skip_unhealthy):
+        results[i] = result
+    return results
+
+
+def scatter_iter(nodes: Iterable, call: Callable,
+                 timeout: Optional[float]=None,
+                 hedge: bool=False,
+                 skip_unhealthy: bool=True) -> Iterator[NodeResult]:
+    """
+    Same as :func:`scatter`, but yields result of each node as soon as it
+    finishes. Skipped unhealthy nodes are yielded first and nodes that timed
+    out are yielded last.
+    """
+    for _, result in _scatter(list(nodes), call, timeout, hedge,
+                              skip_unhealthy):
+        yield result
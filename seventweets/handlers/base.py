@@ -1,6 +1,7 @@
-from flask import Blueprint, current_app, jsonify
+from flask import Blueprint, current_app, jsonify, request
 from seventweets.exceptions import error_handler
-from seventweets import tweet
+from seventweets.handlers.utils import ensure_bool
+from seventweets import client, fanout, tweet
 
 base = Blueprint('base', __name__)
 
@@ -8,14 +9,40 @@ base = Blueprint('base', __name__)
 @base.route('/')
 @error_handler
 def index():
-    original = tweet.count('original')
-    retweets = tweet.count('retweet')
+    approximate = ensure_bool(request.args.get('approximate'))
+    if approximate is None:
+        approximate = ensure_bool(
+            str(current_app.config['ST_STATS_APPROXIMATE']))
+    stats = tweet.stats(
+        approximate=approximate,
+        ttl=float(current_app.config['ST_STATS_TTL']),
+    )
     return jsonify({
         'name': current_app.config['ST_OWN_NAME'],
         'address': current_app.config['ST_OWN_ADDRESS'],
-        'stats': {
-            'original': original,
-            'retweets': retweets,
-            'total': original + retweets,
-        }
+        'stats': stats,
+    })
+
+
+@base.route('health')
+@error_handler
+def health():
+    """
+    Lightweight endpoint other nodes probe to check this node is alive.
+    """
+    return jsonify({'name': current_app.config['ST_OWN_NAME']})
+
+
+@base.route('stats')
+@error_handler
+def cache_stats():
+    """
+    Returns usage statistics of in-process caches and requests to other
+    nodes.
+    """
+    return jsonify({
+        'originals_cache': tweet.originals_cache.stats(),
+        'search_cache': tweet.search_cache.stats(),
+        'fanout': fanout.stats(),
+        'http_pool': client.pool_stats(),
     })
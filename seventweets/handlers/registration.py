@@ -15,7 +15,8 @@ register = Blueprint('register', __name__)
 
 @register.route('/', methods=['GET'])
 def list_registered():
-    return jsonify([n.to_dict() for n in registry.get_all()])
+    return jsonify([dict(n.to_dict(), breaker=n.breaker.stats())
+                    for n in registry.get_all()])
 
 
 @register.route('/', methods=['POST'])
@@ -73,8 +74,9 @@ def join_network():
     # no need for fine-tuned exception handling
     except Exception:
         raise BadGateway("The node you provided is unreachable.")
-    registry.delete_all()
-    [registry.add(node['name'], node['address']) for node in network_nodes if
-     node['name'] != current_app.config['ST_OWN_NAME']]
+    registry.replace_all(
+        (node['name'], node['address']) for node in network_nodes
+        if node['name'] != current_app.config['ST_OWN_NAME']
+    )
 
     return jsonify('Node successfully joined network.')
@@ -1,8 +1,20 @@
 import logging
-from flask import Blueprint, request, jsonify
-from seventweets.exceptions import error_handler, BadRequest
-from seventweets.handlers.utils import ensure_dt, ensure_bool
-from seventweets import tweet
+import itertools
+from flask import Blueprint, request, jsonify, current_app
+from seventweets.exceptions import (
+    error_handler, BadRequest, Forbidden, HttpException,
+)
+from seventweets.handlers.utils import (
+    ensure_dt, ensure_bool, ensure_choice, ensure_ids, page_args, paginated,
+    streamed, events,
+)
+from seventweets.db import (
+    SEARCH_MODES, SEARCH_SUBSTRING, SEARCH_ORDERS, ORDER_CREATED,
+    ORDER_RELEVANCE,
+)
+from seventweets.client import NODES_TIMED_OUT_HEADER, NODES_FAILED_HEADER
+from seventweets.fanout import STATUS_OK, STATUS_TIMEOUT, STATUS_ERROR
+from seventweets import registry, tweet
 from seventweets.auth import auth
 
 
@@ -14,9 +26,38 @@ logger = logging.getLogger(__name__)
 @error_handler
 def get_all():
     """
-    Returns list of all tweets from this server.
+    Returns list of all tweets from this server, newest first.
+
+    If `limit` or `cursor` query arguments are provided, single page is
+    returned and cursor for the next one is in `X-Next-Cursor` header.
+
+    If `stream` query argument is provided (either "json" or "ndjson"), all
+    tweets are streamed to client as they are read from database.
+
+    If `ids` query argument is provided (comma separated list of IDs), only
+    tweets with those IDs are returned, together with list of IDs that were
+    not found.
     """
-    return jsonify([t.to_dict() for t in tweet.get_all()])
+    ids = ensure_ids(request.args.get('ids', None) or None,
+                     int(current_app.config['ST_BATCH_MAX_SIZE']))
+    timeout = float(current_app.config['ST_HYDRATE_TIMEOUT'])
+    if ids is not None:
+        found, missing = tweet.by_ids(ids)
+        tweet.hydrate(found, timeout)
+        return jsonify({
+            'tweets': [t.to_dict() for t in found],
+            'missing': missing,
+        })
+    fmt = request.args.get('stream', None) or None
+    if fmt is not None:
+        chunk_size = int(current_app.config['ST_STREAM_CHUNK_SIZE'])
+        all_tweets = tweet.hydrated(tweet.stream_all(chunk_size),
+                                    chunk_size, timeout)
+        return streamed((t.to_dict() for t in all_tweets), fmt)
+    limit, after = page_args(request.args)
+    results = tweet.get_all(limit, after)
+    tweet.hydrate(results, timeout)
+    return paginated(results, limit)
 
 
 @tweets.route('/<int:tweet_id>', methods=['GET'])
@@ -26,7 +67,9 @@ def get_single(tweet_id):
     Returns single tweet by ID.
     :param tweet_id: ID of the tweet to get.
     """
-    return jsonify(tweet.by_id(tweet_id).to_dict())
+    found = tweet.by_id(tweet_id)
+    tweet.hydrate([found], float(current_app.config['ST_HYDRATE_TIMEOUT']))
+    return jsonify(found.to_dict())
 
 
 @tweets.route('/', methods=['POST'])
@@ -43,6 +86,45 @@ def create_tweet():
     return jsonify(new_tweet.to_dict()), 201
 
 
+@tweets.route('/batch', methods=['POST'])
+@error_handler
+def create_batch():
+    """
+    Creates multiple tweets and retweets at once. Body is list of items in
+    same format as bodies for creating single tweet or retweet.
+
+    Response contains result for each item, in same order as in body. Valid
+    items are created even if some are rejected, in which case response
+    status is 207.
+    """
+    body = request.get_json(force=True)
+    if not isinstance(body, list):
+        raise BadRequest('Invalid body: expected list of tweets.')
+    max_size = int(current_app.config['ST_BATCH_MAX_SIZE'])
+    if len(body) > max_size:
+        raise BadRequest(f'Batch size exceeds {max_size} tweets.')
+
+    results = []
+    for result in tweet.create_many(body):
+        if isinstance(result, HttpException):
+            results.append({'status': result.CODE, 'message': str(result)})
+        else:
+            # content of retweets is not resolved, that would require
+            # request to other node for each of them
+            results.append({
+                'status': 201,
+                'id': result.id,
+                'type': result.type,
+                'created_at': result.created_at.isoformat('T') + 'Z',
+            })
+    failed = sum(1 for r in results if r['status'] != 201)
+    return jsonify({
+        'created': len(results) - failed,
+        'failed': failed,
+        'results': results,
+    }), 207 if failed else 201
+
+
 @tweets.route('/<int:tweet_id>', methods=['PUT'])
 @error_handler
 def modify(tweet_id):
@@ -78,11 +160,44 @@ def retweet():
     return jsonify(tweet.retweet(body['server'], body['id']).to_dict())
 
 
+@tweets.route('/invalidate', methods=['POST'])
+@error_handler
+def invalidate():
+    """
+    Called by other nodes when their tweets are changed or deleted, so that
+    cached copies of them are not used any more. Only registered nodes can
+    invalidate their tweets.
+    """
+    body = request.get_json(force=True)
+    if not isinstance(body, dict) or 'server' not in body or 'ids' not in body:
+        raise BadRequest('Missing either "server" or "ids" from body.')
+    if registry.get_node(body['server']) is None:
+        raise Forbidden(f'Node {body["server"]} is not registered.')
+    tweet.invalidate_originals(body['server'], body['ids'])
+    return '', 204
+
+
 @tweets.route('/search', methods=['GET'])
 @error_handler
 def search_single():
     """
     Performs search in database for tweets in this node only.
+
+    Supports same pagination arguments as listing tweets. Cursor can not be
+    used with distributed search. Results of distributed search are merged
+    in requested order, without duplicates and up to the limit, and each
+    has name of node it comes from. Only nodes that responded in time are
+    included, names of other nodes are in `X-Nodes-Timed-Out` and
+    `X-Nodes-Failed` headers.
+
+    If `stream` query argument is provided (either "ndjson" or "sse"),
+    results of each node are sent as separate "results" frame as soon as
+    node responds, starting with this node. Last frame is "summary" with
+    status and timing of each node. Results are not ordered across nodes.
+
+    Content is matched as substring by default. With `mode=fulltext`, full
+    text index is used to match whole words and results can be ordered by
+    relevance with `order=relevance`. Cursor can not be used then.
     """
     content = request.args.get('content', None) or None
     created_from = ensure_dt(request.args.get('created_from', None) or None)
@@ -91,7 +206,78 @@ def search_single():
     modified_to = ensure_dt(request.args.get('modified_to', None) or None)
     retweets = ensure_bool(request.args.get('retweets', None) or None)
     all = ensure_bool(request.args.get('all', None) or None)
+    mode = ensure_choice(request.args.get('mode', None) or None,
+                         SEARCH_MODES, SEARCH_SUBSTRING)
+    order = ensure_choice(request.args.get('order', None) or None,
+                          SEARCH_ORDERS, ORDER_CREATED)
+    limit, after = page_args(request.args)
+    if all and after is not None:
+        raise BadRequest('Cursor is not supported for distributed search.')
+    if order == ORDER_RELEVANCE and after is not None:
+        raise BadRequest('Cursor is not supported when ordering by relevance.')
+
+    hydrate_timeout = float(current_app.config['ST_HYDRATE_TIMEOUT'])
+    fmt = request.args.get('stream', None) or None
+    if fmt is not None:
+        if after is not None:
+            raise BadRequest('Cursor is not supported for streamed search.')
+        results = tweet.search_stream(
+            content, created_from, created_to, modified_from, modified_to,
+            retweets, limit, mode, order,
+            float(current_app.config['ST_FANOUT_TIMEOUT']), others=all,
+        )
+        # this node is searched before response is started
+        local = next(results)
+        tweet.hydrate(local.value, hydrate_timeout)
+        return events(_search_frames(local, results), fmt)
+    if all:
+        results, node_results = tweet.search_all(
+            content, created_from, created_to, modified_from, modified_to,
+            retweets, limit, mode, order,
+            float(current_app.config['ST_FANOUT_TIMEOUT']),
+        )
+        tweet.hydrate(results, hydrate_timeout)
+        resp = jsonify([t.to_dict() for t in results])
+        for header, status in ((NODES_TIMED_OUT_HEADER, STATUS_TIMEOUT),
+                               (NODES_FAILED_HEADER, STATUS_ERROR)):
+            names = [r.name for r in node_results if r.status == status]
+            if names:
+                resp.headers[header] = ','.join(names)
+        return resp
 
     results = tweet.search(content, created_from, created_to,
-                           modified_from, modified_to, retweets, all)
-    return jsonify([t.to_dict() for t in results])
+                           modified_from, modified_to, retweets, False,
+                           limit, after, mode, order)
+    tweet.hydrate(results, hydrate_timeout)
+    # next page can not be requested when ordering by relevance
+    return paginated(results, None if order == ORDER_RELEVANCE else limit)
+
+
+def _search_frames(local, others):
+    """
+    Produces frames of streamed search: results of each node that responded
+    and summary of all nodes at the end.
+
+    :param local: Search result of this node.
+    :param others: Generator of search results of other nodes.
+    """
+    summary = []
+    for result in itertools.chain([local], others):
+        node = {
+            'node': result.name,
+            'status': result.status,
+            'elapsed_ms': round(result.elapsed * 1000, 3),
+        }
+        if result.status == STATUS_OK:
+            node['count'] = len(result.value)
+            yield 'results', {
+                'node': result.name,
+                'tweets': [t.to_dict() for t in result.value],
+            }
+        elif result.error is not None:
+            node['error'] = str(result.error)
+        summary.append(node)
+    yield 'summary', {
+        'nodes': summary,
+        'count': sum(n.get('count', 0) for n in summary),
+    }
@@ -1,4 +1,9 @@
+import json
+import base64
+import binascii
 from datetime import datetime
+from flask import jsonify, Response, stream_with_context
+from seventweets.client import NEXT_CURSOR_HEADER
 from seventweets.exceptions import BadRequest
 
 
@@ -6,9 +11,9 @@ def ensure_dt(val):
     """
     Converts query argument to datetime object.
 
-    If None is provided, it will be returned. Otherwise, conversion to in is
-    attempted and that int is treated as unix timestamp, which is converted
-    to datetime.datetime.
+    If None is provided, it will be returned. Otherwise, conversion to number
+    is attempted and that number is treated as unix timestamp, which is
+    converted to datetime.datetime.
 
     :param val: Value to convert to datetime.
     :return: datetime object from provided value.
@@ -17,15 +22,15 @@ def ensure_dt(val):
     if val is None:
         return None
     try:
-        int_val = int(val)
+        num_val = float(val)
     except ValueError:
-        raise BadRequest(f'Expected integer, got: {val}')
+        raise BadRequest(f'Expected number, got: {val}')
 
     try:
-        dt_val = datetime.fromtimestamp(int_val)
+        dt_val = datetime.fromtimestamp(num_val)
         return dt_val
     except Exception:
-        raise BadRequest(f'Unable to convert {int_val} to datetime.')
+        raise BadRequest(f'Unable to convert {num_val} to datetime.')
 
 
 def ensure_bool(val):
@@ -42,3 +47,235 @@ def ensure_bool(val):
     if val is None:
         return None
     return val.lower() == 'true'
+
+
+def ensure_choice(val, choices, default):
+    """
+    Checks if query argument is one of allowed values.
+
+    If None is provided, default is returned.
+
+    :param val: Value to check.
+    :param choices: Allowed values.
+    :param default: Value to use if none is provided.
+    :return: Provided value or default.
+    :raises BadRequest: If provided value is not allowed.
+    """
+    if val is None:
+        return default
+    if val not in choices:
+        raise BadRequest(f'Expected one of: {", ".join(choices)}, got: {val}')
+    return val
+
+
+def ensure_int(val):
+    """
+    Converts query argument to integer.
+
+    If None is provided, it will be returned.
+
+    :param val: Value to convert to integer.
+    :return: int from provided value.
+    :raises BadRequest: If provided value could not be converted to int.
+    """
+    if val is None:
+        return None
+    try:
+        return int(val)
+    except ValueError:
+        raise BadRequest(f'Expected integer, got: {val}')
+
+
+def ensure_ids(val, max_count):
+    """
+    Converts comma separated query argument to list of integer IDs.
+
+    If None is provided, it will be returned.
+
+    :param val: Value to convert to list of IDs.
+    :param max_count: Maximum number of IDs allowed.
+    :return: List of IDs from provided value.
+    :raises BadRequest:
+        If some of the IDs is not an integer or there are too many of them.
+    """
+    if val is None:
+        return None
+    ids = [ensure_int(v.strip()) for v in val.split(',') if v.strip()]
+    if len(ids) > max_count:
+        raise BadRequest(f'Expected at most {max_count} IDs, got: {len(ids)}')
+    return ids
+
+
+def encode_cursor(tweet):
+    """
+    Creates opaque pagination cursor pointing to provided tweet. Cursor
+    encodes keyset (created_at, id) of the tweet.
+
+    :param tweet: Last tweet on the page.
+    :return: Cursor for the next page.
+    """
+    raw = f'{tweet.created_at.isoformat()}|{tweet.id}'
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(val):
+    """
+    Converts pagination cursor created by :func:`encode_cursor` back to
+    keyset.
+
+    If None is provided, it will be returned.
+
+    :param val: Cursor received from client.
+    :return: Keyset (created_at, id).
+    :raises BadRequest: If cursor is not valid.
+    """
+    if val is None:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(val.encode('ascii')).decode('utf-8')
+        created_at, id_ = raw.split('|')
+        return datetime.fromisoformat(created_at), int(id_)
+    except (ValueError, UnicodeError, binascii.Error):
+        raise BadRequest(f'Invalid cursor: {val}')
+
+
+def page_args(args, default_limit=100, max_limit=1000):
+    """
+    Reads pagination arguments (limit and cursor) from query arguments.
+
+    If neither is provided, (None, None) is returned, meaning that
+    pagination is not requested.
+
+    :param args: Query arguments of the request.
+    :param default_limit: Limit to use if only cursor is provided.
+    :param max_limit: Maximum allowed page size.
+    :return: Tuple of (limit, keyset).
+    :raises BadRequest: If arguments are not valid.
+    """
+    limit = ensure_int(args.get('limit', None) or None)
+    after = decode_cursor(args.get('cursor', None) or None)
+    if limit is None and after is not None:
+        limit = default_limit
+    if limit is not None and not 0 < limit <= max_limit:
+        raise BadRequest(f'Limit has to be between 1 and {max_limit}.')
+    return limit, after
+
+
+def paginated(results, limit):
+    """
+    Creates JSON response from page of tweets. If page is full, cursor for
+    next page is returned in `X-Next-Cursor` header.
+
+    :param results: Tweets on current page.
+    :param limit: Requested page size.
+    :return: Flask response.
+    """
+    resp = jsonify([t.to_dict() for t in results])
+    if limit is not None and len(results) == limit:
+        resp.headers[NEXT_CURSOR_HEADER] = encode_cursor(results[-1])
+    return resp
+
+
+STREAM_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def _buffered(chunks, size=64 * 1024):
+    """
+    Groups small string chunks into bigger ones, so that each write to
+    client socket carries meaningful amount of data.
+
+    :param chunks: Iterable of strings.
+    :param size: Minimal size of produced chunk, except for the last one.
+    :return: Generator of joined chunks.
+    """
+    buf = []
+    buf_len = 0
+    for chunk in chunks:
+        buf.append(chunk)
+        buf_len += len(chunk)
+        if buf_len >= size:
+            yield ''.join(buf)
+            buf = []
+            buf_len = 0
+    if buf:
+        yield ''.join(buf)
+
+
+def _json_array(items):
+    yield '['
+    for i, item in enumerate(items):
+        if i > 0:
+            yield ','
+        yield json.dumps(item)
+    yield ']'
+
+
+def _ndjson(items):
+    for item in items:
+        yield json.dumps(item)
+        yield '\n'
+
+
+def streamed(items, fmt):
+    """
+    Creates streaming response that serializes items as they are produced,
+    either as single JSON array or as newline delimited JSON.
+
+    :param items: Iterable of JSON serializable objects.
+    :param fmt: Either 'json' or 'ndjson'.
+    :return: Flask response.
+    :raises BadRequest: If format is not supported.
+    """
+    if fmt not in STREAM_FORMATS:
+        raise BadRequest(f'Unsupported stream format: {fmt}. Supported are: '
+                         f'{", ".join(STREAM_FORMATS)}')
+    serializer = _json_array if fmt == 'json' else _ndjson
+    return Response(
+        stream_with_context(_buffered(serializer(items))),
+        mimetype=STREAM_FORMATS[fmt],
+    )
+
+
+EVENT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'sse': 'text/event-stream',
+}
+
+
+def _ndjson_events(frames):
+    for event, data in frames:
+        yield json.dumps(dict(data, event=event)) + '\n'
+
+
+def _sse_events(frames):
+    for event, data in frames:
+        yield f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+def events(frames, fmt):
+    """
+    Creates streaming response that sends each frame to client as soon as it
+    is produced, either as newline delimited JSON or as Server-Sent Events.
+    Unlike :func:`streamed`, frames are not buffered.
+
+    :param frames:
+        Iterable of (event, data) tuples. Event is name of frame type and
+        data is JSON serializable dictionary. In newline delimited JSON,
+        event is included in data as "event" key.
+    :param fmt: Either 'ndjson' or 'sse'.
+    :return: Flask response.
+    :raises BadRequest: If format is not supported.
+    """
+    if fmt not in EVENT_FORMATS:
+        raise BadRequest(f'Unsupported stream format: {fmt}. Supported are: '
+                         f'{", ".join(EVENT_FORMATS)}')
+    serializer = _ndjson_events if fmt == 'ndjson' else _sse_events
+    resp = Response(stream_with_context(serializer(frames)),
+                    mimetype=EVENT_FORMATS[fmt])
+    resp.headers['Cache-Control'] = 'no-cache'
+    # ask proxies not to buffer response
+    resp.headers['X-Accel-Buffering'] = 'no'
+    return resp
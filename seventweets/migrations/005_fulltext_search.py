@@ -0,0 +1,19 @@
+"""
+full text search index on tweet content
+"""
+id = 5
+
+
+def upgrade(cursor):
+    # Expression has to match `TWEET_TSVECTOR` in `seventweets.db.backends.pg`
+    # exactly, otherwise planner will not use this index.
+    cursor.execute('''
+        CREATE INDEX tweets_tweet_fts_idx ON tweets
+        USING GIN (to_tsvector('simple', coalesce(tweet, '')));
+    ''')
+
+
+def downgrade(cursor):
+    cursor.execute('''
+        DROP INDEX tweets_tweet_fts_idx;
+    ''')
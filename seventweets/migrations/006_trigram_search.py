@@ -0,0 +1,29 @@
+"""
+trigram index for substring search on tweet content
+"""
+id = 6
+
+
+def upgrade(cursor):
+    # pg_trgm is contrib extension and might not be installed, or user might
+    # not be allowed to create it. Substring search works without index, so
+    # in that case migration is applied without it.
+    cursor.execute('''
+        DO $$
+        BEGIN
+            CREATE EXTENSION IF NOT EXISTS pg_trgm;
+            CREATE INDEX tweets_tweet_trgm_idx ON tweets
+            USING GIN (tweet gin_trgm_ops);
+        EXCEPTION WHEN OTHERS THEN
+            RAISE WARNING USING
+                MESSAGE = 'Trigram index not created: ' || SQLERRM;
+        END
+        $$;
+    ''')
+
+
+def downgrade(cursor):
+    # extension is left in place since something else might be using it
+    cursor.execute('''
+        DROP INDEX IF EXISTS tweets_tweet_trgm_idx;
+    ''')
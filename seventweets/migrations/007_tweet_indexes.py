@@ -0,0 +1,31 @@
+"""
+indexes for ordering and filtering tweets by time and type
+"""
+id = 7
+
+
+def upgrade(cursor):
+    # Column order and direction match `ORDER BY created_at DESC, id DESC`
+    # used for listing and keyset pagination, so it can be read in order.
+    cursor.execute('''
+        CREATE INDEX tweets_created_at_id_idx ON tweets
+        (created_at DESC, id DESC);
+    ''')
+    cursor.execute('''
+        CREATE INDEX tweets_modified_at_idx ON tweets (modified_at);
+    ''')
+    cursor.execute('''
+        CREATE INDEX tweets_type_idx ON tweets (type);
+    ''')
+
+
+def downgrade(cursor):
+    cursor.execute('''
+        DROP INDEX tweets_type_idx;
+    ''')
+    cursor.execute('''
+        DROP INDEX tweets_modified_at_idx;
+    ''')
+    cursor.execute('''
+        DROP INDEX tweets_created_at_id_idx;
+    ''')
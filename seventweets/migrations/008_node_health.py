@@ -0,0 +1,22 @@
+"""
+health of nodes, maintained by background prober
+"""
+id = 8
+
+
+def upgrade(cursor):
+    # Latency is exponentially weighted moving average of probe response
+    # times in seconds, failures is number of consecutive failed probes.
+    cursor.execute('''
+        ALTER TABLE nodes
+        ADD COLUMN latency DOUBLE PRECISION,
+        ADD COLUMN failures INTEGER NOT NULL DEFAULT 0;
+    ''')
+
+
+def downgrade(cursor):
+    cursor.execute('''
+        ALTER TABLE nodes
+        DROP COLUMN failures,
+        DROP COLUMN latency;
+    ''')
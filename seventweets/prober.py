@@ -0,0 +1,143 @@
+"""
+Background health checks of other nodes.
+
+Other nodes are pinged periodically, so that nodes which stopped responding
+are known before user request is sent to them. Results are stored in
+database, so all processes share them, and only one process, holding
+ST_PROBE_LOCK_FILE, sends the probes.
+"""
+import time
+import random
+import logging
+import threading
+from functools import partial
+from typing import Callable, Dict, Iterable, List, Tuple
+from seventweets import config, registry
+from seventweets.db import get_db, get_ops, end_unit_of_work
+from seventweets.fanout import scatter, STATUS_OK
+from seventweets.utils import FileLock
+
+logger = logging.getLogger(__name__)
+
+
+class Schedule:
+    """
+    Decides when each node is probed next.
+
+    Node is probed every `min_interval` seconds, and interval doubles after
+    each successful probe, up to `max_interval`. Failed probe resets it, so
+    failing nodes are checked often and their recovery is noticed quickly.
+    Intervals are randomized by up to `jitter` fraction, so that probes do
+    not all happen at the same time.
+    """
+
+    def __init__(self, min_interval: float, max_interval: float,
+                 jitter: float=0.0, rand: Callable[[], float]=random.random):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self._rand = rand
+        self._next = {}  # type: Dict[str, Tuple[float, float]]
+
+    def due(self, names: Iterable[str], now: float) -> List[str]:
+        """
+        Returns names of nodes that should be probed now. Nodes not probed
+        yet are always due. Nodes that are not in `names` are forgotten.
+        """
+        names = list(names)
+        self._next = {n: self._next[n] for n in names if n in self._next}
+        return [n for n in names if n not in self._next or
+                self._next[n][0] <= now]
+
+    def record(self, name: str, ok: bool, now: float):
+        """
+        Schedules next probe of node after probe finished.
+
+        :param name: Name of probed node.
+        :param ok: Flag indicating if probe succeeded.
+        :param now: Time probe finished at.
+        """
+        _, interval = self._next.get(name, (None, None))
+        if ok and interval is not None:
+            interval = min(self.max_interval, interval * 2)
+        else:
+            interval = self.min_interval
+        spread = 1 + self.jitter * (2 * self._rand() - 1)
+        self._next[name] = (now + interval * spread, interval)
+
+    def wait_time(self, now: float) -> float:
+        """
+        Returns number of seconds until next probe is due. It is never more
+        than `min_interval`, so that new nodes are probed soon.
+        """
+        if not self._next:
+            return self.min_interval
+        next_at = min(at for at, _ in self._next.values())
+        return max(0.0, min(self.min_interval, next_at - now))
+
+
+class Prober:
+    """
+    Probes other nodes from background thread.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.lock = FileLock(config.ST_PROBE_LOCK_FILE)
+        self.schedule = Schedule(float(config.ST_PROBE_MIN_INTERVAL),
+                                 float(config.ST_PROBE_MAX_INTERVAL),
+                                 float(config.ST_PROBE_JITTER))
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='prober',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.lock.release()
+
+    def _run(self):
+        wait = 0.0
+        while not self._stopped.wait(wait):
+            if not self.lock.acquire():
+                # other process probes nodes, check if it is still alive
+                # from time to time
+                wait = self.schedule.max_interval
+                continue
+            try:
+                with self.app.app_context():
+                    wait = self.probe()
+            except Exception:
+                logger.exception('Probing nodes failed.')
+                wait = self.schedule.min_interval
+
+    def probe(self) -> float:
+        """
+        Probes all nodes that are due and stores results.
+
+        :return: Number of seconds until next probe is due.
+        """
+        nodes = registry.get_all()
+        due = set(self.schedule.due([n.name for n in nodes],
+                                    time.monotonic()))
+        nodes = [n for n in nodes if n.name in due]
+        if nodes:
+            results = scatter(nodes, lambda n: n.client.ping(),
+                              float(config.ST_PROBE_TIMEOUT),
+                              skip_unhealthy=False)
+            finished = time.monotonic()
+            checks = []
+            for result in results:
+                ok = result.status == STATUS_OK
+                self.schedule.record(result.name, ok, finished)
+                checks.append((result.name, result.value if ok else None))
+            rows = get_db().do(partial(get_ops().update_nodes_health, checks,
+                                       float(config.ST_PROBE_EWMA_ALPHA)))
+            end_unit_of_work(commit=True)
+            registry.record_health(rows)
+        return self.schedule.wait_time(time.monotonic())
@@ -1,10 +1,14 @@
+import time
 import logging
+import threading
 from functools import partial
 from seventweets import config
-from seventweets.db import get_db, get_ops
+from seventweets.db import get_db, get_ops, after_commit
 from seventweets.client import Client
+from seventweets.breaker import CircuitBreaker, OPEN
 from seventweets.exceptions import Conflict
-from typing import List
+from seventweets.fanout import scatter, NodeResult, STATUS_OK
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 
 
 logger = logging.getLogger(__name__)
@@ -14,19 +18,62 @@ class Node:
     """
     Node represents remote instance of seventweets service.
     """
-    def __init__(self, name, address, last_checked_at):
+    def __init__(self, name, address, last_checked_at, latency=None,
+                 failures=0):
         self.name = name
         self.address = address
         self.last_checked_at = last_checked_at
+        self.latency = latency
+        self.failures = failures
+        self.breaker = CircuitBreaker(
+            window=int(config.ST_BREAKER_WINDOW),
+            min_calls=int(config.ST_BREAKER_MIN_CALLS),
+            failure_rate=float(config.ST_BREAKER_FAILURE_RATE),
+            reset_timeout=float(config.ST_BREAKER_RESET_TIMEOUT),
+        )
         self._client = None
 
     @property
     def client(self):
         if self._client is None:
-            self._client = Client(self.address,
-                                  cleanup_callback=partial(delete, self.name))
+            self._client = Client(
+                self.address,
+                cleanup_callback=partial(delete, self.name),
+                timeout=float(config.ST_NODE_TIMEOUT),
+                connect_timeout=float(config.ST_NODE_CONNECT_TIMEOUT),
+                breaker=self.breaker,
+                remove_after=float(config.ST_NODE_REMOVE_AFTER),
+            )
         return self._client
 
+    def set_health(self, last_checked_at, latency, failures):
+        """
+        Sets health of node, as recorded by health prober.
+
+        :param last_checked_at: Time node was last probed at.
+        :param latency: Moving average of probe latency in seconds.
+        :param failures: Number of consecutive failed probes.
+        """
+        self.last_checked_at = last_checked_at
+        self.latency = latency
+        self.failures = failures
+
+    @property
+    def healthy(self) -> bool:
+        """
+        Node is healthy unless its last ST_PROBE_UNHEALTHY_AFTER probes
+        failed or its circuit breaker is open.
+        """
+        return (self.failures < int(config.ST_PROBE_UNHEALTHY_AFTER) and
+                self.breaker.state != OPEN)
+
+    def priority(self):
+        """
+        Returns key nodes are sorted by, so that healthy nodes with lowest
+        latency come first.
+        """
+        return (not self.healthy, self.latency is None, self.latency or 0)
+
     def to_dict(self):
         return {
             'name': self.name,
@@ -34,20 +81,102 @@ class Node:
         }
 
 
-def get_node(name: str) -> Node:
+# Nodes by name, cached in process so that lookups do not query database
+# and nodes keep their clients (and open connections) between requests.
+# Cache is replaced as a whole on every change, so readers do not need lock.
+# Changes done by this process are written through, changes done by other
+# processes are picked up when cache is refreshed.
+_nodes = None  # type: Optional[Dict[str, Node]]
+_loaded_at = 0.0
+_lock = threading.Lock()
+
+
+def _load(db=None) -> Dict[str, Node]:
+    """
+    Loads all nodes from database into cache. Existing nodes with unchanged
+    address are kept, so their clients are reused.
+    """
+    global _nodes, _loaded_at
+    if not db:
+        db = get_db()
+    rows = db.do(get_ops().get_all_nodes)
+    with _lock:
+        old = _nodes or {}
+        nodes = {}
+        for row in rows:
+            name, address = row[:2]
+            node = old.get(name)
+            if node is None or node.address != address:
+                node = Node(*row)
+            else:
+                node.set_health(*row[2:])
+            nodes[name] = node
+        _nodes = nodes
+        _loaded_at = time.monotonic()
+    return nodes
+
+
+def _cached(db=None) -> Dict[str, Node]:
+    """
+    Returns cached nodes, loading them if they were not loaded yet or were
+    loaded more than ST_REGISTRY_REFRESH seconds ago.
+    """
+    nodes = _nodes
+    refresh = float(config.ST_REGISTRY_REFRESH)
+    if nodes is None or time.monotonic() - _loaded_at > refresh:
+        nodes = _load(db)
+    return nodes
+
+
+def _update(fn: Callable[[Dict[str, Node]], None]):
+    """
+    Applies change to copy of cached nodes and replaces cache with it, once
+    the change is committed to database. If nodes were not loaded yet,
+    nothing is done, they will be loaded with the change on first use.
+    """
+    def apply():
+        global _nodes
+        with _lock:
+            if _nodes is not None:
+                nodes = dict(_nodes)
+                fn(nodes)
+                _nodes = nodes
+    after_commit(apply)
+
+
+def invalidate():
+    """
+    Drops cached nodes, so they are loaded from database on next use.
+    """
+    global _nodes
+    with _lock:
+        _nodes = None
+
+
+def get_node(name: str) -> Optional[Node]:
     """
-    Returns list of all nodes.
+    Returns node with provided name, or None if it is not registered.
     """
-    return Node(*get_db().do(partial(get_ops().get_node, name)))
+    return _cached().get(name)
 
 
 def get_all(db=None) -> List[Node]:
-    if not db:
-        db = get_db()
     """
-    Returns list of all nodes.
+    Returns list of all nodes, healthy ones with lowest latency first.
+    """
+    return sorted(_cached(db).values(), key=Node.priority)
+
+
+def record_health(rows):
+    """
+    Updates health of cached nodes with rows returned by
+    :meth:`~seventweets.db.Operations.update_nodes_health`.
     """
-    return [Node(*args) for args in db.do(get_ops().get_all_nodes)]
+    nodes = _nodes or {}
+    for row in rows:
+        node = nodes.get(row[0])
+        if node is not None and node.address == row[1]:
+            node.set_health(*row[2:])
 
 
 def add(name: str, address: str, update: bool=False) -> Node:
@@ -68,10 +197,26 @@ def add(name: str, address: str, update: bool=False) -> Node:
         if not update:
             raise Conflict('Node with same name already registered.')
         else:
-            return Node(*get_db().do(
+            node = Node(*get_db().do(
                 partial(get_ops().update_node, name, address)
             ))
-    return Node(*get_db().do(partial(get_ops().insert_node, name, address)))
+    else:
+        node = Node(*get_db().do(
+            partial(get_ops().insert_node, name, address)
+        ))
+
+    def put(nodes):
+        existing = nodes.get(name)
+        if existing is not None and existing.address == node.address:
+            existing.set_health(node.last_checked_at, node.latency,
+                                node.failures)
+        else:
+            nodes[name] = node
+    _update(put)
+    existing = (_nodes or {}).get(name)
+    if existing is not None and existing.address == node.address:
+        return existing
+    return node
 
 
 def delete(name: str) -> bool:
@@ -83,7 +228,9 @@ def delete(name: str) -> bool:
         Flag indicating if node was deleted. That might be false if node was
         not found.
     """
-    return get_db().do(partial(get_ops().delete_node, name))
+    deleted = get_db().do(partial(get_ops().delete_node, name))
+    _update(lambda nodes: nodes.pop(name, None))
+    return deleted
 
 
 def delete_all() -> bool:
@@ -94,17 +241,53 @@ def delete_all() -> bool:
         Flag indicating if nodes were deleted. That might be false if the
         list was empty previously.
     """
-    return get_db().do(get_ops().delete_all_nodes)
+    deleted = get_db().do(get_ops().delete_all_nodes)
+    _update(lambda nodes: nodes.clear())
+    return deleted
+
+
+def replace_all(nodes: Iterable[Tuple[str, str]]) -> int:
+    """
+    Replaces all nodes with provided ones, using single query to delete old
+    nodes and single query to insert new ones.
 
+    :param nodes: New nodes as (name, address) tuples.
+    :return: Number of nodes that were stored.
+    """
+    nodes = list(dict(nodes).items())
+
+    def replace(cursor):
+        get_ops().delete_all_nodes(cursor)
+        return get_ops().insert_nodes(nodes, cursor)
+    rows = get_db().do(replace)
+
+    def put(cached):
+        old = dict(cached)
+        cached.clear()
+        for row in rows:
+            node = old.get(row[0])
+            if node is None or node.address != row[1]:
+                node = Node(*row)
+            cached[node.name] = node
+    _update(put)
+    return len(rows)
 
-def unregister_all(db):
+
+def unregister_all(db) -> List[NodeResult]:
     """
-    Unregisters this node from all stored nodes and deletes them from
-    the database.
+    Unregisters this node from all stored nodes, concurrently. All nodes
+    are told, even if some of them fail, but no longer than
+    ST_LEAVE_TIMEOUT seconds is spent waiting for them.
+
+    :return: Result for each node.
     """
     logging.info("Leaving network mesh...")
-    try:
-        [node.client.unregister(config.ST_OWN_NAME) for node in get_all(db)]
-    # only server errors are possible, ignore them since we're shutting down
-    except Exception:
-        pass
+    results = scatter(get_all(db),
+                      lambda node: node.client.unregister(config.ST_OWN_NAME),
+                      float(config.ST_LEAVE_TIMEOUT), skip_unhealthy=False)
+    # failures are only logged, since we're shutting down
+    for result in results:
+        if result.status != STATUS_OK:
+            logger.warning('Failed to unregister from node %s: %s',
+                           result.name, result.error or result.status)
+    return results
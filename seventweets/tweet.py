@@ -1,15 +1,49 @@
+import time
+import heapq
 import logging
+import itertools
+import threading
 from datetime import datetime
 from functools import partial
-from concurrent.futures import ThreadPoolExecutor, wait
+from collections import defaultdict
 from seventweets.exceptions import NotFound, BadRequest
-from seventweets.db import get_db, get_ops
-from seventweets import registry
-from typing import List
+from seventweets.db import (
+    get_db, get_ops, after_commit, Keyset, NewTweet, SEARCH_SUBSTRING,
+    SEARCH_FULLTEXT, ORDER_CREATED, ORDER_RELEVANCE,
+)
+from seventweets import config, registry
+from seventweets.cache import TTLCache, SingleFlight
+from seventweets.fanout import (
+    submit, scatter, scatter_iter, NodeResult, STATUS_OK,
+)
+from typing import List, Iterable, Iterator, Dict, Union, Tuple
 
 
 logger = logging.getLogger(__name__)
 
+# Tweet counts shown on index page. Counting is done on every request to
+# index, so results are kept for a short time. Cache is cleared whenever
+# tweets are added or removed by this process.
+_stats_cache = TTLCache(maxsize=2)
+
+# Content of original tweets from other nodes, by retweet reference. Content
+# of tweets that were not found is cached as None.
+originals_cache = TTLCache(
+    maxsize=int(config.ST_ORIGINALS_CACHE_SIZE),
+    ttl=float(config.ST_ORIGINALS_CACHE_TTL),
+    stale=float(config.ST_ORIGINALS_CACHE_STALE),
+)
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+# Results of searching other nodes, by normalized query and nodes in
+# network. Concurrent identical searches wait for single search in flight.
+search_cache = TTLCache(
+    maxsize=int(config.ST_SEARCH_CACHE_SIZE),
+    ttl=float(config.ST_SEARCH_CACHE_TTL),
+)
+_search_flight = SingleFlight()
+
 
 class Tweet:
     """
@@ -24,17 +58,15 @@ class Tweet:
         self.modified_at = modified_at
         self.type = type_
         self.reference = reference
+        # content of retweets has to be fetched from node of original tweet
+        self.resolved = type_ != 'retweet'
+        # name of node tweet comes from, set for results of distributed search
+        self.origin = None
 
     @property
     def content(self):
-        if self.type == 'retweet':
-            [server, id_] = self.reference.split('#')
-            try:
-                node = registry.get_node(server)
-                original_tweet = node.client.get_tweet(id_)
-                self.tweet = original_tweet['tweet']
-            except Exception as e:
-                pass
+        if not self.resolved:
+            hydrate([self], float(config.ST_HYDRATE_TIMEOUT))
         return self.tweet
 
     def to_dict(self):
@@ -53,6 +85,8 @@ class Tweet:
         }
         if self.type == 'retweet':
             r['reference'] = self.reference
+        if self.origin is not None:
+            r['origin'] = self.origin
         return r
 
     @classmethod
@@ -61,23 +95,199 @@ class Tweet:
             id_ = tweet_dict['id']
             tweet = tweet_dict['tweet']
             type_ = tweet_dict['type']
-            created_at = datetime.strptime(
-                tweet_dict['created_at'], "%Y-%m-%dT%H:%M:%S.%fZ"
-            )
-            modified_at = datetime.strptime(
-                tweet_dict['modified_at'], "%Y-%m-%dT%H:%M:%S.%fZ"
-            )
-            return cls(id_, tweet, type_, created_at, modified_at, None)
+            created_at = _parse_dt(tweet_dict['created_at'])
+            modified_at = _parse_dt(tweet_dict['modified_at'])
+            new_tweet = cls(id_, tweet, type_, created_at, modified_at,
+                            tweet_dict.get('reference'))
+            # content was already resolved by node that sent the tweet
+            new_tweet.resolved = True
+            new_tweet.origin = tweet_dict.get('origin')
+            return new_tweet
         except KeyError:
             raise ValueError("Invalid format of tweet dict provided.")
 
 
-def get_all():
+def _parse_dt(val: str) -> datetime:
+    """
+    Parses time in format produced by :meth:`Tweet.to_dict`. Microseconds
+    are omitted by it when they are zero.
+    """
+    fmt = '%Y-%m-%dT%H:%M:%S.%fZ' if '.' in val else '%Y-%m-%dT%H:%M:%SZ'
+    return datetime.strptime(val, fmt)
+
+
+def hydrate(tweets: Iterable[Tweet], timeout: float=None):
+    """
+    Resolves content of retweets by fetching original tweets from their
+    nodes.
+
+    Originals are cached, see :data:`originals_cache`. Stale cached
+    originals are used right away and refreshed in background.
+
+    Other references are grouped by node, so each node gets single request
+    for all of its tweets, and nodes are requested concurrently. Retweets
+    whose original could not be fetched within `timeout` seconds, or whose
+    node is unknown or failed, are left without content.
+
+    :param tweets: Tweets to resolve. Tweets that are not retweets are skipped.
+    :param timeout: Maximum number of seconds to wait for other nodes.
+    """
+    pending = defaultdict(lambda: defaultdict(list))  # server -> id -> tweets
+    stale = defaultdict(set)  # server -> ids
+    for t in tweets:
+        if t.resolved:
+            continue
+        # failed retweets are not retried when serialized
+        t.resolved = True
+        server, _, id_ = t.reference.partition('#')
+        cached = originals_cache.get_entry(t.reference)
+        if cached is not None:
+            t.tweet, fresh = cached
+            if not fresh:
+                stale[server].add(id_)
+            continue
+        pending[server][id_].append(t)
+    if not pending and not stale:
+        return
+
+    nodes = {n.name: n for n in registry.get_all()}
+    for server, ids in stale.items():
+        if server in nodes:
+            _refresh_originals(nodes[server], ids)
+    for server in pending.keys() - nodes.keys():
+        logger.warning('Original tweets are on unknown node: %s', server)
+
+    results = scatter(
+        [nodes[server] for server in pending if server in nodes],
+        lambda node: _fetch_originals(node, list(pending[node.name])),
+        timeout,
+    )
+    for result in results:
+        if result.status != STATUS_OK:
+            continue
+        for id_, content in result.value.items():
+            for t in pending[result.name].get(id_, ()):
+                t.tweet = content
+
+
+def _fetch_originals(node: registry.Node, ids: List[str]) -> Dict[str, str]:
+    """
+    Fetches original tweets from node and stores them in cache. IDs of
+    tweets that do not exist are cached as well, for shorter time.
+
+    :return: Content of found tweets by their ID.
+    """
+    found, missing = node.client.get_tweets_by_ids(ids)
+    contents = {str(t['id']): t['tweet'] for t in found}
+    for id_, content in contents.items():
+        originals_cache.set(f'{node.name}#{id_}', content)
+    for id_ in missing:
+        originals_cache.set(f'{node.name}#{id_}', None,
+                            float(config.ST_ORIGINALS_NEGATIVE_TTL))
+    return contents
+
+
+def _refresh_originals(node: registry.Node, ids: Iterable[str]):
+    """
+    Refreshes cached original tweets in background. Tweets that are already
+    being refreshed are skipped.
+    """
+    with _refreshing_lock:
+        refs = {f'{node.name}#{id_}' for id_ in ids} - _refreshing
+        _refreshing.update(refs)
+    if not refs:
+        return
+
+    def done(future):
+        with _refreshing_lock:
+            _refreshing.difference_update(refs)
+        if future.exception() is not None:
+            logger.warning('Unable to refresh original tweets from: %s',
+                           node.name)
+
+    ids = [ref.partition('#')[2] for ref in refs]
+    submit(_fetch_originals, node, ids).add_done_callback(done)
+
+
+def invalidate_originals(server: str, ids: Iterable):
+    """
+    Removes cached original tweets, after node holding them reported they
+    were changed or deleted.
+
+    :param server: Name of node holding original tweets.
+    :param ids: IDs of original tweets.
+    """
+    for id_ in ids:
+        originals_cache.delete(f'{server}#{id_}')
+
+
+def _notify_changed(id_: int):
+    """
+    Notifies other nodes that tweet was changed or deleted, so they stop
+    using cached copy of it. Notifications are sent in background. Has to be
+    called after change is committed, otherwise nodes might fetch and cache
+    old tweet again.
+    """
+    def notify(node):
+        try:
+            node.client.invalidate(config.ST_OWN_NAME, [id_])
+        except Exception:
+            logger.warning('Unable to notify %s about changed tweet.',
+                           node.name)
+
+    for node in registry.get_all():
+        submit(notify, node)
+
+
+def hydrated(tweets: Iterable[Tweet], chunk_size: int,
+             timeout: float=None) -> Iterator[Tweet]:
+    """
+    Lazily resolves retweets from iterable of tweets, `chunk_size` of them at
+    once. See :func:`hydrate`.
+
+    :param tweets: Tweets to resolve.
+    :param chunk_size: Number of tweets to resolve at once.
+    :param timeout:
+        Maximum number of seconds to wait for other nodes, for each chunk.
     """
-    Returns list of all tweets.
+    it = iter(tweets)
+    while True:
+        chunk = list(itertools.islice(it, chunk_size))
+        if not chunk:
+            return
+        hydrate(chunk, timeout)
+        yield from chunk
+
+
+def get_all(limit: int=None, after: Keyset=None) -> List[Tweet]:
+    """
+    Returns list of all tweets, newest first.
+
+    :param limit: Maximum number of tweets to return.
+    :param after:
+        Keyset (created_at, id) of last tweet on previous page. If provided,
+        only tweets after it are returned.
     :rtype: [Tweet]
     """
-    return [Tweet(*args) for args in get_db().do(get_ops().get_all_tweets)]
+    get_func = partial(get_ops().get_all_tweets, limit=limit, after=after)
+    return [Tweet(*args) for args in get_db().do(get_func)]
+
+
+def stream_all(chunk_size: int=500) -> Iterator[Tweet]:
+    """
+    Lazily iterates over all tweets, newest first. Tweets are read from
+    database in chunks, so memory usage does not depend on number of tweets.
+
+    Separate database connection is used for this, so long iteration does
+    not hold request transaction open.
+
+    :param chunk_size: Number of tweets to read from database at once.
+    :rtype: Iterator[Tweet]
+    """
+    with get_db(scoped=False) as db:
+        iter_func = partial(get_ops().iter_tweets, chunk_size)
+        for args in db.stream(iter_func):
+            yield Tweet(*args)
 
 
 def by_id(id_):
@@ -94,6 +304,24 @@ def by_id(id_):
     return Tweet(*res)
 
 
+def by_ids(ids: List[int]) -> Tuple[List[Tweet], List[int]]:
+    """
+    Returns tweets with specified IDs, fetched with single query.
+
+    :param ids: IDs of tweets to get.
+    :return:
+        Tuple of found tweets, in order of requested IDs, and list of IDs
+        that were not found.
+    """
+    ids = list(dict.fromkeys(ids))
+    rows = get_db().do(partial(get_ops().get_tweets, ids))
+    found = {row[0]: Tweet(*row) for row in rows}
+    return (
+        [found[id_] for id_ in ids if id_ in found],
+        [id_ for id_ in ids if id_ not in found],
+    )
+
+
 def create(content):
     """
     Creates new tweet with provided content.
@@ -103,7 +331,59 @@ def create(content):
     :rtype: Tweet
     """
     check_length(content)
-    return Tweet(*get_db().do(partial(get_ops().insert_tweet, content)))
+    created = get_db().do(partial(get_ops().insert_tweet, content))
+    after_commit(_stats_cache.clear)
+    return Tweet(*created)
+
+
+def create_many(items: List[dict]) -> List[Union[Tweet, BadRequest]]:
+    """
+    Creates multiple tweets and retweets at once. Items are in same format
+    as bodies for creating single tweet or retweet: original tweets have
+    "tweet" key and retweets have "server" and "id" keys.
+
+    Invalid items are skipped, all valid items are inserted together.
+
+    :param items: Tweets and retweets to create.
+    :return:
+        For each item, in same order, either created tweet or exception
+        describing why item was rejected.
+    """
+    results = [None] * len(items)
+    valid = []
+    for i, item in enumerate(items):
+        try:
+            valid.append((i, _new_tweet(item)))
+        except BadRequest as e:
+            results[i] = e
+    if valid:
+        created = get_db().do(partial(
+            get_ops().insert_tweets, [new for _, new in valid]
+        ))
+        for (i, _), row in zip(valid, created):
+            results[i] = Tweet(*row)
+        after_commit(_stats_cache.clear)
+    return results
+
+
+def _new_tweet(item: dict) -> NewTweet:
+    """
+    Validates single item for :func:`create_many` and converts it to tweet
+    that can be inserted.
+
+    :raises BadRequest: If item is not valid.
+    """
+    if not isinstance(item, dict):
+        raise BadRequest('Invalid item: expected object.')
+    if 'tweet' in item:
+        content = item['tweet']
+        if not isinstance(content, str):
+            raise BadRequest('Invalid item: "tweet" must be a string.')
+        check_length(content)
+        return 'original', content, None
+    if 'server' in item and 'id' in item:
+        return 'retweet', None, f'{item["server"]}#{item["id"]}'
+    raise BadRequest('Invalid item: no "tweet" key or "server" and "id" keys.')
 
 
 def modify(id_, content):
@@ -121,6 +401,7 @@ def modify(id_, content):
     updated = get_db().do(partial(get_ops().modify_tweet, id_, content))
     if not updated:
         raise NotFound(f'Tweet for ID: {id_} not found.')
+    after_commit(partial(_notify_changed, id_))
     return Tweet(*updated)
 
 
@@ -133,6 +414,8 @@ def delete(id_):
     deleted = get_db().do(partial(get_ops().delete_tweet, id_))
     if not deleted:
         raise NotFound(f'Tweet with ID: {id_} not found.')
+    after_commit(_stats_cache.clear)
+    after_commit(partial(_notify_changed, id_))
     return deleted
 
 
@@ -145,7 +428,9 @@ def retweet(server, id_):
     :return: Newly created tweet.
     :rtype: Tweet
     """
-    return Tweet(*get_db().do(partial(get_ops().create_retweet, server, id_)))
+    created = get_db().do(partial(get_ops().create_retweet, server, id_))
+    after_commit(_stats_cache.clear)
+    return Tweet(*created)
 
 
 def search(content: str=None,
@@ -154,9 +439,13 @@ def search(content: str=None,
            from_modified: datetime=None,
            to_modified: datetime=None,
            retweet: bool=None,
-           all: bool=False) -> List[Tweet]:
+           all: bool=False,
+           limit: int=None,
+           after: Keyset=None,
+           mode: str=SEARCH_SUBSTRING,
+           order: str=ORDER_CREATED) -> List[Tweet]:
     """
-    Performs search on tweets and returns list of results.
+    Performs search on tweets and returns list of results, newest first.
     If no parameters are provided, this will yield same results as
     listing tweets.
 
@@ -169,17 +458,56 @@ def search(content: str=None,
         Flag indication if retweet or original tweets should be searched.
     :param all:
         Flag indicating if all nodes should be searched or only this one.
+    :param limit: Maximum number of tweets to return.
+    :param after:
+        Keyset (created_at, id) of last tweet on previous page. Applies only
+        to this node.
+    :param mode:
+        How content is matched, either substring (default) or full text.
+    :param order: Order of results, either by creation time or relevance.
     :return: Result searching tweets.
     :rtype: [Tweet]
     """
-    search_func = partial(get_ops().search_tweets, content, from_created,
-                          to_created, from_modified, to_modified, retweet)
-    res = [Tweet(*args) for args in get_db().do(search_func)]
     if all:
-        others_res = search_others(content, from_created, to_created,
-                                   from_modified, to_modified, retweet)
-        res.extend(others_res)
-    return res
+        res, _ = search_all(content, from_created, to_created, from_modified,
+                            to_modified, retweet, limit, mode, order,
+                            float(config.ST_FANOUT_TIMEOUT))
+        return res
+    search_func = partial(get_ops().search_tweets, content, from_created,
+                          to_created, from_modified, to_modified, retweet,
+                          limit=limit, after=after, mode=mode, order=order)
+    return [Tweet(*args) for args in get_db().do(search_func)]
+
+
+def search_all(content: str=None,
+               from_created: datetime=None,
+               to_created: datetime=None,
+               from_modified: datetime=None,
+               to_modified: datetime=None,
+               retweet: bool=None,
+               limit: int=None,
+               mode: str=SEARCH_SUBSTRING,
+               order: str=ORDER_CREATED,
+               timeout: float=None
+               ) -> Tuple[List[Tweet], List[NodeResult]]:
+    """
+    Performs search on this and all other nodes. Parameters are same as for
+    :func:`search`. Results of all nodes are merged, see
+    :func:`merge_results`, and each of them has origin node set.
+
+    :param timeout: Maximum number of seconds to wait for other nodes.
+    :return:
+        Tuple of found tweets and result of search on each of other nodes.
+    """
+    res = search(content, from_created, to_created, from_modified,
+                 to_modified, retweet, False, limit, mode=mode, order=order)
+    for t in res:
+        t.origin = config.ST_OWN_NAME
+    others_res, node_results = search_others(
+        content, from_created, to_created, from_modified, to_modified,
+        retweet, limit, mode, order, timeout,
+    )
+    return merge_results([res, others_res], limit, order), node_results
 
 
 def search_others(content: str=None,
@@ -187,25 +515,203 @@ def search_others(content: str=None,
                   to_created: datetime=None,
                   from_modified: datetime=None,
                   to_modified: datetime=None,
-                  retweet: bool=None) -> List[Tweet]:
-    tp = ThreadPoolExecutor(max_workers=5)
-    futures = []
+                  retweet: bool=None,
+                  limit: int=None,
+                  mode: str=SEARCH_SUBSTRING,
+                  order: str=ORDER_CREATED,
+                  timeout: float=None
+                  ) -> Tuple[List[Tweet], List[NodeResult]]:
+    """
+    Performs search on all other nodes concurrently. Parameters are same as
+    for :func:`search`.
+
+    Complete results are cached for a short time, see :data:`search_cache`.
+    Cache is keyed by nodes in network as well, so adding or removing node
+    makes cached results unused.
+
+    :param timeout:
+        Maximum number of seconds to wait for other nodes. Results of nodes
+        that did not respond in time are not included.
+    :return:
+        Tuple of found tweets, merged like by :func:`search_all`, and result
+        of search on each node, so caller can see which nodes failed or
+        timed out.
+    """
+    nodes = registry.get_all()
+    key = _search_key(content, from_created, to_created, from_modified,
+                      to_modified, retweet, limit, mode, order, nodes)
+
+    def search_nodes():
+        cached = search_cache.get(key)
+        if cached is not None:
+            return cached
+
+        def search_node(node):
+            return _search_node(node, content, from_created, to_created,
+                                from_modified, to_modified, retweet, limit,
+                                mode, order)
+
+        node_results = scatter(nodes, search_node, timeout, hedge=True)
+        streams = [r.value for r in node_results if r.status == STATUS_OK]
+        result = merge_results(streams, limit, order), node_results
+        # partial results are not cached, missing nodes might respond to
+        # next search
+        if len(streams) == len(node_results):
+            search_cache.set(key, result)
+        return result
+
+    results, node_results = _search_flight.do(key, search_nodes)
+    return list(results), node_results
+
+
+def _search_key(content, from_created, to_created, from_modified,
+                to_modified, retweet, limit, mode, order, nodes) -> tuple:
+    """
+    Returns key of distributed search in search cache. Equivalent searches
+    have same key and key changes whenever nodes in network change.
+    """
+    if content is not None:
+        # matching is case insensitive and full text search ignores spacing
+        content = content.lower()
+        if mode == SEARCH_FULLTEXT:
+            content = ' '.join(content.split())
+
+    def ts(dt):
+        return dt.timestamp() if dt is not None else None
+
+    return (
+        content, ts(from_created), ts(to_created), ts(from_modified),
+        ts(to_modified), retweet, limit, mode, order,
+        tuple(sorted((n.name, n.address) for n in nodes)),
+    )
+
+
+def search_stream(content: str=None,
+                  from_created: datetime=None,
+                  to_created: datetime=None,
+                  from_modified: datetime=None,
+                  to_modified: datetime=None,
+                  retweet: bool=None,
+                  limit: int=None,
+                  mode: str=SEARCH_SUBSTRING,
+                  order: str=ORDER_CREATED,
+                  timeout: float=None,
+                  others: bool=True) -> Iterator[NodeResult]:
+    """
+    Performs search on this and all other nodes, yielding results of each
+    node as soon as they are available. Parameters are same as for
+    :func:`search_all`.
+
+    Results of this node are yielded first, other nodes follow in order in
+    which they respond, and nodes that failed or timed out come last.
+    Results are not ordered across nodes, but duplicates of already yielded
+    tweets are removed.
+
+    :param others: If False, only this node is searched.
+    :return: Generator of search results of each node, with found tweets.
+    """
+    start = time.monotonic()
+    res = search(content, from_created, to_created, from_modified,
+                 to_modified, retweet, False, limit, mode=mode, order=order)
+    for t in res:
+        t.origin = config.ST_OWN_NAME
+    seen = set()
+    yield NodeResult(config.ST_OWN_NAME, STATUS_OK, _unseen(res, seen), None,
+                     time.monotonic() - start)
+    if not others:
+        return
+
+    def search_node(node):
+        return _search_node(node, content, from_created, to_created,
+                            from_modified, to_modified, retweet, limit, mode,
+                            order)
+
+    for result in scatter_iter(registry.get_all(), search_node, timeout,
+                               hedge=True):
+        if result.status == STATUS_OK:
+            result = result._replace(value=_unseen(result.value, seen))
+        yield result
+
+
+def _search_node(node: registry.Node, content, from_created, to_created,
+                 from_modified, to_modified, retweet, limit, mode, order
+                 ) -> List[Tweet]:
+    """
+    Performs search on single node and returns found tweets, with origin
+    set to that node.
+    """
+    found = node.client.search(content, from_created, to_created,
+                               from_modified, to_modified, retweet, False,
+                               limit, mode=mode, order=order)
+    tweets = [Tweet.from_dict(r) for r in found]
+    for t in tweets:
+        t.origin = node.name
+    return tweets
+
+
+def _unseen(tweets: Iterable[Tweet], seen: set) -> List[Tweet]:
+    """
+    Returns tweets that are not in `seen` and adds them to it. See
+    :func:`_dedupe_key`.
+    """
     results = []
+    for t in tweets:
+        key = _dedupe_key(t)
+        if key not in seen:
+            seen.add(key)
+            results.append(t)
+    return results
 
-    for n in registry.get_all():
-        futures.append(
-            tp.submit(n.client.search, content, from_created, to_created,
-                      from_modified, to_modified, retweet, False)
-        )
 
-    wait(futures)
-    for future in futures:
-        try:
-            res = future.result()
-            results.extend([Tweet.from_dict(r) for r in res])
-        except Exception:
-            logger.warning('Unable to get results from a server.')
+def _created_key(t: Tweet):
+    return t.created_at, t.id
+
 
+def _dedupe_key(t: Tweet) -> str:
+    """
+    Returns key identifying tweet in whole network. Retweets are identified
+    by original tweet, so all retweets of same tweet and original tweet
+    itself share the key.
+    """
+    if t.type == 'retweet' and t.reference:
+        return t.reference
+    return f'{t.origin}#{t.id}'
+
+
+def merge_results(streams: Iterable[List[Tweet]], limit: int=None,
+                  order: str=ORDER_CREATED) -> List[Tweet]:
+    """
+    Merges search results from multiple nodes into single list, ordered same
+    as results of each node, without duplicates.
+
+    Results ordered by creation time are merged newest first. Relevance is
+    not comparable between nodes, so results ordered by relevance are
+    interleaved by their rank on own node.
+
+    Only first of duplicates is kept. Duplicates are tweets with same ID from
+    same node and retweets of same original tweet, including the original.
+
+    :param streams: Results of each node, ordered as requested.
+    :param limit: Maximum number of tweets to return.
+    :param order: Order of results, either by creation time or relevance.
+    :return: Merged results.
+    """
+    if order == ORDER_RELEVANCE:
+        ranked = heapq.merge(*(enumerate(s) for s in streams),
+                             key=lambda r: r[0])
+        merged = (t for _, t in ranked)
+    else:
+        merged = heapq.merge(*streams, key=_created_key, reverse=True)
+    results = []
+    seen = set()
+    for t in merged:
+        key = _dedupe_key(t)
+        if key in seen:
+            continue
+        seen.add(key)
+        results.append(t)
+        if limit is not None and len(results) >= limit:
+            break
     return results
 
 
@@ -224,6 +730,38 @@ def count(type_: str=None):
     return get_db().do(partial(get_ops().count_tweets, type_))
 
 
+def stats(approximate: bool=False, ttl: float=5) -> Dict[str, int]:
+    """
+    Returns number of original tweets, retweets and total number of tweets.
+    All types are counted at once and result is cached for `ttl` seconds.
+
+    :param approximate:
+        If True, counts are estimated from database statistics instead of
+        counting rows. This is much faster for large number of tweets, but
+        numbers can be off until statistics are updated. If estimate is not
+        available, exact counts are returned.
+    :param ttl: Number of seconds result is cached for.
+    :return: Dictionary with 'original', 'retweets' and 'total' counts.
+    """
+    result = _stats_cache.get(approximate)
+    if result is not None:
+        return result
+    counts = None
+    if approximate:
+        counts = get_db().do(get_ops().estimate_tweets_by_type)
+    if counts is None:
+        counts = get_db().do(get_ops().count_tweets_by_type)
+    original = counts.get('original', 0)
+    retweets = counts.get('retweet', 0)
+    result = {
+        'original': original,
+        'retweets': retweets,
+        'total': original + retweets,
+    }
+    _stats_cache.set(approximate, result, ttl)
+    return result
+
+
 def check_length(tweet):
     """
     Verifies if provided tweet content is less then 140 characters.
@@ -1,5 +1,8 @@
 import os
+import fcntl
 import binascii
+import threading
+import contextlib
 
 
 def generate_api_token():
@@ -7,3 +10,95 @@ def generate_api_token():
     Generates random token.
     """
     return binascii.b2a_hex(os.urandom(15)).decode('ascii')
+
+
+class RWLock:
+    """
+    Readers-writer lock. Any number of readers can hold the lock at the same
+    time, while writer holds it exclusively. Waiting writers have priority
+    over new readers, so that writers are not starved by constant reads.
+
+    Lock is not reentrant.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextlib.contextmanager
+    def read(self):
+        """
+        Context manager holding lock for reading.
+        """
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def write(self):
+        """
+        Context manager holding lock exclusively, for writing.
+        """
+        with self._cond:
+            self._waiting_writers += 1
+            try:
+                while self._writer or self._readers:
+                    self._cond.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class FileLock:
+    """
+    Exclusive lock held by single process among all processes using same
+    file. Lock is released when it is released explicitly or when process
+    holding it exits.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
+
+    def acquire(self) -> bool:
+        """
+        Tries to acquire lock, without waiting for it.
+
+        :return: Flag indicating if lock is held by this process.
+        """
+        if self._file is not None:
+            return True
+        f = open(self.path, 'a')
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._file = f
+        return True
+
+    def release(self):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
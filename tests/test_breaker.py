@@ -0,0 +1,60 @@
+import time
+from unittest.mock import patch
+from seventweets.breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+
+def fail(breaker, times):
+    for _ in range(times):
+        assert breaker.allow()
+        breaker.failure()
+
+
+def test_stays_closed_below_min_calls():
+    breaker = CircuitBreaker(window=10, min_calls=5)
+    fail(breaker, 4)
+    assert breaker.state == CLOSED
+
+
+def test_opens_on_failure_rate():
+    breaker = CircuitBreaker(window=10, min_calls=4, failure_rate=0.5)
+    for _ in range(3):
+        breaker.success()
+    fail(breaker, 2)
+    assert breaker.state == CLOSED
+    fail(breaker, 1)
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_half_open_allows_single_trial():
+    breaker = CircuitBreaker(min_calls=1, reset_timeout=0.01)
+    fail(breaker, 1)
+    assert not breaker.allow()
+    time.sleep(0.02)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.success()
+    assert breaker.state == CLOSED
+    assert breaker.stats()['failures'] == 0
+
+
+def test_failed_trial_opens_again():
+    breaker = CircuitBreaker(min_calls=1, reset_timeout=0.01)
+    fail(breaker, 1)
+    time.sleep(0.02)
+    fail(breaker, 1)
+    assert breaker.state == OPEN
+
+
+def test_outage():
+    breaker = CircuitBreaker()
+    assert breaker.outage() == 0
+    with patch('seventweets.breaker.time.monotonic', return_value=100):
+        breaker.failure()
+    with patch('seventweets.breaker.time.monotonic', return_value=130):
+        breaker.failure()
+        assert breaker.outage() == 30
+        assert breaker.stats()['failing_for'] == 30
+    breaker.success()
+    assert breaker.outage() == 0
@@ -0,0 +1,111 @@
+import time
+import threading
+import pytest
+from unittest.mock import patch
+from seventweets.cache import TTLCache, SingleFlight
+
+
+def test_get_set_delete():
+    cache = TTLCache()
+    assert cache.get('a') is None
+    assert cache.get('a', 1) == 1
+    cache.set('a', 2)
+    assert cache.get('a') == 2
+    assert cache.delete('a') is True
+    assert cache.delete('a') is False
+    assert cache.get('a') is None
+
+
+def test_caches_falsy_values():
+    cache = TTLCache()
+    cache.set('a', 0)
+    assert cache.get('a', 'missing') == 0
+
+
+def test_expiry():
+    cache = TTLCache(ttl=10)
+    with patch('seventweets.cache.time.monotonic', return_value=100):
+        cache.set('a', 1)
+        cache.set('b', 2, ttl=100)
+    with patch('seventweets.cache.time.monotonic', return_value=111):
+        assert cache.get('a') is None
+        assert cache.get('b') == 2
+    assert len(cache) == 1
+
+
+def test_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+
+
+def test_clear():
+    cache = TTLCache()
+    cache.set('a', 1)
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_stale_entries():
+    cache = TTLCache(ttl=10, stale=20)
+    with patch('seventweets.cache.time.monotonic', return_value=100):
+        cache.set('a', 1)
+        assert cache.get_entry('a') == (1, True)
+    with patch('seventweets.cache.time.monotonic', return_value=115):
+        assert cache.get('a') is None
+        assert cache.get_entry('a') == (1, False)
+    with patch('seventweets.cache.time.monotonic', return_value=131):
+        assert cache.get_entry('a') is None
+    assert len(cache) == 0
+
+
+def test_stats():
+    cache = TTLCache(maxsize=5)
+    cache.set('a', 1)
+    cache.get('a')
+    cache.get_entry('a')
+    cache.get('b')
+    assert cache.stats() == {
+        'size': 1, 'maxsize': 5, 'hits': 2, 'stale_hits': 0, 'misses': 1,
+    }
+
+
+def test_single_flight_error():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError('failed')
+
+    with pytest.raises(ValueError):
+        flight.do('a', fail)
+    assert flight.do('a', lambda: 1) == 1
+
+
+def test_single_flight_coalesces():
+    flight = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def slow():
+        calls.append(1)
+        release.wait(1)
+        return 42
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(flight.do('a', slow)))
+        for _ in range(5)
+    ]
+    for t in threads:
+        t.start()
+    time.sleep(0.05)
+    release.set()
+    for t in threads:
+        t.join()
+    assert results == [42] * 5
+    assert len(calls) == 1
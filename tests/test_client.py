@@ -0,0 +1,171 @@
+import time
+import threading
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch, MagicMock
+from requests.exceptions import ConnectionError, ChunkedEncodingError
+from seventweets import client
+from seventweets.breaker import CircuitBreaker, OPEN
+from seventweets.client import Client
+from seventweets.exceptions import BadGateway, NotFound, ServiceUnavailable
+
+
+def test_get_tweets_by_ids_batches():
+    client = Client('http://node')
+    responses = [
+        {'tweets': [{'id': 1}, {'id': 2}], 'missing': []},
+        {'tweets': [], 'missing': [3]},
+    ]
+    with patch.object(Client, '_request', side_effect=responses) as request:
+        found, missing = client.get_tweets_by_ids([1, 2, 3], batch_size=2)
+    assert [t['id'] for t in found] == [1, 2]
+    assert missing == [3]
+    assert request.call_args_list[0][1]['params'] == {'ids': '1,2',
+                                                      'limit': 2}
+
+
+def test_get_tweets_by_ids_unsupported():
+    client = Client('http://node')
+    all_tweets = [{'id': 1}, {'id': 2}]
+
+    def request(method, path, params=None, **kwargs):
+        if path == '/tweets':
+            return all_tweets
+        if path in ('/tweets/3', '/tweets/1'):
+            return {'id': int(path.rsplit('/', 1)[1])}
+        raise NotFound('not found')
+
+    with patch.object(Client, '_request', side_effect=request) as _request:
+        found, missing = client.get_tweets_by_ids(['3', '1', '7'],
+                                                  batch_size=2)
+        assert [t['id'] for t in found] == [3, 1]
+        assert missing == ['7']
+        assert _request.call_args_list[0][1]['params']['limit'] == 2
+        assert _request.call_count == 4
+        found, missing = client.get_tweets_by_ids(['1'])
+    assert [t['id'] for t in found] == [1]
+    assert _request.call_count == 5
+    assert _request.call_args[0][1] == '/tweets/1'
+
+
+def test_create_tweets():
+    client = Client('http://node')
+    with patch.object(Client, '_request', side_effect=[
+        {'results': [{'status': 201}, {'status': 201}]},
+        {'results': [{'status': 400}]},
+    ]) as request:
+        results = client.create_tweets(
+            ['a', {'server': 'other', 'id': 1}, 'c'], batch_size=2,
+        )
+    assert [r['status'] for r in results] == [201, 201, 400]
+    assert request.call_args_list[0][1]['data'] == [
+        {'tweet': 'a'}, {'server': 'other', 'id': 1},
+    ]
+
+
+@pytest.fixture
+def server():
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            body = b'{"id": 1}'
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:{}'.format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+def test_clients_share_connections(server):
+    before = client.pool_stats()
+    assert Client(server, timeout=1).get_tweet(1) == {'id': 1}
+    assert Client(server, timeout=1).get_tweet(1) == {'id': 1}
+    after = client.pool_stats()
+    assert after['connections'] - before['connections'] == 1
+    assert after['requests'] - before['requests'] == 2
+    assert after['idle'] >= 1
+
+
+def test_timeouts():
+    assert Client('http://node').timeouts is None
+    assert Client('http://node', timeout=3).timeouts == 3
+    assert Client('http://node', timeout=3,
+                  connect_timeout=1).timeouts == (1, 3)
+
+
+def failing_session():
+    session = MagicMock()
+    session.request.side_effect = ConnectionError('refused')
+    return patch('seventweets.client.get_session', return_value=session)
+
+
+def test_unreachable_node_without_breaker_is_cleaned_up():
+    cleanup = MagicMock()
+    with failing_session(), pytest.raises(BadGateway):
+        Client('http://node', cleanup_callback=cleanup).get_tweet(1)
+    assert cleanup.call_count == 1
+
+
+def test_breaker_fails_fast_while_open():
+    cleanup = MagicMock()
+    breaker = CircuitBreaker(min_calls=2)
+    node = Client('http://node', cleanup_callback=cleanup, breaker=breaker,
+                  remove_after=60)
+    with failing_session() as get_session:
+        for _ in range(3):
+            with pytest.raises(BadGateway):
+                node.get_tweet(1)
+    assert get_session.return_value.request.call_count == 2
+    assert breaker.state == OPEN
+    assert not cleanup.called
+
+
+def test_breaker_cleans_up_after_sustained_outage():
+    cleanup = MagicMock()
+    breaker = CircuitBreaker(min_calls=100)
+    node = Client('http://node', cleanup_callback=cleanup, breaker=breaker,
+                  remove_after=60)
+    with failing_session():
+        with patch('seventweets.breaker.time.monotonic', return_value=0), \
+                pytest.raises(BadGateway):
+            node.get_tweet(1)
+        assert not cleanup.called
+        with patch('seventweets.breaker.time.monotonic', return_value=61), \
+                pytest.raises(BadGateway):
+            node.get_tweet(1)
+    assert cleanup.call_count == 1
+
+
+def test_breaker_counts_unavailable_responses():
+    breaker = CircuitBreaker(min_calls=1)
+    session = MagicMock()
+    session.request.return_value.status_code = 503
+    with patch('seventweets.client.get_session', return_value=session), \
+            pytest.raises(ServiceUnavailable):
+        Client('http://node', breaker=breaker).get_tweet(1)
+    assert breaker.state == OPEN
+
+
+def test_breaker_trial_failing_mid_response_reopens():
+    breaker = CircuitBreaker(min_calls=1, reset_timeout=0.01)
+    breaker.failure()
+    time.sleep(0.02)
+    session = MagicMock()
+    session.request.side_effect = ChunkedEncodingError('connection lost')
+    with patch('seventweets.client.get_session', return_value=session), \
+            pytest.raises(BadGateway):
+        Client('http://node', breaker=breaker).get_tweet(1)
+    assert breaker.state == OPEN
+    time.sleep(0.02)
+    assert breaker.allow()
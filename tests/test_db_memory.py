@@ -0,0 +1,310 @@
+import random
+import pytest
+from datetime import datetime, timedelta
+from seventweets import db
+from seventweets.db.backends.memory import SortedIndex, Storage, Database
+
+
+def memory_db():
+    return Storage(), db.get_ops('memory')
+
+
+def test_get_all_tweets_newest_first():
+    storage, ops = memory_db()
+    ids = [ops.insert_tweet(f'tweet {i}', storage).id for i in range(5)]
+    assert [t.id for t in ops.get_all_tweets(storage)] == ids[::-1]
+
+
+def test_get_all_tweets_pages():
+    storage, ops = memory_db()
+    for i in range(5):
+        ops.insert_tweet(f'tweet {i}', storage)
+    first = ops.get_all_tweets(storage, limit=2)
+    last = first[-1]
+    second = ops.get_all_tweets(storage, limit=2,
+                                after=(last.created_at, last.id))
+    rest = ops.get_all_tweets(storage, after=(second[-1].created_at,
+                                              second[-1].id))
+    assert len(first) == 2
+    assert len(second) == 2
+    assert len(rest) == 1
+    all_ids = [t.id for t in first + second + rest]
+    assert sorted(all_ids) == sorted(set(all_ids))
+
+
+def test_search_tweets():
+    storage, ops = memory_db()
+    ops.insert_tweet('Hello World', storage)
+    ops.insert_tweet('goodbye', storage)
+    ops.create_retweet('other', 1, storage)
+
+    res = ops.search_tweets('hello', None, None, None, None, None, storage)
+    assert [t.tweet for t in res] == ['Hello World']
+
+    res = ops.search_tweets(None, None, None, None, None, True, storage)
+    assert [t.type for t in res] == ['retweet']
+
+    future = datetime.now() + timedelta(days=1)
+    res = ops.search_tweets(None, future, None, None, None, None, storage)
+    assert res == []
+
+
+def test_stream_tweets():
+    storage, ops = memory_db()
+    ids = [ops.insert_tweet(f'tweet {i}', storage).id for i in range(3)]
+    streamed = Database(storage=storage).stream(
+        lambda s: ops.iter_tweets(2, s)
+    )
+    assert [t.id for t in streamed] == ids[::-1]
+
+
+def test_search_tweets_fulltext():
+    storage, ops = memory_db()
+    ops.insert_tweet('python is great', storage)
+    ops.insert_tweet('pythonic code', storage)
+    ops.insert_tweet('python python python', storage)
+
+    res = ops.search_tweets('python', None, None, None, None, None, storage,
+                            mode=db.SEARCH_FULLTEXT)
+    assert {t.tweet for t in res} == {'python is great',
+                                      'python python python'}
+
+    res = ops.search_tweets('python', None, None, None, None, None, storage,
+                            mode=db.SEARCH_FULLTEXT,
+                            order=db.ORDER_RELEVANCE)
+    assert [t.tweet for t in res] == ['python python python',
+                                      'python is great']
+
+    res = ops.search_tweets('python', None, None, None, None, None, storage)
+    assert len(res) == 3
+
+
+def test_search_tweets_fulltext_without_words():
+    storage, ops = memory_db()
+    ops.insert_tweet('python is great', storage)
+    for content in ('', '!?', '  '):
+        assert ops.search_tweets(content, None, None, None, None, None,
+                                 storage, mode=db.SEARCH_FULLTEXT) == []
+    assert len(ops.search_tweets('', None, None, None, None, None,
+                                 storage)) == 1
+
+
+def test_get_modify_delete_tweet():
+    storage, ops = memory_db()
+    tweet = ops.insert_tweet('original content', storage)
+    assert ops.get_tweet(tweet.id, storage) == tweet
+    assert ops.get_tweet(tweet.id + 100, storage) is None
+
+    modified = ops.modify_tweet(tweet.id, 'new content', storage)
+    assert modified.tweet == 'new content'
+    assert modified.created_at == tweet.created_at
+    assert modified.modified_at >= tweet.modified_at
+    assert ops.get_tweet(tweet.id, storage).tweet == 'new content'
+    assert ops.modify_tweet(tweet.id + 100, 'foo', storage) is None
+
+    assert ops.delete_tweet(tweet.id, storage) is True
+    assert ops.delete_tweet(tweet.id, storage) is False
+    assert ops.get_tweet(tweet.id, storage) is None
+    assert ops.get_all_tweets(storage) == []
+
+
+def test_count_tweets():
+    storage, ops = memory_db()
+    first = ops.insert_tweet('first', storage)
+    ops.insert_tweet('second', storage)
+    ops.create_retweet('other', 1, storage)
+    assert ops.count_tweets('original', storage) == 2
+    assert ops.count_tweets('retweet', storage) == 1
+    assert ops.count_tweets(None, storage) == 3
+
+    ops.delete_tweet(first.id, storage)
+    assert ops.count_tweets('original', storage) == 1
+
+
+def test_insert_tweets():
+    storage, ops = memory_db()
+    created = ops.insert_tweets([
+        ('original', 'first', None),
+        ('retweet', None, 'other#1'),
+        ('original', 'second', None),
+    ], storage)
+    assert [t.id for t in created] == [1, 2, 3]
+    assert created[1].reference == 'other#1'
+    assert ops.count_tweets_by_type(storage) == {'original': 2, 'retweet': 1}
+    found = ops.search_tweets('second', None, None, None, None, None, storage)
+    assert [t.id for t in found] == [3]
+
+
+def test_get_tweets():
+    storage, ops = memory_db()
+    first = ops.insert_tweet('first', storage)
+    second = ops.insert_tweet('second', storage)
+    found = ops.get_tweets([second.id, 42, first.id, first.id], storage)
+    assert sorted(found) == [first, second]
+
+
+def test_count_tweets_by_type():
+    storage, ops = memory_db()
+    assert ops.count_tweets_by_type(storage) == {}
+    first = ops.insert_tweet('first', storage)
+    ops.insert_tweet('second', storage)
+    ops.create_retweet('other', 1, storage)
+    assert ops.count_tweets_by_type(storage) == {'original': 2, 'retweet': 1}
+    assert ops.estimate_tweets_by_type(storage) == {
+        'original': 2, 'retweet': 1,
+    }
+    ops.delete_tweet(first.id, storage)
+    assert ops.count_tweets_by_type(storage) == {'original': 1, 'retweet': 1}
+
+
+def test_search_created_range():
+    from seventweets.db.backends.memory import Tweet
+    storage, ops = memory_db()
+    start = datetime(2017, 1, 1)
+    # added out of order, index has to keep them sorted
+    for i in [5, 1, 9, 0, 3, 7, 2, 8, 4, 6]:
+        created = start + timedelta(days=i)
+        storage.add_tweet(Tweet(i, f'tweet {i}', 'original', created, created,
+                                ''))
+
+    res = ops.search_tweets(None, start + timedelta(days=2),
+                            start + timedelta(days=5), None, None, None,
+                            storage)
+    assert [t.id for t in res] == [5, 4, 3, 2]
+
+    res = ops.search_tweets(None, start + timedelta(days=2), None, None, None,
+                            None, storage, limit=3)
+    assert [t.id for t in res] == [9, 8, 7]
+
+    res = ops.get_all_tweets(storage, limit=2,
+                             after=(start + timedelta(days=3), 3))
+    assert [t.id for t in res] == [2, 1]
+
+
+def test_sorted_index():
+    SortedIndex.LOAD = 4
+    try:
+        index = SortedIndex()
+        expected = set()
+        rnd = random.Random(7)
+        for _ in range(500):
+            key = rnd.randrange(200)
+            if key in expected:
+                index.remove(key)
+                expected.remove(key)
+            else:
+                index.add(key)
+                expected.add(key)
+        assert len(index) == len(expected)
+        assert list(index.descending()) == sorted(expected, reverse=True)
+        assert list(index.descending(50, 100)) == sorted(
+            (k for k in expected if 50 <= k < 100), reverse=True
+        )
+        with pytest.raises(KeyError):
+            index.remove(1000)
+    finally:
+        SortedIndex.LOAD = 1000
+
+
+def test_handles_share_storage():
+    ops = db.get_ops('memory')
+    tweet = db.get_db('memory', scoped=False).do(
+        lambda s: ops.insert_tweet('shared', s)
+    )
+    found = db.get_db('memory', scoped=False).do(
+        lambda s: ops.get_tweet(tweet.id, s)
+    )
+    assert found == tweet
+    db.get_db('memory', scoped=False).do(
+        lambda s: ops.delete_tweet(tweet.id, s)
+    )
+
+
+def test_iteration_is_snapshot():
+    storage, ops = memory_db()
+    for i in range(5):
+        ops.insert_tweet(f'tweet {i}', storage)
+    listing = storage.newest_first()
+    first = next(listing)
+    ops.insert_tweet('added while iterating', storage)
+    deleted = ops.get_all_tweets(storage)[-1]
+    ops.delete_tweet(deleted.id, storage)
+    rest = list(listing)
+    assert first.tweet == 'tweet 4'
+    assert [t.tweet for t in rest] == ['tweet 3', 'tweet 2', 'tweet 1']
+
+
+def test_concurrent_writes():
+    import threading
+    storage, ops = memory_db()
+
+    def insert_many():
+        for i in range(200):
+            ops.insert_tweet(f'tweet {i}', storage)
+            ops.search_tweets('tweet', None, None, None, None, None, storage,
+                              limit=5)
+
+    threads = [threading.Thread(target=insert_many) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert ops.count_tweets(None, storage) == 800
+    assert len(ops.get_all_tweets(storage)) == 800
+
+
+def test_content_index_follows_changes():
+    storage, ops = memory_db()
+    tweet = ops.insert_tweet('Hello World', storage)
+    ops.insert_tweet('another tweet', storage)
+
+    def search(content, mode=db.SEARCH_SUBSTRING):
+        return [t.id for t in ops.search_tweets(
+            content, None, None, None, None, None, storage, mode=mode
+        )]
+
+    assert search('LO wor') == [tweet.id]
+    assert search('world', db.SEARCH_FULLTEXT) == [tweet.id]
+    assert search('missing') == []
+
+    ops.modify_tweet(tweet.id, 'Goodbye', storage)
+    assert search('lo wor') == []
+    assert search('world', db.SEARCH_FULLTEXT) == []
+    assert search('dbye') == [tweet.id]
+
+    ops.delete_tweet(tweet.id, storage)
+    assert search('dbye') == []
+    assert 'dby' not in storage.grams
+    assert 'goodbye' not in storage.words
+
+
+def test_content_index_matches_scan():
+    storage, ops = memory_db()
+    rnd = random.Random(3)
+    alphabet = 'abc de'
+    for _ in range(300):
+        ops.insert_tweet(''.join(rnd.choice(alphabet) for _ in range(20)),
+                         storage)
+    for term in ['a', 'ab', 'abc', 'cab d', 'e a', 'dddd']:
+        expected = [t.id for t in ops.get_all_tweets(storage)
+                    if term in t.tweet]
+        found = [t.id for t in ops.search_tweets(term, None, None, None, None,
+                                                 None, storage)]
+        assert found == expected, term
+
+
+def test_update_nodes_health():
+    storage, ops = memory_db()
+    ops.insert_node('a', 'http://a', storage)
+    ops.insert_node('b', 'http://b', storage)
+    ops.update_nodes_health([('a', 1.0), ('b', None)], 0.5, storage)
+    rows = ops.update_nodes_health([('a', 2.0), ('b', None), ('c', 1.0)],
+                                   0.5, storage)
+    assert [r.name for r in rows] == ['a', 'b']
+    a, b = rows
+    assert (a.latency, a.failures) == (1.5, 0)
+    assert (b.latency, b.failures) == (None, 2)
+    ops.update_nodes_health([('b', 0.1)], 0.5, storage)
+    assert ops.get_node('b', storage).failures == 0
+    updated = ops.update_node('a', 'http://a2', storage)
+    assert (updated.address, updated.latency) == ('http://a2', 1.5)
@@ -89,6 +89,7 @@ def test_create_retweet():
         ({'from_modified': 'foo'}, ('modified_at',), ('foo',)),
         ({'to_modified': 'foo'}, ('modified_at',), ('foo',)),
         ({'retweet': True}, ('type',), ('retweet',)),
+        ({'retweet': False}, ('type',), ('original',)),
         (
             {'content': 'foo', 'retweet': True},
             ('tweet', 'type',),
@@ -127,6 +128,71 @@ def test_count_tweets(type):
     assert_fetch_single(cursor)
 
 
+def test_get_tweets():
+    cursor = MagicMock()
+    db.get_ops().get_tweets([1, 2], cursor)
+    assert_query(cursor, db.TWEET_COLUMN_ORDER, ([1, 2],), 'tweets',
+                 more_query=('ANY(%s)',))
+    assert_fetch_all(cursor)
+
+
+def test_get_tweets_empty():
+    cursor = MagicMock()
+    assert db.get_ops().get_tweets([], cursor) == []
+    assert not cursor.execute.called
+
+
+def test_insert_tweets():
+    cursor = MagicMock()
+    cursor.fetchall.return_value = [(2, 'b'), (1, 'a')]
+    created = db.get_ops().insert_tweets([
+        ('original', 'a', None), ('retweet', None, 'other#1'),
+    ], cursor)
+    assert_query(cursor, db.TWEET_COLUMN_ORDER,
+                 ('original', 'a', 'retweet', 'other#1'), 'tweets',
+                 type_='INSERT', more_query=('(%s, %s, %s), (%s, %s, %s)',))
+    assert created == [(1, 'a'), (2, 'b')]
+
+
+def test_insert_tweets_chunks():
+    from seventweets.db.backends.pg import INSERT_CHUNK_SIZE
+    cursor = MagicMock()
+    cursor.fetchall.return_value = []
+    tweets = [('original', 'a', None)] * (INSERT_CHUNK_SIZE + 1)
+    db.get_ops().insert_tweets(tweets, cursor)
+    assert cursor.execute.call_count == 2
+    assert len(cursor.execute.call_args[0][1]) == 3
+
+
+def test_count_tweets_by_type():
+    cursor = MagicMock()
+    cursor.fetchall.return_value = [('original', 3), ('retweet', 2)]
+    counts = db.get_ops().count_tweets_by_type(cursor)
+    assert_query(cursor, 'count(*)', None, 'tweets', more_query=('GROUP BY',))
+    assert counts == {'original': 3, 'retweet': 2}
+
+
+def test_estimate_tweets_by_type():
+    cursor = MagicMock()
+    cursor.fetchone.return_value = (
+        1000.0, ['original', 'retweet'], [0.75, 0.25],
+    )
+    counts = db.get_ops().estimate_tweets_by_type(cursor)
+    assert_query(cursor, 'reltuples', None, 'pg_class',
+                 more_query=('pg_stats', 'most_common_freqs'))
+    assert counts == {'original': 750, 'retweet': 250}
+
+
+@pytest.mark.parametrize(
+    'row', [None, (-1.0, None, None), (0.0, None, None)],
+    ids=['no-table', 'never-analyzed', 'no-stats'],
+)
+def test_estimate_tweets_by_type_unavailable(row):
+    cursor = MagicMock()
+    cursor.fetchone.return_value = row
+    assert db.get_ops().estimate_tweets_by_type(cursor) is None
+
+
 def test_get_all_nodes():
     cursor = MagicMock()
     db.get_ops().get_all_nodes(cursor)
@@ -144,6 +210,15 @@ def test_insert_node():
     assert_fetch_single(cursor)
 
 
+def test_insert_nodes():
+    cursor = MagicMock()
+    db.get_ops().insert_nodes([('a', 'http://a'), ('b', 'http://b')], cursor)
+    assert cursor.execute.call_count == 1
+    assert_query(cursor, db.NODE_COLUMN_ORDER, ('a', 'http://b'), 'nodes',
+                 'INSERT', ['VALUES (%s, %s), (%s, %s)'])
+    assert_fetch_all(cursor)
+
+
 def test_get_node():
     cursor = MagicMock()
     db.get_ops().get_node('node', cursor)
@@ -161,6 +236,24 @@ def test_update_node():
     assert_fetch_single(cursor)
 
 
+def test_update_nodes_health():
+    cursor = MagicMock()
+    db.get_ops().update_nodes_health([('a', 0.5), ('b', None)], 0.3, cursor)
+    assert cursor.execute.call_count == 1
+    query, params = cursor.execute.call_args[0]
+    assert 'UPDATE nodes' in query
+    assert 'VALUES (%s::varchar, %s::double precision), (%s' in query
+    assert 'RETURNING nodes.name, nodes.address' in query
+    assert params == (0.3, 0.3, 'a', 0.5, 'b', None)
+    assert_fetch_all(cursor)
+
+
+def test_update_nodes_health_empty():
+    cursor = MagicMock()
+    assert db.get_ops().update_nodes_health([], 0.3, cursor) == []
+    assert not cursor.execute.called
+
+
 def test_delete_node():
     cursor = MagicMock()
     cursor.rowcount = 1
@@ -168,3 +261,70 @@ def test_delete_node():
     res = db.get_ops().delete_node(name, cursor)
     assert res is True
     assert_query(cursor, '', (name,), 'nodes', 'DELETE')
+
+
+def test_get_all_tweets_page():
+    cursor = MagicMock()
+    after = ('some date', 12)
+    db.get_ops().get_all_tweets(cursor, limit=20, after=after)
+    assert_query(cursor, db.TWEET_COLUMN_ORDER, ('some date', 12, 20),
+                 'tweets', more_query=('(created_at, id) <', 'LIMIT'))
+    assert_fetch_all(cursor)
+
+
+def test_search_tweets_page():
+    cursor = MagicMock()
+    db.get_ops().search_tweets('foo', None, None, None, None, None, cursor,
+                               limit=5, after=('some date', 3))
+    assert_query(cursor, db.TWEET_COLUMN_ORDER,
+                 ('%foo%', 'some date', 3, 5), 'tweets',
+                 more_query=('tweet ILIKE', '(created_at, id) <', 'LIMIT'))
+    params = cursor.execute.call_args[0][1]
+    assert params[-1] == 5
+
+
+def test_search_tweets_fulltext():
+    cursor = MagicMock()
+    db.get_ops().search_tweets('foo bar', None, None, None, None, None,
+                               cursor, mode=db.SEARCH_FULLTEXT)
+    assert_query(cursor, db.TWEET_COLUMN_ORDER, ('foo bar',), 'tweets',
+                 more_query=('to_tsvector', 'plainto_tsquery'))
+    executed_query = cursor.execute.call_args[0][0]
+    assert 'ILIKE' not in executed_query
+    assert 'ts_rank' not in executed_query
+
+
+def test_search_tweets_relevance():
+    cursor = MagicMock()
+    db.get_ops().search_tweets('foo', None, None, None, None, None, cursor,
+                               limit=10, mode=db.SEARCH_FULLTEXT,
+                               order=db.ORDER_RELEVANCE)
+    assert_query(cursor, db.TWEET_COLUMN_ORDER, ('foo', 10), 'tweets',
+                 more_query=('ts_rank', 'LIMIT'))
+    assert cursor.execute.call_args[0][1] == ('foo', 'foo', 10)
+
+
+def test_search_tweets_relevance_no_keyset():
+    with pytest.raises(ValueError):
+        db.get_ops().search_tweets('foo', None, None, None, None, None,
+                                   MagicMock(), after=('date', 1),
+                                   mode=db.SEARCH_FULLTEXT,
+                                   order=db.ORDER_RELEVANCE)
+
+
+@pytest.mark.parametrize(
+    ('content', 'expected_in_query', 'expected_param'),
+    [
+        ('foo', 'ILIKE', '%foo%'),
+        ('50%', 'ILIKE', '%50\\%%'),
+        ('a_b', 'ILIKE', '%a\\_b%'),
+        ('Ab', 'strpos', 'ab'),
+        ('x', 'strpos', 'x'),
+    ],
+    ids=['plain', 'percent', 'underscore', 'short', 'single-char']
+)
+def test_search_tweets_substring(content, expected_in_query, expected_param):
+    cursor = MagicMock()
+    db.get_ops().search_tweets(content, None, None, None, None, None, cursor)
+    assert_query(cursor, db.TWEET_COLUMN_ORDER, (expected_param,), 'tweets',
+                 more_query=(expected_in_query,))
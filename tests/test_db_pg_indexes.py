@@ -0,0 +1,105 @@
+"""
+Checks that queries built by pg backend are able to use indexes. These tests
+need PostgreSQL server binaries and are skipped if they are not available.
+"""
+import shutil
+import pg8000
+import pytest
+from datetime import datetime, timedelta
+from functools import partial
+from unittest.mock import MagicMock
+from seventweets import db
+from seventweets.migrate import MigrationManager
+
+testing_postgresql = pytest.importorskip('testing.postgresql')
+
+pytestmark = pytest.mark.skipif(
+    shutil.which('initdb') is None and shutil.which('postgres') is None,
+    reason='PostgreSQL server binaries not available.',
+)
+
+
+@pytest.fixture(scope='module')
+def conn():
+    with testing_postgresql.Postgresql() as postgresql:
+        params = postgresql.dsn()
+        conn = pg8000.Connection(
+            user=params['user'], host=params['host'], port=params['port'],
+            database=params['database'], password=None,
+        )
+        cursor = conn.cursor()
+        for migration in MigrationManager.collect_migrations():
+            migration.upgrade(cursor)
+        # 50000 tweets, one every minute, 1% of them retweets
+        cursor.execute('''
+            INSERT INTO tweets
+                (tweet, type, reference, created_at, modified_at)
+            SELECT
+                'tweet ' || i,
+                CASE WHEN mod(i, 100) = 0 THEN 'retweet'
+                     ELSE 'original' END,
+                NULL,
+                timestamp '2017-01-01' + (i || ' minutes')::interval,
+                timestamp '2017-01-01' + (i || ' minutes')::interval
+            FROM generate_series(1, 50000) AS i;
+        ''')
+        conn.commit()
+        cursor.execute('ANALYZE tweets;')
+        conn.commit()
+        cursor.close()
+        yield conn
+        conn.close()
+
+
+def explain(conn, op):
+    """
+    Executes operation with cursor that prefixes query with EXPLAIN and
+    returns resulting plan as single string.
+    """
+    recorder = MagicMock()
+    op(recorder)
+    query, params = recorder.execute.call_args[0]
+    cursor = conn.cursor()
+    try:
+        cursor.execute('EXPLAIN ' + query, params)
+        return '\n'.join(row[0] for row in cursor.fetchall())
+    finally:
+        cursor.close()
+        conn.rollback()
+
+
+def test_list_uses_created_at_index(conn):
+    plan = explain(conn, partial(db.get_ops('pg').get_all_tweets, limit=20))
+    assert 'tweets_created_at_id_idx' in plan
+
+
+def test_keyset_page_uses_created_at_index(conn):
+    after = (datetime(2017, 1, 20), 30000)
+    plan = explain(conn, partial(db.get_ops('pg').get_all_tweets, limit=20,
+                                 after=after))
+    assert 'tweets_created_at_id_idx' in plan
+
+
+def test_created_range_uses_created_at_index(conn):
+    start = datetime(2017, 1, 10)
+    search = partial(db.get_ops('pg').search_tweets, None, start,
+                     start + timedelta(hours=2), None, None, None)
+    assert 'tweets_created_at_id_idx' in explain(conn, search)
+
+
+def test_modified_range_uses_modified_at_index(conn):
+    start = datetime(2017, 1, 10)
+    search = partial(db.get_ops('pg').search_tweets, None, None, None,
+                     start, start + timedelta(hours=2), None)
+    assert 'tweets_modified_at_idx' in explain(conn, search)
+
+
+def test_count_retweets_uses_type_index(conn):
+    count = partial(db.get_ops('pg').count_tweets, 'retweet')
+    assert 'tweets_type_idx' in explain(conn, count)
+
+
+def test_fulltext_search_uses_fts_index(conn):
+    search = partial(db.get_ops('pg').search_tweets, '12345', None, None,
+                     None, None, None, mode=db.SEARCH_FULLTEXT)
+    assert 'tweets_tweet_fts_idx' in explain(conn, search)
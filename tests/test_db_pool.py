@@ -0,0 +1,161 @@
+import time
+import threading
+import pytest
+from unittest.mock import MagicMock
+from seventweets.db.backends.pg import ConnectionPool, Database
+from seventweets.exceptions import ServiceUnavailable
+
+
+def fake_connect():
+    conn = MagicMock()
+    conn.created_at = time.monotonic()
+    conn.last_used_at = conn.created_at
+    conn.ping.return_value = True
+    return conn
+
+
+def test_pool_fills_min_size():
+    pool = ConnectionPool(fake_connect, min_size=3, max_size=5)
+    conn = pool.acquire()
+    assert pool.size == 3
+    assert pool.idle == 2
+    pool.release(conn)
+    assert pool.idle == 3
+
+
+def test_pool_refills_after_failed_connect():
+    attempts = []
+
+    def connect():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise OSError('database unreachable')
+        return fake_connect()
+
+    pool = ConnectionPool(connect, min_size=3, max_size=5)
+    with pytest.raises(OSError):
+        pool.acquire()
+    assert pool.size == 0
+    pool.acquire()
+    assert pool.size == 3
+    assert pool.idle == 2
+
+
+def test_pool_reuses_connections():
+    pool = ConnectionPool(fake_connect, min_size=0, max_size=2)
+    conn = pool.acquire()
+    pool.release(conn)
+    assert pool.acquire() is conn
+    assert pool.size == 1
+
+
+def test_pool_timeout():
+    pool = ConnectionPool(fake_connect, min_size=0, max_size=1, timeout=0.05)
+    pool.acquire()
+    with pytest.raises(ServiceUnavailable):
+        pool.acquire()
+
+
+def test_pool_waits_for_release():
+    pool = ConnectionPool(fake_connect, min_size=0, max_size=1, timeout=2)
+    conn = pool.acquire()
+    timer = threading.Timer(0.05, pool.release, (conn,))
+    timer.start()
+    assert pool.acquire() is conn
+    timer.join()
+
+
+def test_pool_recycles_stale_connections():
+    pool = ConnectionPool(fake_connect, min_size=0, max_size=1, recycle=10)
+    conn = pool.acquire()
+    pool.release(conn)
+    conn.created_at -= 20
+    new_conn = pool.acquire()
+    assert new_conn is not conn
+    assert conn.terminate.called
+    assert pool.size == 1
+
+
+def test_pool_discards_unhealthy_connections():
+    pool = ConnectionPool(fake_connect, min_size=0, max_size=1, ping_after=1)
+    conn = pool.acquire()
+    pool.release(conn)
+    conn.last_used_at -= 5
+    conn.ping.return_value = False
+    assert pool.acquire() is not conn
+    assert conn.terminate.called
+
+
+def test_pool_rolls_back_on_release():
+    pool = ConnectionPool(fake_connect, min_size=0, max_size=1)
+    conn = pool.acquire()
+    pool.release(conn)
+    assert conn.rollback.called
+    assert pool.idle == 1
+
+
+def test_pool_keeps_connection_without_transaction_flag():
+    def connect():
+        conn = fake_connect()
+        del conn.in_transaction
+        return conn
+
+    pool = ConnectionPool(connect, min_size=0, max_size=1)
+    conn = pool.acquire()
+    pool.release(conn)
+    assert conn.rollback.called
+    assert pool.idle == 1
+    assert pool.acquire() is conn
+
+
+def test_pool_discards_failed_connection_on_release():
+    pool = ConnectionPool(fake_connect, min_size=0, max_size=1)
+    conn = pool.acquire()
+    conn.rollback.side_effect = Exception('connection lost')
+    pool.release(conn)
+    assert pool.idle == 0
+    assert pool.size == 0
+
+
+def test_pool_invalid_size():
+    with pytest.raises(ValueError):
+        ConnectionPool(fake_connect, min_size=5, max_size=2)
+
+
+def test_database_returns_connection_on_close():
+    pool = ConnectionPool(fake_connect, min_size=0, max_size=1)
+    database = Database(pool)
+    database.do(lambda cur: cur.execute('SELECT 1'))
+    assert pool.idle == 0
+    database.close()
+    assert pool.idle == 1
+
+
+def test_database_commits_after_each_operation():
+    pool = ConnectionPool(fake_connect, min_size=0, max_size=1)
+    database = Database(pool)
+    database.do(lambda cur: cur.execute('SELECT 1'))
+    assert database.connection.commit.call_count == 1
+
+
+def test_unit_of_work_defers_commit():
+    pool = ConnectionPool(fake_connect, min_size=0, max_size=1)
+    database = Database(pool, unit_of_work=True)
+    database.do(lambda cur: cur.execute('SELECT 1'))
+    database.do(lambda cur: cur.execute('SELECT 2'))
+    conn = database.connection
+    assert not conn.commit.called
+    database.commit()
+    assert conn.commit.call_count == 1
+
+
+def test_unit_of_work_rolls_back_on_error():
+    pool = ConnectionPool(fake_connect, min_size=0, max_size=1)
+    database = Database(pool, unit_of_work=True)
+
+    def fail(cur):
+        raise ValueError('query failed')
+
+    with pytest.raises(ValueError):
+        database.do(fail)
+    assert database.connection.rollback.called
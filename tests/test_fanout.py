@@ -0,0 +1,212 @@
+import time
+import threading
+import pytest
+from concurrent.futures import wait, ALL_COMPLETED
+from unittest.mock import patch, MagicMock
+from seventweets import fanout
+
+
+def node(name):
+    n = MagicMock()
+    n.name = name
+    return n
+
+
+def test_scatter():
+    def call(n):
+        if n.name == 'slow':
+            time.sleep(0.5)
+        if n.name == 'bad':
+            raise ValueError('failed')
+        return n.name.upper()
+
+    nodes = [node('a'), node('slow'), node('bad'), node('b')]
+    start = time.monotonic()
+    results = fanout.scatter(nodes, call, timeout=0.1)
+    assert time.monotonic() - start < 0.4
+    assert [(r.name, r.status, r.value) for r in results] == [
+        ('a', fanout.STATUS_OK, 'A'),
+        ('slow', fanout.STATUS_TIMEOUT, None),
+        ('bad', fanout.STATUS_ERROR, None),
+        ('b', fanout.STATUS_OK, 'B'),
+    ]
+    assert isinstance(results[2].error, ValueError)
+    assert results[1].elapsed >= 0.1
+
+
+def test_scatter_no_nodes():
+    assert fanout.scatter([], MagicMock()) == []
+
+
+@pytest.mark.parametrize(
+    ('nodes', 'expected'), [(0, 4), (3, 6), (100, 64)],
+)
+def test_pool_size(nodes, expected):
+    with patch.multiple(fanout.config, ST_FANOUT_MIN_WORKERS=4,
+                        ST_FANOUT_MAX_WORKERS=64,
+                        ST_FANOUT_WORKERS_PER_NODE=2):
+        assert fanout.pool_size(nodes) == expected
+
+
+def test_executor_grows_with_network():
+    small = fanout.get_executor()
+    assert fanout.get_executor(1) is small
+    bigger = fanout.get_executor(1000)
+    assert bigger is not small
+    assert fanout.get_executor() is bigger
+    assert bigger.submit(lambda: 42).result() == 42
+
+
+def test_scatter_iter_yields_as_completed():
+    def call(n):
+        time.sleep({'slow': 0.2, 'fast': 0.01, 'dead': 1}[n.name])
+        return n.name
+
+    nodes = [node('slow'), node('dead'), node('fast')]
+    results = fanout.scatter_iter(nodes, call, timeout=0.5)
+    assert [(r.name, r.status) for r in results] == [
+        ('fast', fanout.STATUS_OK),
+        ('slow', fanout.STATUS_OK),
+        ('dead', fanout.STATUS_TIMEOUT),
+    ]
+
+
+def test_latency_history():
+    history = fanout.LatencyHistory(size=10)
+    assert history.percentile('a', 90) is None
+    for i in range(20):
+        history.record('a', i)
+    assert history.percentile('a', 50) == 15
+    assert history.percentile('a', 100) == 19
+    assert history.percentile('a', 50, min_samples=11) is None
+
+
+def test_hedge_budget():
+    budget = fanout.HedgeBudget(ratio=0.5, burst=2)
+    assert budget.withdraw()
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw()
+
+
+@pytest.fixture
+def hedging():
+    history = fanout.LatencyHistory()
+    budget = fanout.HedgeBudget(ratio=1, burst=10)
+    with patch.object(fanout, 'latencies', history), \
+            patch.object(fanout, 'hedge_budget', budget), \
+            patch.multiple(fanout.config, ST_HEDGE_MIN_SAMPLES=5,
+                           ST_HEDGE_PERCENTILE=90, ST_HEDGE_BUDGET=1):
+        yield history, budget
+
+
+def test_scatter_hedges_slow_node(hedging):
+    history, _ = hedging
+    for _ in range(5):
+        history.record('a', 0.02)
+    calls = []
+
+    def call(n):
+        calls.append(time.monotonic())
+        # first call is stuck, hedged one is fast
+        if len(calls) == 1:
+            time.sleep(0.5)
+        return 'done'
+
+    start = time.monotonic()
+    before = fanout.stats()
+    [result] = fanout.scatter([node('a')], call, timeout=1, hedge=True)
+    assert result.status == fanout.STATUS_OK
+    assert time.monotonic() - start < 0.3
+    assert len(calls) == 2
+    assert calls[1] - start >= 0.02
+    after = fanout.stats()
+    assert after['hedged'] == before['hedged'] + 1
+    assert after['hedge_wins'] == before['hedge_wins'] + 1
+
+
+def test_scatter_hedge_finishes_with_original(hedging):
+    history, _ = hedging
+    for _ in range(5):
+        history.record('a', 0.01)
+    release = threading.Event()
+    calls = []
+
+    def call(n):
+        calls.append(n)
+        # hedged call releases original one, so both finish together
+        if len(calls) == 2:
+            release.set()
+        release.wait(1)
+        return 'done'
+
+    def wait_all(fs, timeout=None, return_when=None):
+        # both calls are reported as done in the same round
+        return wait(fs, timeout=timeout, return_when=ALL_COMPLETED)
+
+    with patch.object(fanout, 'wait', wait_all):
+        [result] = fanout.scatter([node('a')], call, timeout=1, hedge=True)
+    assert len(calls) == 2
+    assert (result.status, result.value) == (fanout.STATUS_OK, 'done')
+
+
+def test_scatter_hedge_budget_exhausted(hedging):
+    history, budget = hedging
+    budget.ratio = 0
+    while budget.withdraw():
+        pass
+    for _ in range(5):
+        history.record('a', 0.01)
+    call = MagicMock(side_effect=lambda n: time.sleep(0.1))
+    [result] = fanout.scatter([node('a')], call, timeout=1, hedge=True)
+    assert result.status == fanout.STATUS_OK
+    assert call.call_count == 1
+
+
+def test_scatter_no_hedge_without_history(hedging):
+    call = MagicMock(side_effect=lambda n: time.sleep(0.05))
+    fanout.scatter([node('a')], call, timeout=1, hedge=True)
+    assert call.call_count == 1
+
+
+def test_scatter_hedge_failure_waits_for_other(hedging):
+    history, _ = hedging
+    for _ in range(5):
+        history.record('a', 0.01)
+    calls = []
+
+    def call(n):
+        calls.append(1)
+        if len(calls) == 1:
+            time.sleep(0.1)
+            raise ValueError('failed')
+        time.sleep(0.2)
+        return 'done'
+
+    [result] = fanout.scatter([node('a')], call, timeout=1, hedge=True)
+    assert result.status == fanout.STATUS_OK
+    assert result.value == 'done'
+
+
+def test_scatter_skips_unhealthy_nodes():
+    calls = []
+
+    def call(n):
+        calls.append(n.name)
+        return n.name
+
+    down = node('down')
+    down.healthy = False
+    results = fanout.scatter([node('a'), down, node('b')], call, timeout=1)
+    assert sorted(calls) == ['a', 'b']
+    assert [(r.name, r.status) for r in results] == [
+        ('a', fanout.STATUS_OK),
+        ('down', fanout.STATUS_ERROR),
+        ('b', fanout.STATUS_OK),
+    ]
+    assert results[1].elapsed == 0
+    results = fanout.scatter([down], call, timeout=1, skip_unhealthy=False)
+    assert results[0].status == fanout.STATUS_OK
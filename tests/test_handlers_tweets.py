@@ -0,0 +1,190 @@
+import json
+import pytest
+from datetime import datetime
+from unittest.mock import patch
+from seventweets.tweet import Tweet
+
+
+def make_tweets(n):
+    now = datetime(2017, 7, 1)
+    return [Tweet(i, f'tweet {i}', 'original', now, now) for i in range(n)]
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def test_stream_json(client):
+    with patch('seventweets.tweet.stream_all',
+               return_value=iter(make_tweets(3))):
+        resp = client.get('/tweets/?stream=json')
+    assert resp.status_code == 200
+    assert resp.mimetype == 'application/json'
+    assert [t['id'] for t in json.loads(resp.data)] == [0, 1, 2]
+
+
+def test_stream_json_empty(client):
+    with patch('seventweets.tweet.stream_all', return_value=iter([])):
+        resp = client.get('/tweets/?stream=json')
+    assert json.loads(resp.data) == []
+
+
+def test_stream_ndjson(client):
+    with patch('seventweets.tweet.stream_all',
+               return_value=iter(make_tweets(3))):
+        resp = client.get('/tweets/?stream=ndjson')
+    assert resp.mimetype == 'application/x-ndjson'
+    lines = resp.data.decode('utf-8').splitlines()
+    assert [json.loads(l)['tweet'] for l in lines] == [
+        'tweet 0', 'tweet 1', 'tweet 2',
+    ]
+
+
+def test_stream_invalid_format(client):
+    resp = client.get('/tweets/?stream=xml')
+    assert resp.status_code == 400
+
+
+def test_paginated_list(client):
+    with patch('seventweets.tweet.get_all', return_value=make_tweets(2)):
+        resp = client.get('/tweets/?limit=2')
+    assert resp.status_code == 200
+    assert 'X-Next-Cursor' in resp.headers
+
+
+def test_create_batch(client):
+    created = make_tweets(2)
+    with patch('seventweets.tweet.create_many',
+               return_value=created) as create_many:
+        resp = client.post('/tweets/batch', data=json.dumps([
+            {'tweet': 'tweet 0'}, {'server': 'other', 'id': 1},
+        ]))
+    assert resp.status_code == 201
+    body = json.loads(resp.data)
+    assert body['created'] == 2
+    assert [r['id'] for r in body['results']] == [0, 1]
+    assert create_many.call_args[0][0][1] == {'server': 'other', 'id': 1}
+
+
+def test_create_batch_partial(client):
+    from seventweets.exceptions import BadRequest
+    results = [make_tweets(1)[0], BadRequest('too long')]
+    with patch('seventweets.tweet.create_many', return_value=results):
+        resp = client.post('/tweets/batch', data=json.dumps([
+            {'tweet': 'tweet 0'}, {'tweet': 'x' * 200},
+        ]))
+    assert resp.status_code == 207
+    body = json.loads(resp.data)
+    assert body['failed'] == 1
+    assert body['results'][1] == {'status': 400, 'message': 'too long'}
+
+
+@pytest.mark.parametrize('body', [{'tweet': 'x'}, [{}] * 10001])
+def test_create_batch_invalid_body(client, body):
+    resp = client.post('/tweets/batch', data=json.dumps(body))
+    assert resp.status_code == 400
+
+
+def test_get_by_ids(client):
+    with patch('seventweets.tweet.by_ids',
+               return_value=(make_tweets(2), [5])) as by_ids:
+        resp = client.get('/tweets/?ids=0,1,5')
+    assert resp.status_code == 200
+    body = json.loads(resp.data)
+    assert [t['id'] for t in body['tweets']] == [0, 1]
+    assert body['missing'] == [5]
+    by_ids.assert_called_once_with([0, 1, 5])
+
+
+def test_get_by_ids_invalid(client):
+    resp = client.get('/tweets/?ids=1,x')
+    assert resp.status_code == 400
+
+
+def test_invalidate(client):
+    with patch('seventweets.tweet.invalidate_originals') as invalidate, \
+            patch('seventweets.registry.get_node') as get_node:
+        resp = client.post('/tweets/invalidate',
+                           data=json.dumps({'server': 'a', 'ids': [1, 2]}))
+    assert resp.status_code == 204
+    get_node.assert_called_once_with('a')
+    invalidate.assert_called_once_with('a', [1, 2])
+
+
+def test_invalidate_unknown_node(client):
+    with patch('seventweets.tweet.invalidate_originals') as invalidate, \
+            patch('seventweets.registry.get_node', return_value=None):
+        resp = client.post('/tweets/invalidate',
+                           data=json.dumps({'server': 'x', 'ids': [1]}))
+    assert resp.status_code == 403
+    assert not invalidate.called
+
+
+def test_cache_stats(client):
+    resp = client.get('/stats')
+    assert resp.status_code == 200
+    assert 'hits' in json.loads(resp.data)['originals_cache']
+
+
+def test_search_all_reports_nodes(client):
+    from seventweets.fanout import NodeResult
+    node_results = [
+        NodeResult('a', 'ok', [], None, 0.1),
+        NodeResult('b', 'timeout', None, None, 5),
+        NodeResult('c', 'error', None, ValueError(), 0.2),
+    ]
+    with patch('seventweets.tweet.search_all',
+               return_value=(make_tweets(2), node_results)):
+        resp = client.get('/tweets/search?all=true')
+    assert resp.status_code == 200
+    assert [t['id'] for t in json.loads(resp.data)] == [0, 1]
+    assert resp.headers['X-Nodes-Timed-Out'] == 'b'
+    assert resp.headers['X-Nodes-Failed'] == 'c'
+
+
+def search_stream_results():
+    from seventweets.fanout import NodeResult
+    tweets = make_tweets(3)
+    yield NodeResult('own', 'ok', tweets[:1], None, 0.001)
+    yield NodeResult('a', 'ok', tweets[1:], None, 0.1)
+    yield NodeResult('b', 'timeout', None, None, 5)
+
+
+def test_search_stream_ndjson(client):
+    with patch('seventweets.tweet.search_stream',
+               return_value=search_stream_results()) as search_stream:
+        resp = client.get('/tweets/search?all=true&stream=ndjson')
+    assert resp.status_code == 200
+    assert resp.mimetype == 'application/x-ndjson'
+    assert search_stream.call_args[1]['others'] is True
+    frames = [json.loads(l) for l in resp.data.decode('utf-8').splitlines()]
+    assert [(f['event'], f.get('node')) for f in frames] == [
+        ('results', 'own'), ('results', 'a'), ('summary', None),
+    ]
+    assert [t['id'] for t in frames[1]['tweets']] == [1, 2]
+    assert frames[2]['count'] == 3
+    assert [(n['node'], n['status']) for n in frames[2]['nodes']] == [
+        ('own', 'ok'), ('a', 'ok'), ('b', 'timeout'),
+    ]
+
+
+def test_search_stream_sse(client):
+    with patch('seventweets.tweet.search_stream',
+               return_value=search_stream_results()):
+        resp = client.get('/tweets/search?all=true&stream=sse')
+    assert resp.mimetype == 'text/event-stream'
+    events = resp.data.decode('utf-8').split('\n\n')[:-1]
+    assert [e.splitlines()[0] for e in events] == [
+        'event: results', 'event: results', 'event: summary',
+    ]
+    assert json.loads(events[0].splitlines()[1][len('data: '):]) == {
+        'node': 'own', 'tweets': [make_tweets(1)[0].to_dict()],
+    }
+
+
+def test_search_stream_invalid_format(client):
+    with patch('seventweets.tweet.search_stream',
+               return_value=search_stream_results()):
+        resp = client.get('/tweets/search?all=true&stream=xml')
+    assert resp.status_code == 400
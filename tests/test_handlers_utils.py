@@ -0,0 +1,66 @@
+import pytest
+from datetime import datetime
+from werkzeug.datastructures import MultiDict
+from seventweets.exceptions import BadRequest
+from seventweets.handlers.utils import (
+    ensure_dt, ensure_int, ensure_ids, encode_cursor, decode_cursor,
+    page_args,
+)
+from seventweets.tweet import Tweet
+
+
+def test_ensure_int():
+    assert ensure_int(None) is None
+    assert ensure_int('42') == 42
+    with pytest.raises(BadRequest):
+        ensure_int('forty two')
+
+
+def test_ensure_dt():
+    assert ensure_dt(None) is None
+    assert ensure_dt('1500000000') == datetime.fromtimestamp(1500000000)
+    assert ensure_dt('1500000000.5') == datetime.fromtimestamp(1500000000.5)
+    with pytest.raises(BadRequest):
+        ensure_dt('yesterday')
+
+
+def test_ensure_ids():
+    assert ensure_ids(None, 10) is None
+    assert ensure_ids('1, 2,3,', 10) == [1, 2, 3]
+    with pytest.raises(BadRequest):
+        ensure_ids('1,two', 10)
+    with pytest.raises(BadRequest):
+        ensure_ids('1,2,3', 2)
+
+
+@pytest.mark.parametrize(
+    'created_at',
+    [datetime(2017, 7, 1, 12, 30, 15, 123), datetime(2017, 7, 1)],
+    ids=['microseconds', 'whole-seconds'],
+)
+def test_cursor_roundtrip(created_at):
+    t = Tweet(42, 'content', 'original', created_at, created_at)
+    assert decode_cursor(encode_cursor(t)) == (created_at, 42)
+
+
+@pytest.mark.parametrize('cursor', ['garbage', 'Zm9vfGJhcg==', '!!'])
+def test_decode_invalid_cursor(cursor):
+    with pytest.raises(BadRequest):
+        decode_cursor(cursor)
+
+
+def test_page_args():
+    assert page_args(MultiDict()) == (None, None)
+    assert page_args(MultiDict({'limit': '10'})) == (10, None)
+
+    t = Tweet(1, 'content', 'original', datetime(2017, 1, 1),
+              datetime(2017, 1, 1))
+    limit, after = page_args(MultiDict({'cursor': encode_cursor(t)}),
+                             default_limit=50)
+    assert limit == 50
+    assert after == (datetime(2017, 1, 1), 1)
+
+    with pytest.raises(BadRequest):
+        page_args(MultiDict({'limit': '0'}))
+    with pytest.raises(BadRequest):
+        page_args(MultiDict({'limit': '100000'}))
@@ -0,0 +1,96 @@
+import pytest
+from unittest.mock import patch
+from seventweets import registry
+from seventweets.client import Client
+from seventweets.db.backends import memory
+from seventweets.prober import Schedule, Prober
+from seventweets.utils import FileLock
+
+
+def test_schedule_backs_off_healthy_nodes():
+    schedule = Schedule(5, 20)
+    assert schedule.due(['a', 'b'], 0) == ['a', 'b']
+    schedule.record('a', True, 0)
+    assert schedule.due(['a', 'b'], 4) == ['b']
+    assert schedule.due(['a'], 5) == ['a']
+    for expected in (10, 20, 20):
+        schedule.record('a', True, 0)
+        assert schedule.due(['a'], expected - 0.1) == []
+        assert schedule.due(['a'], expected) == ['a']
+    schedule.record('a', False, 0)
+    assert schedule.due(['a'], 5) == ['a']
+
+
+def test_schedule_jitter():
+    schedule = Schedule(10, 60, jitter=0.2, rand=lambda: 1.0)
+    schedule.record('a', True, 0)
+    assert schedule.due(['a'], 11.9) == []
+    assert schedule.due(['a'], 12) == ['a']
+    schedule = Schedule(10, 60, jitter=0.2, rand=lambda: 0.0)
+    schedule.record('a', True, 0)
+    assert schedule.due(['a'], 8) == ['a']
+
+
+def test_schedule_wait_time():
+    schedule = Schedule(5, 60)
+    assert schedule.wait_time(0) == 5
+    schedule.record('a', True, 0)
+    assert schedule.wait_time(2) == 3
+    assert schedule.wait_time(7) == 0
+    schedule.due([], 0)
+    assert schedule.wait_time(0) == 5
+
+
+def test_file_lock(tmp_path):
+    path = str(tmp_path / 'lock')
+    first, second = FileLock(path), FileLock(path)
+    assert first.acquire()
+    assert first.acquire()
+    assert not second.acquire()
+    first.release()
+    assert second.acquire()
+    second.release()
+
+
+@pytest.fixture
+def storage():
+    registry.invalidate()
+    storage = memory.Storage()
+    database = memory.Database(storage=storage)
+    with patch('seventweets.registry.get_db', return_value=database), \
+            patch('seventweets.registry.get_ops',
+                  return_value=memory.Operations), \
+            patch('seventweets.prober.get_db', return_value=database), \
+            patch('seventweets.prober.get_ops',
+                  return_value=memory.Operations):
+        yield storage
+    registry.invalidate()
+
+
+def test_probe(app, storage, tmp_path):
+    ops = memory.Operations
+    ops.insert_node('up', 'http://up', storage)
+    ops.insert_node('down', 'http://down', storage)
+
+    def ping(client):
+        if client.address == 'http://down':
+            raise ConnectionError('refused')
+        return 0.5
+
+    with app.app_context(), \
+            patch('seventweets.config.ST_PROBE_LOCK_FILE',
+                  str(tmp_path / 'lock')), \
+            patch.object(Client, 'ping', ping):
+        prober = Prober(app)
+        for _ in range(2):
+            prober.schedule = Schedule(5, 60)
+            assert 4 < prober.probe() <= 5
+        nodes = {n.name: n for n in registry.get_all()}
+        assert [n.name for n in registry.get_all()] == ['up', 'down']
+
+    assert (nodes['up'].latency, nodes['up'].failures) == (0.5, 0)
+    assert nodes['up'].healthy
+    assert nodes['down'].failures == 2
+    assert not nodes['down'].healthy
+    assert storage.nodes['down'].failures == 2
+    assert storage.nodes['up'].latency == 0.5
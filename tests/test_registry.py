@@ -0,0 +1,138 @@
+import time
+import flask
+import pytest
+from unittest.mock import patch
+from seventweets import db, fanout, registry
+from seventweets.client import Client
+from seventweets.db.backends import memory
+from seventweets.exceptions import BadGateway, Conflict
+
+
+@pytest.fixture
+def database():
+    registry.invalidate()
+    database = memory.Database(storage=memory.Storage())
+    with patch('seventweets.registry.get_db', return_value=database), \
+            patch('seventweets.registry.get_ops',
+                  return_value=memory.Operations):
+        yield database
+    registry.invalidate()
+
+
+def count_loads(database):
+    return patch.object(database, 'do', wraps=database.do)
+
+
+def test_get_all_is_cached(database):
+    registry.add('a', 'http://a')
+    registry.add('b', 'http://b')
+    registry.get_all()
+    with count_loads(database) as do:
+        assert {n.name for n in registry.get_all()} == {'a', 'b'}
+        registry.get_all()
+        assert registry.get_node('a').address == 'http://a'
+    assert do.call_count == 0
+
+
+def test_nodes_keep_clients(database):
+    registry.add('a', 'http://a')
+    client = registry.get_node('a').client
+    registry.add('a', 'http://a', update=True)
+    assert registry.get_all()[0].client is client
+    registry.add('a', 'http://a2', update=True)
+    assert registry.get_node('a').client is not client
+    assert registry.get_node('a').address == 'http://a2'
+
+
+def test_add_conflict(database):
+    registry.add('a', 'http://a')
+    with pytest.raises(Conflict):
+        registry.add('a', 'http://b')
+    assert registry.get_node('a').address == 'http://a'
+
+
+def test_delete(database):
+    registry.add('a', 'http://a')
+    registry.add('b', 'http://b')
+    assert registry.delete('a')
+    assert registry.get_node('a') is None
+    assert registry.delete_all()
+    assert registry.get_all() == []
+
+
+def test_refresh_picks_up_other_processes(database):
+    registry.add('a', 'http://a')
+    node = registry.get_node('a')
+    database.do(lambda storage: memory.Operations.insert_node(
+        'b', 'http://b', storage))
+    assert registry.get_node('b') is None
+    with patch.object(registry.config, 'ST_REGISTRY_REFRESH', -1):
+        assert registry.get_node('b').address == 'http://b'
+        assert registry.get_node('a') is node
+
+
+def test_list_shows_breaker_state(app, database):
+    registry.add('a', 'http://a')
+    with app.test_client() as client:
+        resp = client.get('/registry/')
+    assert resp.status_code == 200
+    node, = resp.get_json()
+    assert node['name'] == 'a'
+    assert node['breaker']['state'] == 'closed'
+
+
+def test_replace_all(database):
+    registry.add('a', 'http://a')
+    registry.add('b', 'http://b')
+    client = registry.get_node('a').client
+    with count_loads(database) as do:
+        assert registry.replace_all([('a', 'http://a'), ('c', 'http://c'),
+                                     ('c', 'http://c')]) == 2
+    assert do.call_count == 1
+    assert sorted(n.name for n in registry.get_all()) == ['a', 'c']
+    assert registry.get_node('a').client is client
+    registry.invalidate()
+    assert sorted(n.name for n in registry.get_all()) == ['a', 'c']
+
+
+def test_unregister_all_tells_all_nodes(database):
+    for name in ('a', 'slow', 'bad', 'b'):
+        registry.add(name, f'http://{name}')
+    told = []
+
+    def unregister(client, name):
+        if client.address == 'http://slow':
+            time.sleep(0.5)
+        if client.address == 'http://bad':
+            raise BadGateway('unreachable')
+        told.append(client.address)
+
+    start = time.monotonic()
+    with patch.object(Client, 'unregister', unregister), \
+            patch.object(registry.config, 'ST_LEAVE_TIMEOUT', 0.1):
+        results = registry.unregister_all(database)
+    assert time.monotonic() - start < 0.4
+    assert sorted(told) == ['http://a', 'http://b']
+    assert {r.name: r.status for r in results} == {
+        'a': fanout.STATUS_OK, 'b': fanout.STATUS_OK,
+        'bad': fanout.STATUS_ERROR, 'slow': fanout.STATUS_TIMEOUT,
+    }
+
+
+def test_cache_changes_only_after_commit(app, database):
+    registry.add('a', 'http://a')
+    registry.add('b', 'http://b')
+    registry.get_all()
+    with app.app_context():
+        flask.g.db = database
+        registry.add('c', 'http://c')
+        registry.delete('a')
+        registry.replace_all([('d', 'http://d')])
+        assert sorted(registry._nodes) == ['a', 'b']
+        db.end_unit_of_work(commit=False)
+        assert sorted(registry._nodes) == ['a', 'b']
+
+        registry.delete('b')
+        assert registry.get_node('b') is not None
+        db.end_unit_of_work(commit=True)
+        assert registry.get_node('b') is None
@@ -0,0 +1,442 @@
+import time
+import threading
+import flask
+import pytest
+from datetime import datetime
+from unittest.mock import patch, MagicMock
+from seventweets import config, db, tweet
+from seventweets.exceptions import BadRequest
+
+
+@pytest.fixture
+def database():
+    tweet._stats_cache.clear()
+    database = MagicMock()
+    database.do.side_effect = lambda fn: fn(MagicMock())
+    with patch('seventweets.tweet.get_db', return_value=database):
+        yield database
+    tweet._stats_cache.clear()
+
+
+def ops(counts=None, estimate=None):
+    ops = MagicMock()
+    ops.count_tweets_by_type.return_value = counts or {}
+    ops.estimate_tweets_by_type.return_value = estimate
+    return patch('seventweets.tweet.get_ops', return_value=ops)
+
+
+def test_stats(database):
+    with ops({'original': 3, 'retweet': 1}) as get_ops:
+        assert tweet.stats() == {'original': 3, 'retweets': 1, 'total': 4}
+        assert tweet.stats()['total'] == 4
+    assert get_ops.return_value.count_tweets_by_type.call_count == 1
+
+
+def test_stats_cleared_on_create(database):
+    with ops({'original': 3}) as get_ops:
+        tweet.stats()
+        get_ops.return_value.insert_tweet.return_value = (
+            1, 'x', 'original', None, None, None,
+        )
+        tweet.create('x')
+        tweet.stats()
+    assert get_ops.return_value.count_tweets_by_type.call_count == 2
+
+
+def test_stats_cleared_after_commit(app):
+    with app.app_context():
+        flask.g.db = MagicMock()
+        flask.g.db.do.side_effect = lambda fn: fn(MagicMock())
+        with ops({'original': 3}) as get_ops, \
+                patch('seventweets.tweet.get_db', return_value=flask.g.db):
+            tweet.stats()
+            get_ops.return_value.insert_tweet.return_value = (
+                1, 'x', 'original', None, None, None,
+            )
+            tweet.create('x')
+            tweet.stats()
+            assert get_ops.return_value.count_tweets_by_type.call_count == 1
+            db.end_unit_of_work(commit=True)
+            assert flask.g.db.commit.called
+            tweet.stats()
+            assert get_ops.return_value.count_tweets_by_type.call_count == 2
+            tweet.create('y')
+            db.end_unit_of_work(commit=False)
+            assert flask.g.db.rollback.called
+            tweet.stats()
+            assert get_ops.return_value.count_tweets_by_type.call_count == 2
+    tweet._stats_cache.clear()
+
+
+def test_stats_approximate(database):
+    with ops({'original': 3}, {'original': 1000}) as get_ops:
+        assert tweet.stats(approximate=True)['total'] == 1000
+        assert tweet.stats()['total'] == 3
+    assert get_ops.return_value.estimate_tweets_by_type.call_count == 1
+
+
+def test_stats_approximate_falls_back_to_exact(database):
+    with ops({'retweet': 2}, None):
+        assert tweet.stats(approximate=True) == {
+            'original': 0, 'retweets': 2, 'total': 2,
+        }
+
+
+def test_create_many(database):
+    with ops() as get_ops:
+        get_ops.return_value.insert_tweets.side_effect = (
+            lambda tweets, cursor: [
+                (i, t[1], t[0], None, None, t[2])
+                for i, t in enumerate(tweets)
+            ]
+        )
+        results = tweet.create_many([
+            {'tweet': 'first'},
+            {'tweet': 'x' * 141},
+            {'server': 'other', 'id': 5},
+            'invalid',
+            {'tweet': None},
+        ])
+    assert get_ops.return_value.insert_tweets.call_count == 1
+    assert results[0].tweet == 'first'
+    assert results[2].reference == 'other#5'
+    assert all(isinstance(r, BadRequest) for r in results[1::2])
+    assert isinstance(results[4], BadRequest)
+
+
+def test_create_many_nothing_valid(database):
+    with ops() as get_ops:
+        results = tweet.create_many([{'foo': 'bar'}])
+    assert not get_ops.return_value.insert_tweets.called
+    assert isinstance(results[0], BadRequest)
+
+
+def test_by_ids(database):
+    with ops() as get_ops:
+        get_ops.return_value.get_tweets.return_value = [
+            (3, 'c', 'original', None, None, None),
+            (1, 'a', 'original', None, None, None),
+        ]
+        found, missing = tweet.by_ids([1, 2, 3, 1])
+    assert get_ops.return_value.get_tweets.call_args[0][0] == [1, 2, 3]
+    assert [t.id for t in found] == [1, 3]
+    assert missing == [2]
+
+
+@pytest.fixture(autouse=True)
+def originals_cache():
+    tweet.originals_cache.clear()
+    tweet.search_cache.clear()
+    yield tweet.originals_cache
+    tweet.originals_cache.clear()
+    tweet.search_cache.clear()
+
+
+def retweet_of(ref, id_=0):
+    return tweet.Tweet(id_, None, 'retweet', None, None, ref)
+
+
+def node(name, get_tweets_by_ids):
+    n = MagicMock()
+    n.name = name
+    n.client.get_tweets_by_ids.side_effect = get_tweets_by_ids
+    return n
+
+
+def originals(ids):
+    return [{'id': int(i), 'tweet': f'original {i}'} for i in ids], []
+
+
+def test_hydrate_groups_by_node():
+    a = node('a', originals)
+    b = node('b', originals)
+    tweets = [retweet_of('a#1'), retweet_of('b#2'), retweet_of('a#3'),
+              retweet_of('a#1'), tweet.Tweet(5, 'own', 'original', None, None)]
+    with patch('seventweets.registry.get_all', return_value=[a, b]) as get_all:
+        tweet.hydrate(tweets, timeout=1)
+    assert get_all.call_count == 1
+    a.client.get_tweets_by_ids.assert_called_once_with(['1', '3'])
+    b.client.get_tweets_by_ids.assert_called_once_with(['2'])
+    assert [t.content for t in tweets] == [
+        'original 1', 'original 2', 'original 3', 'original 1', 'own',
+    ]
+
+
+def test_hydrate_falls_back_on_failures():
+    def slow(ids):
+        time.sleep(0.5)
+        return originals(ids)
+
+    def broken(ids):
+        raise BadRequest('nope')
+
+    nodes = [node('ok', originals), node('slow', slow), node('bad', broken)]
+    tweets = [retweet_of('ok#1'), retweet_of('slow#1'), retweet_of('bad#1'),
+              retweet_of('unknown#1')]
+    start = time.monotonic()
+    with patch('seventweets.registry.get_all', return_value=nodes):
+        tweet.hydrate(tweets, timeout=0.1)
+    assert time.monotonic() - start < 0.4
+    assert [t.tweet for t in tweets] == ['original 1', None, None, None]
+    # failed retweets are not fetched again when serialized
+    with patch('seventweets.registry.get_all') as get_all:
+        assert tweets[1].content is None
+    assert not get_all.called
+
+
+def test_hydrated_chunks():
+    a = node('a', originals)
+    tweets = [retweet_of(f'a#{i}', i) for i in range(5)]
+    with patch('seventweets.registry.get_all', return_value=[a]):
+        result = list(tweet.hydrated(iter(tweets), 2, timeout=1))
+    assert result == tweets
+    assert a.client.get_tweets_by_ids.call_count == 3
+    assert all(t.tweet == f'original {t.id}' for t in result)
+
+
+def test_hydrate_uses_cache(originals_cache):
+    a = node('a', lambda ids: ([{'id': 1, 'tweet': 'original 1'}], ['2']))
+    with patch('seventweets.registry.get_all', return_value=[a]):
+        tweet.hydrate([retweet_of('a#1'), retweet_of('a#2')], timeout=1)
+        tweets = [retweet_of('a#1'), retweet_of('a#2')]
+        tweet.hydrate(tweets, timeout=1)
+    assert a.client.get_tweets_by_ids.call_count == 1
+    assert [t.tweet for t in tweets] == ['original 1', None]
+    assert originals_cache.hits == 2
+
+
+def test_hydrate_refreshes_stale_in_background(originals_cache):
+    refreshed = threading.Event()
+
+    def fetch(ids):
+        refreshed.wait(1)
+        return originals(ids)
+
+    a = node('a', fetch)
+    originals_cache.set('a#1', 'old', ttl=0)
+    originals_cache.stale = 60
+    try:
+        t = retweet_of('a#1')
+        with patch('seventweets.registry.get_all', return_value=[a]):
+            tweet.hydrate([t], timeout=1)
+            # refresh is already running, so it is not requested again
+            tweet.hydrate([retweet_of('a#1')], timeout=1)
+        assert t.tweet == 'old'
+        refreshed.set()
+        for _ in range(100):
+            if originals_cache.get('a#1') is not None:
+                break
+            time.sleep(0.01)
+        assert originals_cache.get('a#1') == 'original 1'
+        assert a.client.get_tweets_by_ids.call_count == 1
+    finally:
+        originals_cache.stale = 0
+
+
+def test_invalidate_originals(originals_cache):
+    originals_cache.set('a#1', 'content')
+    originals_cache.set('a#2', 'content')
+    tweet.invalidate_originals('a', [1])
+    assert originals_cache.get('a#1') is None
+    assert originals_cache.get('a#2') == 'content'
+
+
+def test_modify_notifies_nodes(database):
+    a = node('a', originals)
+    with ops() as get_ops, \
+            patch('seventweets.registry.get_all', return_value=[a]):
+        get_ops.return_value.modify_tweet.return_value = (
+            7, 'new', 'original', None, None, None,
+        )
+        tweet.modify(7, 'new')
+        for _ in range(100):
+            if a.client.invalidate.called:
+                break
+            time.sleep(0.01)
+    a.client.invalidate.assert_called_once_with(config.ST_OWN_NAME, [7])
+
+
+def test_modify_notifies_nodes_after_commit(app):
+    a = node('a', originals)
+    with app.app_context():
+        flask.g.db = MagicMock()
+        flask.g.db.do.side_effect = lambda fn: fn(MagicMock())
+        with ops() as get_ops, \
+                patch('seventweets.tweet.get_db', return_value=flask.g.db), \
+                patch('seventweets.registry.get_all', return_value=[a]), \
+                patch('seventweets.tweet.submit',
+                      side_effect=lambda fn, *args: fn(*args)):
+            get_ops.return_value.modify_tweet.return_value = (
+                7, 'new', 'original', None, None, None,
+            )
+            tweet.modify(7, 'new')
+            db.end_unit_of_work(commit=False)
+            assert not a.client.invalidate.called
+            tweet.modify(7, 'new')
+            assert not a.client.invalidate.called
+            db.end_unit_of_work(commit=True)
+    a.client.invalidate.assert_called_once_with(config.ST_OWN_NAME, [7])
+
+
+def at(minute, id_, origin, type_='original', reference=None):
+    created = datetime(2017, 7, 1, 12, minute)
+    t = tweet.Tweet(id_, f'tweet {id_}', type_, created, created, reference)
+    t.origin = origin
+    return t
+
+
+def test_merge_results_ordered():
+    a = [at(50, 3, 'a'), at(30, 2, 'a'), at(10, 1, 'a')]
+    b = [at(40, 2, 'b'), at(20, 1, 'b')]
+    c = [at(55, 1, 'c')]
+    merged = tweet.merge_results([a, b, c])
+    assert [(t.origin, t.id) for t in merged] == [
+        ('c', 1), ('a', 3), ('b', 2), ('a', 2), ('b', 1), ('a', 1),
+    ]
+
+
+def test_merge_results_limit():
+    a = [at(50 - i, i, 'a') for i in range(10)]
+    b = [at(45 - i, i, 'b') for i in range(10)]
+    merged = tweet.merge_results([a, b], limit=4)
+    assert [(t.origin, t.id) for t in merged] == [
+        ('a', 0), ('a', 1), ('a', 2), ('a', 3),
+    ]
+
+
+def test_merge_results_dedupes():
+    a = [at(50, 1, 'a', 'retweet', 'c#7'), at(40, 2, 'a')]
+    b = [at(45, 1, 'b', 'retweet', 'c#7'), at(40, 2, 'a')]
+    c = [at(10, 7, 'c')]
+    merged = tweet.merge_results([a, b, c])
+    assert [(t.origin, t.id) for t in merged] == [('a', 1), ('a', 2)]
+
+
+def test_merge_results_relevance():
+    a = [at(10, 1, 'a'), at(50, 2, 'a')]
+    b = [at(30, 1, 'b')]
+    merged = tweet.merge_results([a, b], order=db.ORDER_RELEVANCE)
+    assert [(t.origin, t.id) for t in merged] == [
+        ('a', 1), ('b', 1), ('a', 2),
+    ]
+
+
+@pytest.mark.parametrize(
+    'created_at',
+    [datetime(2017, 7, 1, 12, 30, 15, 123), datetime(2017, 7, 1)],
+    ids=['microseconds', 'whole-seconds'],
+)
+def test_from_dict_roundtrip(created_at):
+    t = tweet.Tweet(1, None, 'retweet', created_at, created_at, 'a#1')
+    t.resolved = True
+    t.origin = 'b'
+    parsed = tweet.Tweet.from_dict(t.to_dict())
+    assert parsed.created_at == created_at
+    assert parsed.reference == 'a#1'
+    assert parsed.origin == 'b'
+
+
+def test_search_others_sets_origin():
+    def search(*args, **kwargs):
+        return [at(50, 1, None).to_dict()]
+
+    a = node('a', None)
+    a.client.search.side_effect = search
+    b = node('b', None)
+    b.client.search.side_effect = search
+    with patch('seventweets.registry.get_all', return_value=[a, b]):
+        results, node_results = tweet.search_others('x', limit=10)
+    assert sorted(t.origin for t in results) == ['a', 'b']
+    assert [r.status for r in node_results] == ['ok', 'ok']
+    assert a.client.search.call_args[0][7] == 10
+
+
+def test_search_stream(database):
+    def search(*args, **kwargs):
+        return [at(50, 1, None).to_dict(),
+                at(40, 2, None, 'retweet', 'own#1').to_dict()]
+
+    a = node('a', None)
+    a.client.search.side_effect = search
+    with ops() as get_ops, \
+            patch('seventweets.registry.get_all', return_value=[a]), \
+            patch.object(config, 'ST_OWN_NAME', 'own'):
+        get_ops.return_value.search_tweets.return_value = [
+            (1, 'local', 'original', datetime(2017, 7, 1),
+             datetime(2017, 7, 1), None),
+        ]
+        results = list(tweet.search_stream('x', timeout=1))
+    assert [r.name for r in results] == ['own', 'a']
+    assert [t.id for t in results[0].value] == [1]
+    # retweet of tweet from this node is duplicate of it
+    assert [(t.origin, t.id) for t in results[1].value] == [('a', 1)]
+
+
+def searchable_node(name, address='http://a'):
+    n = node(name, None)
+    n.address = address
+    n.client.search.side_effect = lambda *args, **kwargs: [
+        at(50, 1, None).to_dict(),
+    ]
+    return n
+
+
+def test_search_others_cached():
+    a = searchable_node('a')
+    with patch('seventweets.registry.get_all', return_value=[a]):
+        first, _ = tweet.search_others('Foo', limit=10)
+        second, _ = tweet.search_others('foo', limit=10)
+        tweet.search_others('foo', limit=20)
+    assert [t.id for t in second] == [t.id for t in first] == [1]
+    assert a.client.search.call_count == 2
+
+
+def test_search_others_cache_follows_membership():
+    a = searchable_node('a')
+    b = searchable_node('b', 'http://b')
+    with patch('seventweets.registry.get_all', return_value=[a]):
+        tweet.search_others('foo')
+    with patch('seventweets.registry.get_all', return_value=[a, b]):
+        results, _ = tweet.search_others('foo')
+    assert a.client.search.call_count == 2
+    assert sorted(t.origin for t in results) == ['a', 'b']
+
+
+def test_search_others_partial_not_cached():
+    a = searchable_node('a')
+    a.client.search.side_effect = BadRequest('failed')
+    with patch('seventweets.registry.get_all', return_value=[a]):
+        tweet.search_others('foo')
+        tweet.search_others('foo')
+    assert a.client.search.call_count == 2
+
+
+def test_search_others_coalesced():
+    started = threading.Event()
+    release = threading.Event()
+
+    def search(*args, **kwargs):
+        started.set()
+        release.wait(1)
+        return []
+
+    a = searchable_node('a')
+    a.client.search.side_effect = search
+    results = []
+    with patch('seventweets.registry.get_all', return_value=[a]):
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(tweet.search_others('foo')),
+            )
+            for _ in range(5)
+        ]
+        threads[0].start()
+        started.wait(1)
+        for t in threads[1:]:
+            t.start()
+        time.sleep(0.05)
+        release.set()
+        for t in threads:
+            t.join()
+    assert len(results) == 5
+    assert a.client.search.call_count == 1
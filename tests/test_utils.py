@@ -7,3 +7,29 @@ def test_generate_api_token():
     assert generate_api_token() != generate_api_token()
 
     assert type(generate_api_token()) is str
+
+
+def test_rw_lock_readers_share_writers_exclusive():
+    import threading
+    from seventweets.utils import RWLock
+
+    lock = RWLock()
+    events = []
+
+    with lock.read():
+        # second reader can enter while first one holds the lock
+        with lock.read():
+            events.append('nested read')
+
+    def writer():
+        with lock.write():
+            events.append('write')
+
+    with lock.read():
+        t = threading.Thread(target=writer)
+        t.start()
+        t.join(0.05)
+        # writer is blocked while reader holds the lock
+        assert 'write' not in events
+    t.join()
+    assert events == ['nested read', 'write']